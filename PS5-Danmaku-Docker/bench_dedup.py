@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+去重键性能对比
+对比旧版字符串去重键（f"{ts}_{uid}_{text}"）和当前的64位哈希整数键：
+  - 生成键的耗时
+  - 生成键 + DedupWindow 查询/插入的耗时（未命中 + 命中）
+  - 窗口填满后每条记录占用的内存
+
+使用方法：
+  python bench_dedup.py
+  python bench_dedup.py --count 50000 --size 1000 --text-len 40
+"""
+
+import sys
+
+# 修复 Windows 控制台编码问题
+if sys.platform == 'win32':
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+import argparse
+import logging
+import random
+import time
+import tracemalloc
+
+import danmaku_forward as df
+from bench_pipeline import _danmaku, _gift
+
+
+# ==================== 旧版字符串键 ====================
+def legacy_danmaku_uid(info: list) -> str:
+    ts = info[0][4] if isinstance(info[0], list) and len(info[0]) > 4 else int(time.time()*1000)
+    uid = info[2][0] if len(info) > 2 and isinstance(info[2], list) else 0
+    text = info[1] if len(info) > 1 else ''
+    return f"{ts}_{uid}_{text}"
+
+
+def legacy_gift_uid(data: dict) -> str:
+    return f"{data.get('uid')}_{data.get('giftId')}_{data.get('timestamp')}"
+
+
+# ==================== 测试数据 ====================
+def build_inputs(count: int, text_len: int, seed: int = 1):
+    """生成弹幕 info 和礼物 data；text_len>0 时把弹幕文本补到指定长度（模拟长弹幕）"""
+    rnd = random.Random(seed)
+    infos, gifts = [], []
+    for i in range(count):
+        info = _danmaku(i, rnd)["info"]
+        if text_len > 0:
+            info[1] = (info[1] * (text_len // len(info[1]) + 1))[:text_len]
+        infos.append(info)
+        gifts.append(_gift(i, rnd)["data"])
+    return infos, gifts
+
+
+def bench_keys(key_func, items: list, size: int) -> dict:
+    # 生成键：每次都是新对象（字符串的哈希值尚未缓存），与线上每条消息重新解析JSON一致
+    start = time.perf_counter()
+    for x in items:
+        key_func(x)
+    build_us = (time.perf_counter() - start) / len(items) * 1e6
+
+    # 未命中：生成键 + 插入（超过窗口条数时淘汰最旧记录）
+    window = df.DedupWindow(size)
+    start = time.perf_counter()
+    for x in items:
+        window.seen(key_func(x))
+    miss_us = (time.perf_counter() - start) / len(items) * 1e6
+
+    # 命中：重复到达窗口内最近 size 条消息
+    recent = items[-size:]
+    rounds = max(1, len(items) // size)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for x in recent:
+            window.seen(key_func(x))
+    hit_us = (time.perf_counter() - start) / (rounds * len(recent)) * 1e6
+
+    # 内存：填满一个窗口的内存增量（键 + 时间戳 + 有序字典节点）
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    window = df.DedupWindow(size)
+    for x in items[:size]:
+        window.seen(key_func(x))
+    mem = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+
+    return {"build_us": build_us, "miss_us": miss_us, "hit_us": hit_us,
+            "bytes_per_entry": mem / size}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="去重键性能对比")
+    parser.add_argument("--count", type=int, default=50000, help="消息条数")
+    parser.add_argument("--size", type=int, default=df.CONFIG["MAX_SEEN_DANMAKU"], help="去重窗口条数")
+    parser.add_argument("--text-len", type=int, default=0, help="弹幕文本长度，0=使用样例短弹幕")
+    args = parser.parse_args()
+
+    df.logger.setLevel(logging.WARNING)
+    client = df.BiliLiveClient(0, df.IRCServer())
+    infos, gifts = build_inputs(args.count, args.text_len)
+
+    cases = [
+        ("弹幕", "字符串", legacy_danmaku_uid, infos),
+        ("弹幕", "哈希", client._danmaku_uid, infos),
+        ("礼物", "字符串", legacy_gift_uid, gifts),
+        ("礼物", "哈希", client._gift_uid, gifts),
+    ]
+    print("=" * 72)
+    print(f"消息: {args.count}  |  窗口: {args.size}  |  弹幕长度: {args.text_len or '样例'}")
+    print("=" * 72)
+    print(f"{'类型':<6}{'键':<8}{'生成 µs':>10}{'未命中 µs':>12}{'命中 µs':>10}{'内存 B/条':>12}")
+    for kind, name, func, items in cases:
+        r = bench_keys(func, items, args.size)
+        print(f"{kind:<6}{name:<8}{r['build_us']:>10.3f}{r['miss_us']:>12.3f}"
+              f"{r['hit_us']:>10.3f}{r['bytes_per_entry']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
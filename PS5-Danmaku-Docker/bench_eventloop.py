@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+事件循环性能对比（asyncio / uvloop）
+在同一份负载下分别用每种事件循环测量：
+  - 解码：BiliLiveClient._process_ws_data 处理全部帧的吞吐（消息/秒，不经过IRC）
+  - 转发：启动本地IRC服务并连入 N 个IRC客户端，从送入第一帧到最后一行PRIVMSG到达的吞吐（行/秒）
+负载默认由 bench_pipeline 生成，也可以用 --capture 回放录制文件（WS_CAPTURE_FILE 录下的帧）
+未安装 uvloop 时只测 asyncio
+
+使用方法：
+  python bench_eventloop.py
+  python bench_eventloop.py --clients 4 --repeat 5
+  python bench_eventloop.py --capture capture.bin
+"""
+
+import sys
+
+# 修复 Windows 控制台编码问题
+if sys.platform == 'win32':
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+import danmaku_forward as df
+from bench_pipeline import build_messages, build_frames, _reset_state
+from replay_capture import IRCRecorder, wait_irc_ready
+
+
+def available_loops() -> dict:
+    """可用的事件循环：名称 -> 创建函数"""
+    if sys.platform == 'win32':
+        loops = {"asyncio": asyncio.SelectorEventLoop}
+    else:
+        loops = {"asyncio": asyncio.new_event_loop}
+    try:
+        import uvloop
+        loops[f"uvloop {uvloop.__version__}"] = uvloop.new_event_loop
+    except ImportError:
+        print("未安装 uvloop（pip install uvloop），只测 asyncio")
+    return loops
+
+
+def load_frames(args) -> list:
+    if args.capture:
+        return [data for _ts, data in df.iter_ws_capture(args.capture)]
+    messages = build_messages(args.danmaku, args.gift, args.combo, args.sc, args.noise)
+    return build_frames(messages, df.WS_VER_BROTLI, args.per_frame)
+
+
+# ==================== 测量 ====================
+async def bench_decode(frames: list) -> float:
+    """只测解码+处理，事件放进足够大的队列里不消费"""
+    _reset_state()
+    irc = df.IRCServer()
+    irc.queue.configure(maxsize=10 ** 9, policy="block")
+    client = df.BiliLiveClient(732, irc)
+    start = time.perf_counter()
+    for frame in frames:
+        await client._process_ws_data(frame)
+    elapsed = time.perf_counter() - start
+    return irc.queue.snapshot()["enqueued"] / elapsed
+
+
+async def bench_forward(frames: list, clients: int, port: int) -> tuple:
+    """完整链路：解码 -> 事件队列 -> IRC写入 -> N 个客户端收到，返回 (行/秒, 总行数)"""
+    _reset_state()
+    df.IRC_RUNNING = False
+    df.CONFIG["IRC_HOST"] = "127.0.0.1"
+    df.CONFIG["IRC_PORT"] = port
+    irc = df.IRCServer()
+    irc.queue.configure(policy="block")
+    client = df.BiliLiveClient(732, irc)
+    irc_task = asyncio.create_task(irc.start())
+    await wait_irc_ready(irc)
+
+    recorders = [IRCRecorder("127.0.0.1", port) for _ in range(clients)]
+    for r in recorders:
+        await r.start()
+    await asyncio.sleep(0.3)  # 等待 NICK/JOIN 完成
+
+    start = time.monotonic()
+    for frame in frames:
+        await client._process_ws_data(frame)
+    for r in recorders:
+        await r.wait_idle()
+    lines = sum(len(r.lines) for r in recorders)
+    last = max((r.last_recv for r in recorders if r.lines), default=time.monotonic())
+
+    for r in recorders:
+        await r.close()
+    await asyncio.sleep(0.2)  # 让服务端的客户端处理任务读到 EOF 后自行退出
+    irc_task.cancel()
+    return lines / max(last - start, 1e-9), lines
+
+
+def run_loop(name: str, factory, frames: list, args, port: int) -> dict:
+    decode, forward = [], []
+    lines = 0
+    with asyncio.Runner(loop_factory=factory) as runner:
+        for i in range(args.repeat):
+            decode.append(runner.run(bench_decode(frames)))
+            rate, lines = runner.run(bench_forward(frames, args.clients, port + i))
+            forward.append(rate)
+    return {"loop": name, "decode": statistics.median(decode),
+            "forward": statistics.median(forward), "lines": lines}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="事件循环性能对比（asyncio / uvloop）")
+    parser.add_argument("--capture", default="", help="回放录制文件，留空则生成负载")
+    parser.add_argument("--danmaku", type=int, default=5000, help="弹幕条数")
+    parser.add_argument("--gift", type=int, default=800, help="礼物条数")
+    parser.add_argument("--combo", type=int, default=200, help="连击条数")
+    parser.add_argument("--sc", type=int, default=50, help="醒目留言条数")
+    parser.add_argument("--noise", type=int, default=2000, help="无关命令条数")
+    parser.add_argument("--per-frame", type=int, default=40, help="每帧消息数")
+    parser.add_argument("--clients", type=int, default=2, help="连入IRC服务的客户端数")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数（取中位数）")
+    parser.add_argument("--port", type=int, default=16700, help="IRC服务起始端口（每轮递增）")
+    args = parser.parse_args()
+
+    df.logger.setLevel(logging.WARNING)
+    df.CONFIG["SPAM_AGGREGATE_MS"] = 0     # 测原始转发量，不做刷屏合并
+    frames = load_frames(args)
+    loops = available_loops()
+
+    print("=" * 72)
+    print(f"帧: {len(frames)}  |  IRC客户端: {args.clients}  |  重复: {args.repeat}  |  "
+          f"JSON 后端: {df.JSON_BACKEND}")
+    print("=" * 72)
+    print(f"{'事件循环':<20}{'解码 条/秒':>14}{'转发 行/秒':>14}{'转发行数':>10}")
+    results = []
+    for i, (name, factory) in enumerate(loops.items()):
+        r = run_loop(name, factory, frames, args, args.port + i * args.repeat)
+        results.append(r)
+        print(f"{name:<20}{r['decode']:>14,.0f}{r['forward']:>14,.0f}{r['lines']:>10}")
+    if len(results) > 1:
+        base = results[0]
+        for r in results[1:]:
+            print(f"{r['loop']} 相对 {base['loop']}: 解码 x{r['decode'] / base['decode']:.2f}  "
+                  f"转发 x{r['forward'] / base['forward']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+JSON 后端性能对比
+对比 标准库json / ujson / orjson 在B站消息解码和 /status 响应序列化上的耗时
+
+使用方法：
+  python bench_json.py                         # 使用内置的样例消息
+  python bench_json.py --payloads msgs.jsonl   # 使用抓取的消息（每行一条原始JSON）
+  python bench_json.py --capture capture.bin   # 使用 WS_CAPTURE_FILE 录制的原始帧
+  python bench_json.py --rounds 20000
+未安装的后端会自动跳过
+"""
+
+import sys
+import os
+
+# 修复 Windows 控制台编码问题
+if sys.platform == 'win32':
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+import argparse
+import json
+import time
+
+# ==================== 样例消息 ====================
+SAMPLE_MESSAGES = [
+    {"cmd": "DANMU_MSG", "info": [
+        [0, 1, 25, 16777215, 1700000000000, 1700000000, 0, "a1b2c3d4", 0, 0, 0, "", 0, "{}", "{}",
+         {"mode": 0, "show_player_type": 0, "extra": "{\"send_from_me\":false,\"mode\":0,\"color\":16777215}"}],
+        "主播好厉害！666", [12345678, "路过的观众", 0, 0, 0, 10000, 1, ""],
+        [21, "粉丝牌", "主播名", 732, 6067854, "", 0, 6067854, 6067854, 6067854, 0, 1, 0],
+        [12, 0, 6406234, ">50000", 0], ["", ""], 0, 0, None,
+        {"ts": 1700000000, "ct": "ABCDEF12"}, 0, 0, None, None, 0, 105]},
+    {"cmd": "SEND_GIFT", "data": {
+        "action": "投喂", "batch_combo_id": "batch:gift:combo_id:12345678:732:31036:1700000000.1234",
+        "coin_type": "gold", "giftId": 31036, "giftName": "小花花", "num": 1, "price": 100,
+        "timestamp": 1700000000, "total_coin": 100, "uid": 12345678, "uname": "送礼的观众",
+        "face": "https://i0.hdslb.com/bfs/face/member/noface.jpg",
+        "medal_info": {"medal_level": 21, "medal_name": "粉丝牌", "target_id": 6067854}}},
+    {"cmd": "INTERACT_WORD", "data": {
+        "uid": 87654321, "uname": "进场的观众", "msg_type": 1, "roomid": 732,
+        "timestamp": 1700000000, "score": 1700000000000,
+        "fans_medal": {"medal_level": 0, "medal_name": "", "target_id": 0}}},
+    {"cmd": "SUPER_CHAT_MESSAGE", "data": {
+        "id": 9876543, "uid": 12345678, "price": 30, "message": "加油！这把一定能赢",
+        "start_time": 1700000000, "end_time": 1700000060, "time": 60,
+        "user_info": {"uname": "SC观众", "face": "https://i0.hdslb.com/bfs/face/member/noface.jpg",
+                      "guard_level": 3}}},
+    {"cmd": "ONLINE_RANK_COUNT", "data": {"count": 4321, "online_count": 12345}},
+]
+
+
+def load_payloads(path: str) -> list:
+    """从JSONL文件加载原始消息字节"""
+    payloads = []
+    with open(path, 'rb') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                payloads.append(line)
+    return payloads
+
+
+def load_capture_payloads(path: str) -> list:
+    """从WebSocket录制文件中提取所有消息包（op=5）的JSON字节"""
+    import danmaku_forward as df
+    decoder = df.WSFrameDecoder()
+    payloads = []
+    for _ts, frame in df.iter_ws_capture(path):
+        for op, _ver, body in decoder.iter_packets(frame):
+            if op == df.WS_OP_MESSAGE and body:
+                payloads.append(bytes(body))
+    return payloads
+
+
+def build_status_payload(n: int = 1000) -> dict:
+    """模拟 /status 的响应体（n 条弹幕+礼物记录）"""
+    danmaku = [{"type": "danmaku", "user": f"观众{i}", "text": f"弹幕内容{i} 666",
+                "time": "12:34:56", "ts": 1700000000000 + i} for i in range(n // 2)]
+    gifts = [{"type": "gift", "user": f"观众{i}", "name": "小花花", "num": 1, "coin": "电池",
+              "price": 100, "time": "12:34:56", "ts": 1700000000000 + i} for i in range(n // 2)]
+    return {"irc_running": True, "ws_running": True, "active_clients": 1,
+            "danmaku_count": n // 2, "gift_count": n // 2,
+            "recent_danmaku": danmaku, "recent_gift": gifts}
+
+
+def available_backends() -> dict:
+    """返回 {名称: (loads, dumps)}，dumps 输出 bytes"""
+    backends = {
+        "json": (lambda b: json.loads(b.decode('utf-8')),
+                 lambda o: json.dumps(o, ensure_ascii=False, separators=(',', ':')).encode('utf-8')),
+    }
+    try:
+        import ujson
+        backends["ujson"] = (ujson.loads,
+                             lambda o: ujson.dumps(o, ensure_ascii=False).encode('utf-8'))
+    except ImportError:
+        pass
+    try:
+        import orjson
+        backends["orjson"] = (orjson.loads, orjson.dumps)
+    except ImportError:
+        pass
+    return backends
+
+
+def bench(func, items, rounds: int) -> float:
+    """返回每次调用的平均耗时（微秒）"""
+    n = len(items)
+    start = time.perf_counter()
+    for i in range(rounds):
+        func(items[i % n])
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON 后端性能对比")
+    parser.add_argument("--payloads", help="JSONL文件，每行一条B站原始消息")
+    parser.add_argument("--capture", help="WebSocket原始帧录制文件")
+    parser.add_argument("--rounds", type=int, default=50000, help="消息解码轮数")
+    parser.add_argument("--status-rounds", type=int, default=200, help="/status 序列化轮数")
+    args = parser.parse_args()
+
+    if args.capture:
+        payloads = load_capture_payloads(args.capture)
+        source = args.capture
+    elif args.payloads:
+        payloads = load_payloads(args.payloads)
+        source = args.payloads
+    else:
+        payloads = [json.dumps(m, ensure_ascii=False).encode('utf-8') for m in SAMPLE_MESSAGES]
+        source = "内置样例"
+    if not payloads:
+        print("没有可用的消息")
+        return
+    status = [build_status_payload()]
+
+    print("=" * 60)
+    print(f"消息来源: {source} ({len(payloads)} 条)")
+    print(f"解码轮数: {args.rounds}  |  /status 序列化轮数: {args.status_rounds}")
+    print("=" * 60)
+    print(f"{'后端':<10}{'解码 µs/条':>14}{'/status µs/次':>18}")
+    results = {}
+    for name, (loads, dumps) in available_backends().items():
+        dec = bench(loads, payloads, args.rounds)
+        enc = bench(dumps, status, args.status_rounds)
+        results[name] = (dec, enc)
+        print(f"{name:<10}{dec:>14.2f}{enc:>18.1f}")
+
+    base_dec, base_enc = results["json"]
+    print("-" * 60)
+    for name, (dec, enc) in results.items():
+        if name != "json":
+            print(f"{name}: 解码快 {base_dec / dec:.1f}x，/status 序列化快 {base_enc / enc:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+解码流水线性能基准
+用 pack_ws_message + zlib/brotli 合成真实结构的 ver=0/2/3 弹幕礼物高峰数据，
+分别测量两条流水线的端到端耗时：
+  legacy : unpack_ws_messages -> decode_ws_body -> _handle_message
+  client : BiliLiveClient._process_ws_data（线上实际使用的路径）
+输出 消息/秒、µs/消息、每条消息的内存分配量，并保存为JSON，便于不同版本之间对比
+
+使用方法：
+  python bench_pipeline.py
+  python bench_pipeline.py --danmaku 20000 --gift 5000 --combo 1000 --sc 200 --per-frame 40
+  python bench_pipeline.py --out new.json --compare old.json
+"""
+
+import sys
+import os
+
+# 修复 Windows 控制台编码问题
+if sys.platform == 'win32':
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+import zlib
+from datetime import datetime
+
+import danmaku_forward as df
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PIPELINES = ("legacy", "client")
+
+_WORDS = ["666", "主播好强", "哈哈哈哈", "前方高能", "来了来了", "这波可以", "？？？", "下次一定",
+          "好耶", "awsl", "太秀了", "晚上好", "打卡", "这是什么操作", "泪目"]
+_GIFTS = [(31036, "小花花", "gold", 100), (31039, "牛哇牛哇", "gold", 100),
+          (1, "辣条", "silver", 100), (31164, "粉丝团灯牌", "gold", 100), (30607, "小心心", "silver", 0)]
+
+
+# ==================== 合成数据 ====================
+def _danmaku(i: int, rnd: random.Random) -> dict:
+    uid = rnd.randint(10000, 99999999)
+    ts = 1700000000000 + i
+    return {"cmd": "DANMU_MSG", "info": [
+        [0, 1, 25, 16777215, ts, 1700000000 + i // 1000, 0, f"{rnd.getrandbits(32):08x}", 0, 0, 0, "", 0,
+         "{}", "{}", {"mode": 0, "show_player_type": 0,
+                      "extra": "{\"send_from_me\":false,\"mode\":0,\"color\":16777215,\"font_size\":25}"}],
+        rnd.choice(_WORDS), [uid, f"观众{uid}", 0, 0, 0, 10000, 1, ""],
+        [rnd.randint(1, 30), "粉丝牌", "主播", 732, 6067854, "", 0, 6067854, 6067854, 6067854, 0, 1, 0],
+        [rnd.randint(1, 60), 0, 6406234, ">50000", 0], ["", ""], 0, 0, None,
+        {"ts": 1700000000 + i // 1000, "ct": f"{rnd.getrandbits(32):08X}"}, 0, 0, None, None, 0, 105]}
+
+
+def _gift(i: int, rnd: random.Random) -> dict:
+    gift_id, name, coin, price = rnd.choice(_GIFTS)
+    uid = rnd.randint(10000, 99999999)
+    num = rnd.choice([1, 1, 1, 5, 10])
+    return {"cmd": "SEND_GIFT", "data": {
+        "action": "投喂", "batch_combo_id": f"batch:gift:combo_id:{uid}:732:{gift_id}:{1700000000 + i}.{i}",
+        "coin_type": coin, "giftId": gift_id, "giftName": name, "num": num, "price": price,
+        "timestamp": 1700000000 + i, "total_coin": price * num, "uid": uid, "uname": f"观众{uid}",
+        "face": "https://i0.hdslb.com/bfs/face/member/noface.jpg",
+        "medal_info": {"medal_level": rnd.randint(0, 30), "medal_name": "粉丝牌", "target_id": 6067854}}}
+
+
+def _combo(i: int, rnd: random.Random) -> dict:
+    gift_id, name, coin, price = rnd.choice(_GIFTS)
+    uid = rnd.randint(10000, 99999999)
+    return {"cmd": "COMBO_SEND", "data": {
+        "action": "投喂", "batch_combo_id": f"batch:gift:combo_id:{uid}:732:{gift_id}:{1700000000 + i}.{i}",
+        "batch_combo_num": rnd.randint(1, 50), "coin_type": coin, "combo_num": rnd.randint(2, 99),
+        "gift_id": gift_id, "gift_name": name, "total_num": rnd.randint(2, 99), "uid": uid,
+        "uname": f"观众{uid}", "r_uid": 6067854, "runame": "主播"}}
+
+
+def _super_chat(i: int, rnd: random.Random) -> dict:
+    uid = rnd.randint(10000, 99999999)
+    return {"cmd": "SUPER_CHAT_MESSAGE", "data": {
+        "id": 9000000 + i, "uid": uid, "price": rnd.choice([30, 50, 100, 500]),
+        "message": f"醒目留言{i}：{rnd.choice(_WORDS)}", "start_time": 1700000000 + i,
+        "end_time": 1700000060 + i, "time": 60,
+        "user_info": {"uname": f"观众{uid}", "face": "https://i0.hdslb.com/bfs/face/member/noface.jpg",
+                      "guard_level": rnd.choice([0, 3])}}}
+
+
+def _noise(i: int, rnd: random.Random) -> dict:
+    cmd = rnd.choice(["INTERACT_WORD", "ONLINE_RANK_COUNT", "WATCHED_CHANGE", "STOP_LIVE_ROOM_LIST"])
+    uid = rnd.randint(10000, 99999999)
+    return {"cmd": cmd, "data": {"uid": uid, "uname": f"观众{uid}", "msg_type": 1, "roomid": 732,
+                                 "timestamp": 1700000000 + i, "count": rnd.randint(1, 100000)}}
+
+
+def build_messages(danmaku: int, gift: int, combo: int, sc: int, noise: int = 0, seed: int = 1) -> list:
+    """按数量生成B站消息（固定随机种子，结果可复现），顺序随机打乱"""
+    rnd = random.Random(seed)
+    messages = []
+    for builder, count in ((_danmaku, danmaku), (_gift, gift), (_combo, combo),
+                           (_super_chat, sc), (_noise, noise)):
+        messages.extend(builder(i, rnd) for i in range(count))
+    rnd.shuffle(messages)
+    return messages
+
+
+def build_frames(messages: list, ver: int, per_frame: int) -> list:
+    """把消息按每帧 per_frame 条打包成WebSocket帧，ver=2/3 时整帧压缩"""
+    frames = []
+    for i in range(0, len(messages), per_frame):
+        chunk = b"".join(
+            df.pack_ws_message(df.WS_OP_MESSAGE, json.dumps(m, ensure_ascii=False).encode('utf-8'))
+            for m in messages[i:i + per_frame]
+        )
+        if ver == df.WS_VER_ZLIB:
+            chunk = df.pack_ws_message(df.WS_OP_MESSAGE, zlib.compress(chunk), df.WS_VER_ZLIB)
+        elif ver == df.WS_VER_BROTLI:
+            chunk = df.pack_ws_message(df.WS_OP_MESSAGE, brotli.compress(chunk), df.WS_VER_BROTLI)
+        frames.append(chunk)
+    return frames
+
+
+# ==================== 测量 ====================
+def _reset_state():
+    df.recent_danmaku_log.clear()
+    df.recent_gift_log.clear()
+    df.DANMAKU_COUNT = df.GIFT_COUNT = df.GUARD_COUNT = df.SC_COUNT = 0
+
+
+async def _run_legacy(client, frames):
+    for frame in frames:
+        for _op, ver, body in df.unpack_ws_messages(frame):
+            for j in df.decode_ws_body(ver, body):
+                cmd = j.get("cmd", "")
+                if cmd:
+                    await client._handle_message(cmd, j)
+
+
+async def _run_client(client, frames):
+    for frame in frames:
+        await client._process_ws_data(frame)
+
+
+async def _measure(pipeline: str, frames: list, trace: bool) -> float:
+    _reset_state()
+    irc = df.IRCServer()
+    # 没有IRC服务消费事件队列：放大且不丢弃，避免队列满后的淘汰扫描计入 client 的耗时
+    irc.queue.configure(maxsize=10 ** 9, policy="block")
+    client = df.BiliLiveClient(732, irc)
+    runner = _run_legacy if pipeline == "legacy" else _run_client
+    if trace:
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        await runner(client, frames)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak - base
+    start = time.perf_counter()
+    await runner(client, frames)
+    return time.perf_counter() - start
+
+
+def run_case(pipeline: str, ver: int, frames: list, messages: int, repeat: int) -> dict:
+    best = min(asyncio.run(_measure(pipeline, frames, False)) for _ in range(repeat))
+    peak = asyncio.run(_measure(pipeline, frames, True))
+    return {
+        "pipeline": pipeline,
+        "ver": ver,
+        "frames": len(frames),
+        "messages": messages,
+        "seconds": round(best, 6),
+        "msgs_per_sec": round(messages / best, 1),
+        "us_per_msg": round(best / messages * 1e6, 3),
+        # tracemalloc 统计的峰值内存增量 / 消息数
+        "alloc_bytes_per_msg": round(peak / messages, 1),
+    }
+
+
+def _git_rev() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return ""
+
+
+def print_compare(results: list, old_path: str):
+    with open(old_path, 'r', encoding='utf-8') as f:
+        old = json.load(f)
+    old_map = {(r["pipeline"], r["ver"]): r for r in old.get("results", [])}
+    print("-" * 72)
+    print(f"对比 {old_path} (rev {old.get('meta', {}).get('git_rev', '?')})")
+    for r in results:
+        o = old_map.get((r["pipeline"], r["ver"]))
+        if not o:
+            continue
+        speed = r["msgs_per_sec"] / o["msgs_per_sec"] if o["msgs_per_sec"] else 0
+        print(f"  {r['pipeline']:<7} ver={r['ver']}  吞吐 {speed:.2f}x  "
+              f"µs/消息 {o['us_per_msg']} -> {r['us_per_msg']}  "
+              f"分配 {o['alloc_bytes_per_msg']} -> {r['alloc_bytes_per_msg']} B/消息")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="B站消息解码流水线基准")
+    parser.add_argument("--danmaku", type=int, default=8000, help="DANMU_MSG 数量")
+    parser.add_argument("--gift", type=int, default=2000, help="SEND_GIFT 数量")
+    parser.add_argument("--combo", type=int, default=500, help="COMBO_SEND 数量")
+    parser.add_argument("--sc", type=int, default=100, help="SUPER_CHAT_MESSAGE 数量")
+    parser.add_argument("--noise", type=int, default=0, help="无处理函数的命令数量（INTERACT_WORD 等）")
+    parser.add_argument("--per-frame", type=int, default=40, help="每帧包含的消息数")
+    parser.add_argument("--vers", default="0,2,3", help="要测试的协议版本")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数（取最快）")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="结果JSON路径（默认 bench_results/pipeline_<时间>.json）")
+    parser.add_argument("--compare", help="与之前保存的结果JSON对比")
+    args = parser.parse_args()
+
+    df.logger.setLevel(logging.WARNING)
+    df.CONFIG["SPAM_AGGREGATE_MS"] = 0     # 测原始转发量，不做刷屏合并
+    messages = build_messages(args.danmaku, args.gift, args.combo, args.sc, args.noise, args.seed)
+    vers = [int(v) for v in args.vers.split(",") if v.strip()]
+    if brotli is None and df.WS_VER_BROTLI in vers:
+        print("brotli 未安装，跳过 ver=3")
+        vers.remove(df.WS_VER_BROTLI)
+
+    print("=" * 72)
+    print(f"消息: {len(messages)} 条 (弹幕 {args.danmaku} / 礼物 {args.gift} / 连击 {args.combo}"
+          f" / SC {args.sc} / 其他 {args.noise})  每帧 {args.per_frame} 条  JSON 后端: {df.JSON_BACKEND}")
+    print("=" * 72)
+    print(f"{'流水线':<8}{'ver':>4}{'消息/秒':>14}{'µs/消息':>12}{'分配 B/消息':>14}")
+    results = []
+    for ver in vers:
+        frames = build_frames(messages, ver, args.per_frame)
+        for pipeline in PIPELINES:
+            r = run_case(pipeline, ver, frames, len(messages), args.repeat)
+            results.append(r)
+            print(f"{pipeline:<8}{ver:>4}{r['msgs_per_sec']:>14.0f}{r['us_per_msg']:>12.2f}"
+                  f"{r['alloc_bytes_per_msg']:>14.1f}")
+
+    report = {
+        "meta": {
+            "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "git_rev": _git_rev(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "json_backend": df.JSON_BACKEND,
+            "params": vars(args),
+        },
+        "results": results,
+    }
+    out = args.out or os.path.join(BASE_DIR, "bench_results",
+                                   f"pipeline_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存: {out}")
+
+    if args.compare:
+        print_compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
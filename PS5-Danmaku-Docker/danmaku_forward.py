@@ -33,10 +33,15 @@ import threading
 import random
 import io
 import base64
+import contextlib
+import contextvars
 import hashlib
+import re
+import ssl
+import unicodedata
 import urllib.parse
 from typing import Dict, Set
-from collections import deque
+from collections import deque, Counter, OrderedDict
 from datetime import datetime
 
 import warnings
@@ -45,6 +50,7 @@ warnings.filterwarnings('ignore')
 import requests
 import aiohttp
 from flask import Flask, jsonify, request, render_template_string
+from flask.json.provider import DefaultJSONProvider
 
 try:
     import qrcode
@@ -52,6 +58,75 @@ try:
 except ImportError:
     HAS_QRCODE = False
 
+# ==================== JSON 后端 ====================
+# 可选的高性能JSON库：orjson > ujson > 标准库json（均未安装时回退标准库）
+try:
+    import orjson
+    JSON_BACKEND = "orjson"
+except ImportError:
+    orjson = None
+    try:
+        import ujson
+        JSON_BACKEND = "ujson"
+    except ImportError:
+        ujson = None
+        JSON_BACKEND = "json"
+
+if JSON_BACKEND == "orjson":
+    def json_loads(data):
+        """解析JSON（接受 str / bytes / memoryview）"""
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # 非法UTF-8时与标准库行为保持一致：忽略坏字节后重试
+            if isinstance(data, str):
+                raise
+            return json.loads(str(data, 'utf-8', 'ignore'))
+
+    def json_dumps(obj, indent: bool = False) -> str:
+        """序列化为str（indent=True 时格式化输出，orjson 固定2空格缩进）"""
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=option).decode('utf-8')
+
+    def json_dumps_bytes(obj) -> bytes:
+        """序列化为UTF-8字节（紧凑格式）"""
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+elif JSON_BACKEND == "ujson":
+    def json_loads(data):
+        """解析JSON（接受 str / bytes / memoryview）"""
+        if not isinstance(data, (str, bytes)):
+            data = str(data, 'utf-8', 'ignore')
+        return ujson.loads(data)
+
+    def json_dumps(obj, indent: bool = False) -> str:
+        """序列化为str（indent=True 时格式化输出）"""
+        return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False,
+                           indent=4 if indent else 0)
+
+    def json_dumps_bytes(obj) -> bytes:
+        """序列化为UTF-8字节（紧凑格式）"""
+        return json_dumps(obj).encode('utf-8')
+
+else:
+    def json_loads(data):
+        """解析JSON（接受 str / bytes / memoryview）"""
+        if not isinstance(data, str):
+            data = str(data, 'utf-8', 'ignore')
+        return json.loads(data)
+
+    def json_dumps(obj, indent: bool = False) -> str:
+        """序列化为str（indent=True 时格式化输出）"""
+        if indent:
+            return json.dumps(obj, ensure_ascii=False, indent=4)
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+    def json_dumps_bytes(obj) -> bytes:
+        """序列化为UTF-8字节（紧凑格式）"""
+        return json_dumps(obj).encode('utf-8')
+
 # RTMP 推流状态
 RTMP_STATUS = {
     "active": False,
@@ -67,6 +142,7 @@ RTMP_STATUS = {
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CONFIG_FILE = os.path.join(BASE_DIR, "config.json")
 COOKIE_FILE = os.path.join(BASE_DIR, "bili_cookies.json")
+ROOM_CACHE_FILE = os.path.join(BASE_DIR, "room_cache.json")
 
 DEFAULT_CONFIG = {
     "WEB_PORT": 5000,
@@ -76,16 +152,41 @@ DEFAULT_CONFIG = {
     "IRC_PORT": 6667,
     "MAX_SEEN_DANMAKU": 1000,
     "MAX_SEEN_GIFT": 500,
+    "DEDUP_WINDOW_SECONDS": 60,  # 去重时间窗口（秒），超过此时间的记录自动淘汰
     "HEARTBEAT_TIMEOUT": 18000,  # 5 小时 = 5 * 3600 = 18000 秒
+    "WS_STALL_TIMEOUT": 70,  # B站连接超过这么久（秒）没有收到心跳回复或任何消息则判定假死并重连，0=不检测
     "USER_AGENT": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
     "ENABLE_GIFT": True,
     "MAX_LOG_ITEMS": 50,
+    "EVENT_QUEUE_SIZE": 2000,  # B站接收与PS5写入之间的事件队列长度
+    "EVENT_QUEUE_OVERFLOW": "drop_oldest",  # 队列满时: drop_oldest=丢最旧的普通弹幕 drop_newest=丢新弹幕 block=等待（不丢）
+    "IRC_CLIENT_QUEUE_SIZE": 1000,  # 每个IRC客户端的发送队列长度（行），写得慢的客户端只丢自己队列里最旧的弹幕
+    "IRC_FLUSH_WINDOW_MS": 10,  # 合并写入窗口（毫秒）：第一行入队后最多等这么久再写出，0=立即写出
+    "IRC_FLUSH_BYTES": 8192,  # 积压达到这么多字节时不等窗口结束，立即写出
+    "SPAM_AGGREGATE_MS": 0,  # 刷屏合并窗口（毫秒）：窗口内相同的弹幕只转发一次，重复3次以上时结束补发 "666 ×42"，0=不合并（默认）
+    "OUTPUT_SHAPER": False,  # 输出整形：按优先级（SC > 大航海 > 礼物 > 弹幕）限制每秒发给PS5的行数
+    "SHAPER_TOTAL_RATE": 8,  # 整形后每秒最多发给PS5的行数（所有类型合计）
+    "SHAPER_RATE_SC": 0,  # 各类型每秒最多行数，0=只受总速率限制
+    "SHAPER_RATE_GUARD": 0,
+    "SHAPER_RATE_GIFT": 3,
+    "SHAPER_RATE_DANMAKU": 6,
+    "SHAPER_SUMMARY_INTERVAL": 5,  # 来不及显示的礼物/弹幕每隔多少秒汇总成一行 "+N 条弹幕"
+    "USE_UVLOOP": False,  # 使用 uvloop 事件循环（需 pip install uvloop，不支持Windows，重启后生效）
     "BILIBILI_SESSDATA": "",
     "BILIBILI_BILI_JCT": "",
     "BILIBILI_UID": 0,
     "BILIBILI_UNAME": "",
-    "RECONNECT_DELAY": 5,
-    "ROOM_HISTORY": []  # 直播间历史记录 [{"room_id": 123, "room_title": "主播名", "timestamp": 123456}]
+    "RECONNECT_DELAY": 5,  # 重连退避的基础延迟（秒），第一次重试立即进行
+    "RECONNECT_MAX_DELAY": 60,  # 重连退避的最大延迟（秒）
+    "RISK_CONTROL_THRESHOLD": 3,  # 连续触发风控(-352)多少次后熔断
+    "RISK_CONTROL_COOLDOWN": 300,  # 熔断后暂停重连的时间（秒）
+    "SWITCH_MAKE_BEFORE_BREAK": True,  # 切换直播间时先连上新房间再断开旧连接
+    "REDUNDANT_CONNECTION": False,  # 双连接冗余：同一直播间在另一个节点上再保持一条连接，单条断开时不丢弹幕
+    "EXTRA_ROOM_IDS": [],  # 同时监听的其他直播间（联播），弹幕合并转发到PS5
+    "ROOM_PREFIXES": {},  # 直播间 -> 转发时加在消息前的前缀，如 {"732": "主"}，未配置的直播间不加前缀
+    "ROOM_HISTORY": [],  # 直播间历史记录 [{"room_id": 123, "room_title": "主播名", "timestamp": 123456}]
+    "WS_CAPTURE_FILE": "",  # 录制B站原始WebSocket帧的文件（相对程序目录），留空则不录制
+    "WS_CAPTURE_COMPRESS": False,  # 录制文件是否gzip压缩
 }
 
 CONFIG = DEFAULT_CONFIG.copy()
@@ -100,6 +201,7 @@ GUARD_COUNT = 0
 SC_COUNT = 0
 NEED_RECONNECT = False  # 标记是否需要重新连接（房间ID改变时）
 NEW_ROOM_ID = None  # 新的房间ID
+RISK_CONTROL_HITS = 0  # 调用B站接口触发风控(-352)的累计次数
 LOGIN_STATE = {
     "qr_key": "",
     "qr_url": "",
@@ -111,8 +213,8 @@ LOGIN_STATE = {
     "poll_active": False
 }
 
-recent_danmaku_log = deque(maxlen=500)
-recent_gift_log = deque(maxlen=500)   # 包含 gift / guard / sc 三种类型
+recent_danmaku_log = deque(maxlen=500)   # LiveEvent
+recent_gift_log = deque(maxlen=500)   # LiveEvent，包含 gift / guard / sc 三种类型
 GUARD_COUNT = 0
 SC_COUNT = 0
 
@@ -161,7 +263,7 @@ def load_config():
             shutil.rmtree(CONFIG_FILE)
         if os.path.exists(CONFIG_FILE):
             with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                loaded = json.load(f)
+                loaded = json_loads(f.read())
                 logger.info(f"配置文件内容: 房间={loaded.get('BILIBILI_ROOM_ID', 'N/A')}, 文件大小={os.path.getsize(CONFIG_FILE)} bytes")
                 for k, v in loaded.items():
                     if k in DEFAULT_CONFIG:
@@ -187,7 +289,7 @@ def _load_cookies_to_config():
     try:
         if os.path.exists(COOKIE_FILE):
             with open(COOKIE_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+                data = json_loads(f.read())
             CONFIG["BILIBILI_SESSDATA"] = data.get("SESSDATA", "")
             CONFIG["BILIBILI_BILI_JCT"] = data.get("bili_jct", "")
             CONFIG["BILIBILI_UID"] = data.get("uid", 0)
@@ -207,7 +309,7 @@ def _save_cookies(sessdata: str, bili_jct: str, uid: int, uname: str):
             "saved_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
         with open(COOKIE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.write(json_dumps(data, indent=True))
         CONFIG["BILIBILI_SESSDATA"] = sessdata
         CONFIG["BILIBILI_BILI_JCT"] = bili_jct
         CONFIG["BILIBILI_UID"] = uid
@@ -217,10 +319,26 @@ def _save_cookies(sessdata: str, bili_jct: str, uid: int, uname: str):
         logger.error(f"保存Cookie失败: {e}")
 
 
+def _write_config_file(sync: bool = False):
+    """把CONFIG写入config.json（sync=True 时强制刷盘）"""
+    with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
+        f.write(json_dumps(CONFIG, indent=True))
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())  # 强制同步到磁盘，确保 Docker volume 挂载正确
+
+
 def save_config(new_config=None):
     global CONFIG
     INT_KEYS = {"BILIBILI_ROOM_ID", "IRC_PORT", "WEB_PORT", "MAX_SEEN_DANMAKU",
-                "MAX_SEEN_GIFT", "HEARTBEAT_TIMEOUT", "MAX_LOG_ITEMS", "RECONNECT_DELAY"}
+                "MAX_SEEN_GIFT", "DEDUP_WINDOW_SECONDS", "HEARTBEAT_TIMEOUT", "MAX_LOG_ITEMS",
+                "RECONNECT_DELAY", "RECONNECT_MAX_DELAY", "RISK_CONTROL_THRESHOLD",
+                "RISK_CONTROL_COOLDOWN", "WS_STALL_TIMEOUT", "EVENT_QUEUE_SIZE",
+                "IRC_CLIENT_QUEUE_SIZE", "IRC_FLUSH_WINDOW_MS", "IRC_FLUSH_BYTES",
+                "SHAPER_TOTAL_RATE", "SHAPER_RATE_SC", "SHAPER_RATE_GUARD", "SHAPER_RATE_GIFT",
+                "SHAPER_RATE_DANMAKU", "SHAPER_SUMMARY_INTERVAL", "SPAM_AGGREGATE_MS"}
+    BOOL_KEYS = {"ENABLE_GIFT", "WS_CAPTURE_COMPRESS", "SWITCH_MAKE_BEFORE_BREAK", "REDUNDANT_CONNECTION",
+                 "USE_UVLOOP", "OUTPUT_SHAPER"}
     if new_config:
         for k, v in new_config.items():
             if k not in DEFAULT_CONFIG:
@@ -230,22 +348,314 @@ def save_config(new_config=None):
                     CONFIG[k] = int(v)
                 except:
                     CONFIG[k] = DEFAULT_CONFIG[k]
-            elif k == "ENABLE_GIFT":
+            elif k in BOOL_KEYS:
                 CONFIG[k] = str(v).lower() in ("true", "1", "yes", "on")
+            elif k == "EXTRA_ROOM_IDS":
+                CONFIG[k] = parse_room_ids(v)
+            elif k == "ROOM_PREFIXES":
+                CONFIG[k] = {str(r): p for r, p in parse_room_prefixes(v).items()}
             else:
                 CONFIG[k] = str(v).strip() if isinstance(v, str) else v
+    if _GLOBAL_IRC_SERVER:
+        _GLOBAL_IRC_SERVER.on_config_saved()
+    if _GLOBAL_ROOM_MANAGER:
+        _GLOBAL_ROOM_MANAGER.on_config_saved()
+    elif _GLOBAL_BILI_CLIENT:
+        if _GLOBAL_BILI_CLIENT._loop is not None:
+            _GLOBAL_BILI_CLIENT._loop.call_soon_threadsafe(_GLOBAL_BILI_CLIENT.apply_dedup_config)
+        else:
+            _GLOBAL_BILI_CLIENT.apply_dedup_config()
     try:
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(CONFIG, f, ensure_ascii=False, indent=4)
-            f.flush()
-            os.fsync(f.fileno())  # 强制同步到磁盘，确保 Docker volume 挂载正确
+        _write_config_file(sync=True)
         logger.info(f"配置已保存: {CONFIG_FILE} | 房间: {CONFIG.get('BILIBILI_ROOM_ID')}")
     except Exception as e:
         logger.error(f"保存配置失败: {e}")
 
 
+def parse_room_ids(value) -> list:
+    """解析直播间列表：支持 [732, "1234"] 或 "732, 1234" 格式，去重并保持顺序"""
+    if isinstance(value, str):
+        value = re.split(r'[\s,，]+', value)
+    ids = []
+    for v in value or []:
+        try:
+            rid = int(v)
+        except (TypeError, ValueError):
+            continue
+        if rid > 0 and rid not in ids:
+            ids.append(rid)
+    return ids
+
+
+def parse_room_prefixes(value) -> Dict[int, str]:
+    """解析直播间前缀：支持 {"732": "主"} 或 "732:主, 1234:副" 格式"""
+    if isinstance(value, str):
+        pairs = (item.replace('：', ':').split(':', 1) for item in re.split(r'[,，\n]+', value))
+        value = {p[0]: p[1] for p in pairs if len(p) == 2}
+    prefixes = {}
+    for k, v in (value or {}).items():
+        try:
+            rid = int(str(k).strip())
+        except ValueError:
+            continue
+        if str(v).strip():
+            prefixes[rid] = str(v).strip()
+    return prefixes
+
+
+# ==================== 共享 HTTP 客户端 ====================
+class BiliHTTPClient:
+    """
+    所有B站HTTP接口共用的长连接客户端（连接池 + keep-alive + DNS缓存）
+    在 main() 中启动；未启动或在其他事件循环中调用时退回一次性的临时 session
+    弹幕 WebSocket 走另一个不限连接数的 session（shared_ws），不占用短请求的 POOL_LIMIT 名额
+    """
+    POOL_LIMIT = 16
+    DNS_CACHE_TTL = 300      # 秒
+    KEEPALIVE_TIMEOUT = 60   # 秒
+
+    def __init__(self):
+        self._session = None
+        self._ws_session = None
+        self._loop = None
+        self.requests = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.new_connections = 0
+        self.reused_connections = 0
+        self.dns_cache_hits = 0
+        self.dns_cache_misses = 0
+        self.temp_sessions = 0
+
+    def _build_trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx, params):
+            ctx.start = time.perf_counter()
+
+        async def on_request_end(session, ctx, params):
+            self.requests += 1
+            self.total_time += time.perf_counter() - ctx.start
+
+        async def on_request_exception(session, ctx, params):
+            self.requests += 1
+            self.errors += 1
+
+        async def on_connection_create_end(session, ctx, params):
+            self.new_connections += 1
+
+        async def on_connection_reuseconn(session, ctx, params):
+            self.reused_connections += 1
+
+        async def on_dns_cache_hit(session, ctx, params):
+            self.dns_cache_hits += 1
+
+        async def on_dns_cache_miss(session, ctx, params):
+            self.dns_cache_misses += 1
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_request_end.append(on_request_end)
+        trace.on_request_exception.append(on_request_exception)
+        trace.on_connection_create_end.append(on_connection_create_end)
+        trace.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace.on_dns_cache_miss.append(on_dns_cache_miss)
+        return trace
+
+    async def start(self):
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.POOL_LIMIT,
+            ttl_dns_cache=self.DNS_CACHE_TTL,
+            keepalive_timeout=self.KEEPALIVE_TIMEOUT,
+        )
+        # Cookie 由每个请求按当前登录态传入，不在共享 session 中累积（避免退出登录后仍带旧 Cookie）
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            cookie_jar=aiohttp.DummyCookieJar(),
+            trace_configs=[self._build_trace_config()],
+        )
+        # 每条 WebSocket 在断开前一直占着所属连接池的一个名额；和短请求共用 POOL_LIMIT 时，
+        # 多直播间/双连接很快就会占满，getDanmuInfo、房间信息和新的握手都会排队到超时。
+        # 所以长连接单独用 limit=0 的连接池，DNS缓存和 Cookie 策略与短请求一致
+        self._ws_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=0, ttl_dns_cache=self.DNS_CACHE_TTL),
+            cookie_jar=aiohttp.DummyCookieJar(),
+        )
+        self._loop = asyncio.get_running_loop()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+            self._loop = None
+        if self._ws_session is not None:
+            await self._ws_session.close()
+            self._ws_session = None
+
+    def shared(self):
+        """当前事件循环中可用的共享 session，不可用时返回 None"""
+        if self._session is not None and not self._session.closed \
+                and asyncio.get_running_loop() is self._loop:
+            return self._session
+        return None
+
+    def shared_ws(self):
+        """当前事件循环中可用的 WebSocket 专用 session，不可用时返回 None"""
+        if self.shared() is not None and not self._ws_session.closed:
+            return self._ws_session
+        return None
+
+    @contextlib.asynccontextmanager
+    async def session(self):
+        """async with bili_http.session() as session: ..."""
+        shared = self.shared()
+        if shared is not None:
+            yield shared
+            return
+        self.temp_sessions += 1
+        async with aiohttp.ClientSession(cookie_jar=aiohttp.DummyCookieJar()) as session:
+            yield session
+
+    def snapshot(self) -> dict:
+        idle = 0
+        if self._session is not None:
+            conns = getattr(self._session.connector, "_conns", {})
+            idle = sum(len(v) for v in conns.values())
+        return {
+            "started": self._session is not None and not self._session.closed,
+            "requests": self.requests,
+            "errors": self.errors,
+            "avg_ms": round(self.total_time / self.requests * 1000, 1) if self.requests else 0.0,
+            "new_connections": self.new_connections,
+            "reused_connections": self.reused_connections,
+            "idle_connections": idle,
+            "dns_cache_hits": self.dns_cache_hits,
+            "dns_cache_misses": self.dns_cache_misses,
+            "temp_sessions": self.temp_sessions,
+        }
+
+
+bili_http = BiliHTTPClient()
+
+
+# ==================== 直播间信息缓存 ====================
+class RoomMetaCache:
+    """
+    直播间元数据缓存（短号 -> 真实房间号、get_room_info 结果），带过期时间并持久化到磁盘
+    真实房间号几乎不会变化，有效期较长；主播名/标题有效期较短
+    """
+    REAL_ID_TTL = 7 * 24 * 3600
+    INFO_TTL = 24 * 3600
+    PREFETCH_INTERVAL = 0.5   # 预取时每个房间之间的间隔（秒），避免触发风控
+
+    def __init__(self, path: str):
+        self.path = path
+        self._real_ids = {}   # "room_id" -> [real_id, 写入时间]
+        self._infos = {}      # "room_id" -> [info, 写入时间]
+        self.hits = 0
+        self.misses = 0
+        self.loaded = False
+
+    def load(self):
+        self.loaded = True
+        try:
+            if os.path.isdir(self.path):
+                # Docker 挂载了不存在的文件时会变成目录，此时只使用内存缓存
+                logger.warning(f"直播间缓存路径是目录，缓存不会持久化: {self.path}")
+                return
+            if not os.path.exists(self.path):
+                return
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json_loads(f.read() or "{}")
+            self._real_ids = data.get("real_ids", {}) or {}
+            self._infos = data.get("infos", {}) or {}
+            self._purge()
+            logger.info(f"直播间缓存已加载: {len(self._real_ids)} 个房间号, {len(self._infos)} 条房间信息")
+        except Exception as e:
+            logger.warning(f"加载直播间缓存失败: {e}")
+            self._real_ids, self._infos = {}, {}
+
+    def save(self):
+        if not self.loaded or os.path.isdir(self.path):
+            return
+        try:
+            tmp = self.path + ".tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(json_dumps({"real_ids": self._real_ids, "infos": self._infos}))
+            os.replace(tmp, self.path)
+        except Exception as e:
+            logger.warning(f"保存直播间缓存失败: {e}")
+
+    def _purge(self):
+        now = time.time()
+        self._real_ids = {k: v for k, v in self._real_ids.items() if now - v[1] < self.REAL_ID_TTL}
+        self._infos = {k: v for k, v in self._infos.items() if now - v[1] < self.INFO_TTL}
+
+    def _get(self, table: dict, room_id: int, ttl: float):
+        entry = table.get(str(room_id))
+        if entry is not None and time.time() - entry[1] < ttl:
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        return None
+
+    def get_real_id(self, room_id: int):
+        return self._get(self._real_ids, room_id, self.REAL_ID_TTL)
+
+    def get_info(self, room_id: int):
+        return self._get(self._infos, room_id, self.INFO_TTL)
+
+    def put_real_id(self, room_id: int, real_id: int, save: bool = True):
+        now = time.time()
+        self._real_ids[str(room_id)] = [real_id, now]
+        self._real_ids[str(real_id)] = [real_id, now]
+        if save:
+            self.save()
+
+    def put_info(self, room_id: int, info: dict, real_id: int | None = None):
+        self._infos[str(room_id)] = [info, time.time()]
+        if real_id:
+            self.put_real_id(room_id, real_id, save=False)
+        self.save()
+
+    def is_fresh(self, room_id: int) -> bool:
+        now = time.time()
+        real = self._real_ids.get(str(room_id))
+        info = self._infos.get(str(room_id))
+        return bool(real and info and now - real[1] < self.REAL_ID_TTL and now - info[1] < self.INFO_TTL)
+
+    async def prefetch(self, room_ids: list):
+        """后台预取房间信息（同时得到真实房间号），已缓存且未过期的跳过"""
+        todo = [r for r in room_ids if r and not self.is_fresh(r)]
+        if not todo:
+            return
+        logger.info(f"后台预取 {len(todo)} 个历史直播间信息...")
+        for room_id in todo:
+            await get_room_info(room_id)
+            await asyncio.sleep(self.PREFETCH_INTERVAL)
+        logger.info("历史直播间信息预取完成")
+
+    def snapshot(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "real_ids": len(self._real_ids),
+            "infos": len(self._infos),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+room_cache = RoomMetaCache(ROOM_CACHE_FILE)
+
+
 async def get_room_info(room_id: int) -> dict:
-    """获取直播间信息（主播名字）"""
+    """获取直播间信息（主播名字），优先使用缓存"""
+    cached = room_cache.get_info(room_id)
+    if cached is not None:
+        return cached
     try:
         url = f"https://api.live.bilibili.com/room/v1/Room/get_info?room_id={room_id}"
         headers = {
@@ -261,7 +671,7 @@ async def get_room_info(room_id: int) -> dict:
             if bili_jct:
                 cookies["bili_jct"] = bili_jct
 
-        async with aiohttp.ClientSession() as session:
+        async with bili_http.session() as session:
             async with session.get(url, headers=headers, cookies=cookies,
                                    timeout=aiohttp.ClientTimeout(total=10), ssl=False) as resp:
                 text = await resp.text()
@@ -269,8 +679,8 @@ async def get_room_info(room_id: int) -> dict:
                     return {"room_id": room_id, "room_title": f"直播间{room_id}"}
 
                 try:
-                    data = json.loads(text)
-                except json.JSONDecodeError:
+                    data = json_loads(text)
+                except ValueError:
                     return {"room_id": room_id, "room_title": f"直播间{room_id}"}
 
                 if data.get("code") == 0:
@@ -279,12 +689,14 @@ async def get_room_info(room_id: int) -> dict:
                     uname = room_data.get("uname", "")
                     # 优先显示主播名，其次标题
                     display_name = uname if uname else (room_title if room_title else f"直播间{room_id}")
-                    return {
+                    info = {
                         "room_id": room_id,
                         "room_title": display_name,
                         "uname": uname,
                         "title": room_title
                     }
+                    room_cache.put_info(room_id, info, room_data.get("room_id"))
+                    return info
                 else:
                     return {"room_id": room_id, "room_title": f"直播间{room_id}"}
     except Exception as e:
@@ -321,8 +733,7 @@ def add_room_to_history(room_id: int, room_title: str = None):
         CONFIG["ROOM_HISTORY"] = history
 
         # 立即保存到配置文件
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(CONFIG, f, ensure_ascii=False, indent=4)
+        _write_config_file()
 
         logger.info(f"直播间 {room_id} 已添加到历史记录: {room_title}")
     except Exception as e:
@@ -496,8 +907,7 @@ def logout_bili():
         LOGIN_STATE["uid"] = 0
         # 同步保存到 config.json，否则重启后登录态会复原
         try:
-            with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-                json.dump(CONFIG, f, ensure_ascii=False, indent=4)
+            _write_config_file()
         except Exception as save_err:
             logger.warning(f"退出登录时保存config失败（Cookie已清除）: {save_err}")
         logger.info("已退出B站账号")
@@ -561,7 +971,7 @@ class WBISigner:
                     logger.warning(f"获取WBI key失败: status={res.status}")
                     return
                 
-                data = await res.json()
+                data = await res.json(loads=json_loads)
                 
                 # 解析wbi key
                 wbi_img = data.get('data', {}).get('wbi_img', {})
@@ -629,10 +1039,12 @@ WS_VER_HEARTBEAT = 1
 WS_VER_ZLIB = 2
 WS_VER_BROTLI = 3
 
+_WS_HEADER = struct.Struct('>IHHII')
+
 
 def pack_ws_message(op: int, body: bytes = b'', ver: int = WS_VER_PLAIN) -> bytes:
     total = WS_HEADER_SIZE + len(body)
-    header = struct.pack('>IHHII', total, WS_HEADER_SIZE, ver, op, 1)
+    header = _WS_HEADER.pack(total, WS_HEADER_SIZE, ver, op, 1)
     return header + body
 
 
@@ -642,7 +1054,7 @@ def unpack_ws_messages(data: bytes) -> list:
     while offset < len(data):
         if offset + WS_HEADER_SIZE > len(data):
             break
-        total, header_size, ver, op, seq = struct.unpack_from('>IHHII', data, offset)
+        total, header_size, ver, op, seq = _WS_HEADER.unpack_from(data, offset)
         if total < WS_HEADER_SIZE or offset + total > len(data):
             break
         body = data[offset + header_size: offset + total]
@@ -668,12 +1080,333 @@ def decode_ws_body(ver: int, body: bytes) -> list:
                 logger.warning("brotli未安装，跳过brotli消息")
         elif ver in (WS_VER_PLAIN, WS_VER_HEARTBEAT):
             if body:
-                results.append(json.loads(body.decode('utf-8', errors='ignore')))
+                results.append(json_loads(body))
     except Exception as e:
         logger.debug(f"解码消息失败: {e}")
     return results
 
 
+class WSFrameDecoder:
+    """
+    B站 WebSocket 帧解码器（零拷贝）
+    基于 memoryview 原地解析包头，zlib/brotli 嵌套包用显式栈展开（不递归），
+    逐个 yield (op, ver, body_view)，不构造中间列表
+    """
+
+    def __init__(self):
+        try:
+            import brotli
+            self._brotli = brotli
+        except ImportError:
+            self._brotli = None
+        self.frame_count = 0
+        self.packet_count = 0
+        self.error_count = 0
+
+    def _decompress(self, ver: int, body: memoryview):
+        """解压 ver=2/3 的包体，失败返回 None"""
+        try:
+            if ver == WS_VER_ZLIB:
+                return zlib.decompress(body)
+            if self._brotli is None:
+                logger.warning("brotli未安装，跳过brotli消息")
+                return None
+            return self._brotli.decompress(body)
+        except Exception as e:
+            self.error_count += 1
+            logger.debug(f"解压消息失败: {e}")
+            return None
+
+    def iter_packets(self, data: bytes):
+        """
+        遍历一帧中的所有数据包（含压缩包内的嵌套包）
+        返回的 body 是底层缓冲区的 memoryview，仅在本次迭代期间有效
+        """
+        self.frame_count += 1
+        # 栈元素: (缓冲区, 偏移)，保证嵌套包按原始顺序输出
+        stack = [(memoryview(data), 0)]
+        while stack:
+            buf, offset = stack.pop()
+            size = len(buf)
+            while offset + WS_HEADER_SIZE <= size:
+                total, header_size, ver, op, _seq = _WS_HEADER.unpack_from(buf, offset)
+                if total < WS_HEADER_SIZE or offset + total > size:
+                    break
+                body = buf[offset + header_size: offset + total]
+                offset += total
+                if op == WS_OP_MESSAGE and ver in (WS_VER_ZLIB, WS_VER_BROTLI):
+                    inner = self._decompress(ver, body)
+                    if inner is not None:
+                        stack.append((buf, offset))
+                        stack.append((memoryview(inner), 0))
+                        break
+                    continue
+                self.packet_count += 1
+                yield op, ver, body
+
+
+# 命令预过滤：只匹配以 {"cmd":"xxx" 开头的消息（B站消息的 cmd 总是第一个字段）
+_WS_CMD_RE = re.compile(rb'\s*\{\s*"cmd"\s*:\s*"([^"\\]*)"')
+
+
+def peek_ws_cmd(body) -> str | None:
+    """从原始JSON字节中直接读取cmd字段（不做完整JSON解析），读不到返回None"""
+    m = _WS_CMD_RE.match(body)
+    if m is None:
+        return None
+    return m.group(1).decode('utf-8', errors='ignore')
+
+
+class CommandStats:
+    """按命令统计：完整解析的消息数 vs 预过滤跳过的消息数"""
+
+    def __init__(self):
+        self.parsed = Counter()
+        self.skipped = Counter()
+        self.skipped_bytes = 0
+
+    def record_parsed(self, cmd: str):
+        self.parsed[cmd] += 1
+
+    def record_skipped(self, cmd: str, size: int):
+        self.skipped[cmd] += 1
+        self.skipped_bytes += size
+
+    def reset(self):
+        self.parsed.clear()
+        self.skipped.clear()
+        self.skipped_bytes = 0
+
+    def snapshot(self) -> dict:
+        cmds = set(self.parsed) | set(self.skipped)
+        rows = [
+            {"cmd": c, "parsed": self.parsed.get(c, 0), "skipped": self.skipped.get(c, 0)}
+            for c in cmds
+        ]
+        rows.sort(key=lambda r: r["parsed"] + r["skipped"], reverse=True)
+        return {
+            "total_parsed": sum(self.parsed.values()),
+            "total_skipped": sum(self.skipped.values()),
+            "skipped_bytes": self.skipped_bytes,
+            "commands": rows,
+        }
+
+
+class HandlerStats:
+    """按命令统计处理函数的调用次数、总耗时和最大耗时"""
+
+    def __init__(self):
+        self.calls = Counter()
+        self.total = Counter()   # 秒
+        self.max = {}
+
+    def record(self, cmd: str, elapsed: float):
+        self.calls[cmd] += 1
+        self.total[cmd] += elapsed
+        if elapsed > self.max.get(cmd, 0.0):
+            self.max[cmd] = elapsed
+
+    def reset(self):
+        self.calls.clear()
+        self.total.clear()
+        self.max.clear()
+
+    def snapshot(self) -> dict:
+        rows = []
+        for cmd, calls in self.calls.items():
+            total = self.total[cmd]
+            rows.append({
+                "cmd": cmd,
+                "calls": calls,
+                "total_ms": round(total * 1000, 3),
+                "avg_us": round(total / calls * 1e6, 1),
+                "max_us": round(self.max.get(cmd, 0.0) * 1e6, 1),
+            })
+        rows.sort(key=lambda r: r["total_ms"], reverse=True)
+        return {
+            "total_calls": sum(self.calls.values()),
+            "total_ms": round(sum(self.total.values()) * 1000, 3),
+            "handlers": rows,
+        }
+
+
+# ==================== 去重窗口 ====================
+class DedupWindow:
+    """
+    按插入/最近命中顺序排列的去重集合，同时受条数和时间窗口限制
+    插入、查询、淘汰均为 O(1)（淘汰只从最旧一端弹出）
+    """
+
+    def __init__(self, max_size: int, max_age: float = 0):
+        self._items = OrderedDict()   # key -> 最近一次出现的单调时间
+        self.max_size = max_size
+        self.max_age = max_age        # <=0 表示不按时间淘汰
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0              # 因超出条数被淘汰
+        self.expired = 0              # 因超出时间窗口被淘汰
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, key) -> bool:
+        return key in self._items
+
+    def seen(self, key) -> bool:
+        """key 在窗口内出现过则返回 True（并刷新其位置），否则记录并返回 False"""
+        now = time.monotonic()
+        items = self._items
+        if self.max_age > 0:
+            limit = now - self.max_age
+            while items:
+                oldest = next(iter(items.values()))
+                if oldest >= limit:
+                    break
+                items.popitem(last=False)
+                self.expired += 1
+        if key in items:
+            items[key] = now
+            items.move_to_end(key)
+            self.hits += 1
+            return True
+        items[key] = now
+        self.misses += 1
+        while len(items) > self.max_size > 0:
+            items.popitem(last=False)
+            self.evicted += 1
+        return False
+
+    def last_seen(self, key):
+        """key 最近一次出现的单调时间，不在窗口内返回 None（不刷新位置）"""
+        return self._items.get(key)
+
+    def resize(self, max_size: int, max_age: float):
+        self.max_size = max_size
+        self.max_age = max_age
+        while len(self._items) > self.max_size > 0:
+            self._items.popitem(last=False)
+            self.evicted += 1
+
+    def clear(self):
+        self._items.clear()
+
+    def reset_stats(self):
+        self.hits = self.misses = self.evicted = self.expired = 0
+
+    def snapshot(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "max_size": self.max_size,
+            "max_age": self.max_age,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evicted": self.evicted,
+            "expired": self.expired,
+        }
+
+
+# ==================== 原始帧录制 / 回放 ====================
+WS_CAPTURE_MAGIC = b'BLWSCAP1'
+# 每条记录: [单调时间戳 float64][帧长度 uint32][帧数据]
+_WS_CAPTURE_RECORD = struct.Struct('>dI')
+
+
+class WSFrameRecorder:
+    """
+    WebSocket原始帧录制器
+    每次打开写入一个文件头作为会话分隔，之后以长度前缀格式追加每个二进制帧
+    """
+    FLUSH_INTERVAL = 1.0
+
+    def __init__(self, path: str, compress: bool = False):
+        if not os.path.isabs(path):
+            path = os.path.join(BASE_DIR, path)
+        self.path = path
+        self.compress = compress or path.endswith('.gz')
+        self.frame_count = 0
+        self.byte_count = 0
+        self._fh = None
+        self._last_flush = 0.0
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if self.compress:
+            import gzip
+            self._fh = gzip.open(self.path, 'ab')
+        else:
+            self._fh = open(self.path, 'ab')
+        self._fh.write(WS_CAPTURE_MAGIC)
+        self._last_flush = time.monotonic()
+        logger.info(f"WebSocket 原始帧录制已开启: {self.path}{' (gzip)' if self.compress else ''}")
+
+    def write(self, data: bytes):
+        if self._fh is None:
+            return
+        now = time.monotonic()
+        try:
+            self._fh.write(_WS_CAPTURE_RECORD.pack(now, len(data)))
+            self._fh.write(data)
+            self.frame_count += 1
+            self.byte_count += len(data)
+            if now - self._last_flush >= self.FLUSH_INTERVAL:
+                self._fh.flush()
+                self._last_flush = now
+        except Exception as e:
+            logger.error(f"写入录制文件失败，停止录制: {e}")
+            self.close()
+
+    def close(self):
+        if self._fh is None:
+            return
+        try:
+            self._fh.close()
+        except Exception:
+            pass
+        self._fh = None
+        logger.info(f"WebSocket 录制已关闭: {self.frame_count} 帧, {self.byte_count} 字节")
+
+
+def iter_ws_capture(path: str):
+    """
+    读取录制文件，yield (相对时间秒, 帧数据)
+    多次录制会话追加在同一文件时，时间轴首尾相接（会话间隔记为0）
+    """
+    with open(path, 'rb') as f:
+        is_gzip = f.read(2) == b'\x1f\x8b'
+    if is_gzip:
+        import gzip
+        fh = gzip.open(path, 'rb')
+    else:
+        fh = open(path, 'rb')
+    with fh:
+        if fh.read(len(WS_CAPTURE_MAGIC)) != WS_CAPTURE_MAGIC:
+            raise ValueError(f"不是有效的录制文件: {path}")
+        offset = 0.0     # 之前会话累计的时长
+        base = None      # 当前会话第一帧的时间戳
+        last = 0.0
+        while True:
+            head = fh.read(_WS_CAPTURE_RECORD.size)
+            if len(head) < _WS_CAPTURE_RECORD.size:
+                break
+            while head.startswith(WS_CAPTURE_MAGIC):
+                # 新会话：文件头只有8字节，补读8字节拼出下一条记录的开头
+                head = head[len(WS_CAPTURE_MAGIC):] + fh.read(len(WS_CAPTURE_MAGIC))
+                offset = last
+                base = None
+            if len(head) < _WS_CAPTURE_RECORD.size:
+                break
+            ts, length = _WS_CAPTURE_RECORD.unpack(head)
+            data = fh.read(length)
+            if len(data) < length:
+                break  # 录制中断导致的残缺帧
+            if base is None:
+                base = ts
+            last = offset + max(0.0, ts - base)
+            yield last, data
+
+
 async def get_danmaku_server_info(room_id: int, sessdata: str = '') -> dict:
     """
     获取弹幕服务器信息（带WBI签名）
@@ -681,8 +1414,8 @@ async def get_danmaku_server_info(room_id: int, sessdata: str = '') -> dict:
     """
     try:
         # 第一步：获取WBI key
-        async with aiohttp.ClientSession(skip_auto_headers=["Accept-Encoding"]) as wbi_session:
-            await wbi_signer.get_wbi_key(wbi_session)
+        async with bili_http.session() as session:
+            await wbi_signer.get_wbi_key(session)
         
         # 第二步：构建请求参数并添加WBI签名
         params = wbi_signer.add_wbi_sign({
@@ -714,9 +1447,10 @@ async def get_danmaku_server_info(room_id: int, sessdata: str = '') -> dict:
         # 第三步：发送请求获取弹幕服务器信息
         url = "https://api.live.bilibili.com/xlive/web-room/v1/index/getDanmuInfo"
         
-        async with aiohttp.ClientSession(skip_auto_headers=["Accept-Encoding"]) as api_session:
-            async with api_session.get(url, headers=headers, cookies=cookies, params=params,
-                                       timeout=aiohttp.ClientTimeout(total=15), ssl=False) as resp:
+        async with bili_http.session() as session:
+            async with session.get(url, headers=headers, cookies=cookies, params=params,
+                                   timeout=aiohttp.ClientTimeout(total=15), ssl=False,
+                                   skip_auto_headers=["Accept-Encoding"]) as resp:
                 if resp.status != 200:
                     logger.warning(f"获取弹幕服务器信息失败: status={resp.status}")
                     return {}
@@ -728,8 +1462,8 @@ async def get_danmaku_server_info(room_id: int, sessdata: str = '') -> dict:
                     return {}
 
                 try:
-                    data = json.loads(text)
-                except json.JSONDecodeError:
+                    data = json_loads(text)
+                except ValueError:
                     logger.warning(f"getDanmuInfo 返回非JSON内容: {text[:200]}")
                     return {}
 
@@ -739,6 +1473,7 @@ async def get_danmaku_server_info(room_id: int, sessdata: str = '') -> dict:
                     logger.warning(f"getDanmuInfo 返回错误: code={data.get('code')} msg={data.get('message', '')}")
                     # 风控处理
                     if data.get("code") == -352:
+                        _note_risk_control()
                         # WBI签名错误，重置WBI key并重试
                         wbi_signer._wbi_key = ''
                         wbi_signer._last_refresh_time = None
@@ -749,6 +1484,9 @@ async def get_danmaku_server_info(room_id: int, sessdata: str = '') -> dict:
 
 
 async def get_real_room_id(room_id: int) -> int:
+    cached = room_cache.get_real_id(room_id)
+    if cached is not None:
+        return cached
     # 同样优化风控
     url = f"https://api.live.bilibili.com/room/v1/Room/get_info?room_id={room_id}"
     headers = {
@@ -769,7 +1507,7 @@ async def get_real_room_id(room_id: int) -> int:
     
     try:
         # 禁用自动解压，手动处理
-        async with aiohttp.ClientSession() as session:
+        async with bili_http.session() as session:
             async with session.get(url, headers=headers, cookies=cookies,
                                    timeout=aiohttp.ClientTimeout(total=15), ssl=False,
                                    skip_auto_headers=["Accept-Encoding"]) as resp:
@@ -778,22 +1516,136 @@ async def get_real_room_id(room_id: int) -> int:
                     return room_id
 
                 try:
-                    data = json.loads(text)
-                except json.JSONDecodeError:
+                    data = json_loads(text)
+                except ValueError:
                     logger.warning(f"获取房间信息返回非JSON: {text[:200]}")
                     return room_id
 
                 if data.get("code") == 0:
                     real_id = data["data"].get("room_id", room_id)
                     logger.info(f"房间 {room_id} 真实ID: {real_id}")
+                    room_cache.put_real_id(room_id, real_id)
                     return real_id
                 elif data.get("code") == -352:
+                    _note_risk_control()
                     logger.warning("获取房间信息时触发风控(-352)，建议扫码登录")
     except Exception as e:
         logger.error(f"获取真实房间ID失败: {e}")
     return room_id
 
 
+# ==================== 重连策略 ====================
+# 当前任务正在统计的风控次数 [次数]：多个直播间并发获取连接信息时，各自只统计自己请求触发的 -352
+_risk_scope: contextvars.ContextVar = contextvars.ContextVar("risk_scope", default=None)
+
+
+def _note_risk_control():
+    """记录一次风控(-352)响应（全局累计 + 当前任务的统计范围），连接循环据此判断是否熔断"""
+    global RISK_CONTROL_HITS
+    RISK_CONTROL_HITS += 1
+    scope = _risk_scope.get()
+    if scope is not None:
+        scope[0] += 1
+
+
+@contextlib.contextmanager
+def risk_control_scope():
+    """统计 with 块内（当前任务中）触发的风控次数，返回 [次数]"""
+    scope = [0]
+    token = _risk_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _risk_scope.reset(token)
+
+
+class ReconnectPolicy:
+    """
+    重连策略：第一次重试立即进行，之后按指数退避 + 全抖动（[0, min(上限, 基础*2^n)] 内随机）等待；
+    连续触发风控(-352)达到阈值后熔断，冷却期内不再请求B站接口，冷却结束后放行一次试探
+    参数每次从 CONFIG 读取，Web 端修改后立即生效
+    """
+    STABLE_AFTER = 30   # 连接持续这么久（秒）才算恢复正常，之后断开重新从立即重试开始
+
+    def __init__(self, name: str):
+        self.name = name
+        self.attempts = 0              # 连续失败次数
+        self.risk_streak = 0           # 连续触发风控次数
+        self.risk_total = 0
+        self.trips = 0                 # 熔断次数
+        self.last_error = ""
+        self.last_delay = 0.0
+        self._open_until = 0.0
+        self._retry_at = 0.0
+        self._connected_at = None
+
+    def on_connected(self):
+        self._connected_at = time.monotonic()
+        self.last_error = ""
+
+    def on_failure(self, error=None):
+        """连接失败或断开；稳定运行过一段时间后的断开重新从第一次重试算起"""
+        if self._connected_at is not None and \
+                time.monotonic() - self._connected_at >= self.STABLE_AFTER:
+            self.attempts = 0
+        self._connected_at = None
+        self.attempts += 1
+        self.last_error = (str(error) or type(error).__name__) if error is not None else "连接断开"
+
+    def on_risk_control(self, hit: bool):
+        """每次请求B站接口后调用：hit 表示本次是否触发了风控"""
+        if not hit:
+            if self.risk_streak and self.state != "closed":
+                logger.info(f"{self.name} 风控解除，熔断关闭")
+                _add_web_log("success", f"{self.name} 风控解除，恢复正常重连")
+            self.risk_streak = 0
+            self._open_until = 0.0
+            return
+        self.risk_streak += 1
+        self.risk_total += 1
+        if self.risk_streak >= max(1, CONFIG.get("RISK_CONTROL_THRESHOLD", 3)):
+            cooldown = CONFIG.get("RISK_CONTROL_COOLDOWN", 300)
+            self._open_until = time.monotonic() + cooldown
+            self.trips += 1
+            logger.warning(f"{self.name} 连续 {self.risk_streak} 次触发风控(-352)，熔断 {cooldown} 秒")
+            _add_web_log("error", f"连续触发风控(-352)，暂停重连 {cooldown} 秒，建议扫码登录")
+
+    @property
+    def state(self) -> str:
+        if not self._open_until:
+            return "closed"
+        return "open" if time.monotonic() < self._open_until else "half_open"
+
+    def next_delay(self) -> float:
+        """返回下一次重试前应等待的秒数"""
+        if self.attempts <= 1:
+            delay = 0.0
+        else:
+            base = max(0, CONFIG.get("RECONNECT_DELAY", 5))
+            cap = max(base, CONFIG.get("RECONNECT_MAX_DELAY", 60))
+            delay = random.uniform(0, min(cap, base * 2 ** (self.attempts - 1)))
+        if self.state == "open":
+            delay = max(delay, self._open_until - time.monotonic())
+        self.last_delay = round(delay, 2)
+        self._retry_at = time.monotonic() + delay
+        return delay
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return {
+            "name": self.name,
+            "state": self.state,
+            "attempts": self.attempts,
+            "retry_in": round(max(0.0, self._retry_at - now), 1),
+            "last_delay": self.last_delay,
+            "last_error": self.last_error,
+            "risk_streak": self.risk_streak,
+            "risk_total": self.risk_total,
+            "trips": self.trips,
+            "open_remaining": round(max(0.0, self._open_until - now), 1),
+        }
+
+
 # ==================== RTMP 推流状态 ====================
 def update_rtmp_status(**kwargs):
     """更新RTMP推流状态"""
@@ -825,8 +1677,478 @@ def reset_rtmp_status():
     }
 
 
+# ==================== 直播事件 ====================
+EVENT_DANMAKU = 0
+EVENT_GIFT = 1
+EVENT_GUARD = 2
+EVENT_SC = 3
+EVENT_TYPE_NAMES = ("danmaku", "gift", "guard", "sc")
+
+GUARD_NAMES = {1: "总督", 2: "提督", 3: "舰长"}
+
+
+def _intern(s):
+    return sys.intern(s) if isinstance(s, str) else s
+
+
+class LiveEvent:
+    """
+    弹幕/礼物/大航海/SC 事件
+    只保存 epoch 时间、类型码和原始字段（用户名、礼物名等重复字符串做 intern），
+    时间格式化延迟到 Web 接口 / CSV 导出时才进行
+    """
+    __slots__ = ("kind", "ts", "user", "name", "text", "num", "price", "coin", "guard_level", "room")
+
+    def __init__(self, kind: int, user, name: str = "", text: str = "", num: int = 1,
+                 price: int = 0, coin: str = "", guard_level: int = 0, ts: float | None = None,
+                 room: int = 0):
+        self.kind = kind
+        self.ts = time.time() if ts is None else ts
+        self.user = _intern(user)
+        self.name = _intern(name)
+        self.text = text
+        self.num = num
+        self.price = price
+        self.coin = _intern(coin)
+        self.guard_level = guard_level
+        self.room = room
+
+    @property
+    def type_name(self) -> str:
+        return EVENT_TYPE_NAMES[self.kind]
+
+    def time_str(self) -> str:
+        return time.strftime("%H:%M:%S", time.localtime(self.ts))
+
+    def irc_text(self) -> str:
+        """转发到PS5的消息正文"""
+        if self.kind == EVENT_DANMAKU:
+            return self.text
+        if self.kind == EVENT_GIFT:
+            return f"GIFT {self.user}: {self.name}x{self.num}"
+        if self.kind == EVENT_GUARD:
+            return f"GUARD {self.user} 开通了 {self.name}x{self.num}"
+        return f"SC Y{self.price} {self.user}: {self.text}"
+
+    def to_dict(self) -> dict:
+        """Web 接口使用的字典格式"""
+        d = {"type": EVENT_TYPE_NAMES[self.kind], "user": self.user}
+        if self.kind == EVENT_DANMAKU:
+            d["text"] = self.text
+            if self.num > 1:
+                d["num"] = self.num     # 刷屏合并的累计次数
+        else:
+            d["name"] = self.name
+            d["num"] = self.num
+            d["coin"] = self.coin
+            d["price"] = self.price
+            if self.kind == EVENT_GUARD:
+                d["guard_level"] = self.guard_level
+            elif self.kind == EVENT_SC:
+                d["text"] = self.text
+        d["time"] = self.time_str()
+        d["ts"] = int(self.ts * 1000)
+        d["room"] = self.room
+        return d
+
+
+# ==================== 事件队列 ====================
+class EventQueue:
+    """
+    B站接收循环与IRC写入之间的有界事件队列
+    接收循环只做解码并入队，IRCServer 的分发任务批量取出后写给PS5，PS5 写得慢不会拖住B站数据的读取
+    队列满时按 EVENT_QUEUE_OVERFLOW 处理：
+      drop_oldest  丢弃队列中最旧的普通弹幕（默认）
+      drop_newest  丢弃新到的普通弹幕
+      block        等待队列有空位，不丢弃（接收循环会被拖慢，回放校验时使用）
+    礼物、大航海、SC 永不丢弃：队列里没有可丢的弹幕时允许暂时超出上限
+    """
+    POLICIES = ("drop_oldest", "drop_newest", "block")
+    BATCH_LIMIT = 500   # 分发任务一次最多取出的事件数
+
+    def __init__(self, maxsize: int | None = None, policy: str | None = None):
+        self._items = deque()
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self.maxsize = 0
+        self.policy = ""
+        self.configure(maxsize, policy)
+        self.enqueued = 0
+        self.dispatched = 0
+        self.dropped = 0
+        self.overfilled = 0         # 因不可丢弃事件超出上限的次数
+        self.high_water = 0
+        self._last_warn = 0.0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def configure(self, maxsize: int | None = None, policy: str | None = None):
+        """按参数或 CONFIG 设置容量和溢出策略（保存配置后调用）"""
+        if maxsize is None:
+            maxsize = CONFIG.get("EVENT_QUEUE_SIZE", 2000)
+        if policy is None:
+            policy = CONFIG.get("EVENT_QUEUE_OVERFLOW", "drop_oldest")
+        self.maxsize = max(1, int(maxsize))
+        self.policy = policy if policy in self.POLICIES else "drop_oldest"
+        if len(self._items) < self.maxsize:
+            self._not_full.set()
+
+    def _drop_oldest_danmaku(self) -> bool:
+        items = self._items
+        for i, event in enumerate(items):
+            if event.kind == EVENT_DANMAKU:
+                del items[i]
+                return True
+        return False
+
+    def _on_drop(self):
+        self.dropped += 1
+        now = time.monotonic()
+        if now - self._last_warn > 10:
+            self._last_warn = now
+            logger.warning(f"事件队列已满（{self.maxsize}），PS5 写入跟不上，已丢弃 {self.dropped} 条弹幕")
+
+    async def put(self, events: list):
+        items = self._items
+        for event in events:
+            if len(items) >= self.maxsize:
+                if self.policy == "block":
+                    while len(items) >= self.maxsize:
+                        self._not_full.clear()
+                        await self._not_full.wait()
+                elif event.kind == EVENT_DANMAKU and self.policy == "drop_newest":
+                    self._on_drop()
+                    continue
+                elif self._drop_oldest_danmaku():
+                    self._on_drop()
+                elif event.kind == EVENT_DANMAKU:
+                    # 队列里全是不可丢弃的事件，只能丢掉这条新弹幕
+                    self._on_drop()
+                    continue
+                else:
+                    self.overfilled += 1
+            items.append(event)
+            self.enqueued += 1
+        if len(items) > self.high_water:
+            self.high_water = len(items)
+        if items:
+            self._not_empty.set()
+
+    async def get_batch(self) -> list:
+        """等待并取出当前排队的事件（最多 BATCH_LIMIT 条），保持入队顺序"""
+        items = self._items
+        while not items:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        n = min(len(items), self.BATCH_LIMIT)
+        batch = [items.popleft() for _ in range(n)]
+        self.dispatched += n
+        if len(items) < self.maxsize:
+            self._not_full.set()
+        return batch
+
+    def reset_stats(self):
+        self.enqueued = self.dispatched = self.dropped = self.overfilled = 0
+        self.high_water = len(self._items)
+
+    def snapshot(self) -> dict:
+        return {
+            "depth": len(self._items),
+            "maxsize": self.maxsize,
+            "policy": self.policy,
+            "high_water": self.high_water,
+            "enqueued": self.enqueued,
+            "dispatched": self.dispatched,
+            "dropped": self.dropped,
+            "overfilled": self.overfilled,
+        }
+
+
+# ==================== 输出整形 ====================
+class TokenBucket:
+    """令牌桶：rate 为每秒补充的令牌数，最多积攒 burst 个；rate<=0 表示不限速"""
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float = 0, burst: float | None = None):
+        self.rate = 0.0
+        self.burst = 1.0
+        self.updated = time.monotonic()
+        self.set_rate(rate, burst)
+        self.tokens = self.burst
+
+    def set_rate(self, rate: float, burst: float | None = None):
+        self.rate = max(0.0, float(rate))
+        self.burst = max(1.0, float(burst) if burst is not None else self.rate)
+
+    def refill(self, now: float):
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready(self) -> bool:
+        return self.rate <= 0 or self.tokens >= 1
+
+    def take(self):
+        if self.rate > 0:
+            self.tokens -= 1
+
+
+class OutputShaper:
+    """
+    PS5 输出整形：PS5 聊天框每秒能显示的行数有限，大房间刷屏时普通弹幕会把 SC、大航海挤掉
+    事件按类型进入优先级通道（SC > 大航海 > 礼物 > 弹幕），每个通道有自己的令牌桶（SHAPER_RATE_*），
+    所有通道再共用一个总令牌桶（SHAPER_TOTAL_RATE），每一轮按优先级从高到低放行
+    SC、大航海只排队不丢弃；礼物、弹幕排队超过 MAX_DELAY 秒就不再显示，
+    计入 "+N" 汇总行，每 SHAPER_SUMMARY_INTERVAL 秒发一次
+    """
+    PRIORITY = (EVENT_SC, EVENT_GUARD, EVENT_GIFT, EVENT_DANMAKU)
+    RATE_KEYS = {EVENT_SC: "SHAPER_RATE_SC", EVENT_GUARD: "SHAPER_RATE_GUARD",
+                 EVENT_GIFT: "SHAPER_RATE_GIFT", EVENT_DANMAKU: "SHAPER_RATE_DANMAKU"}
+    LANE_NAMES = {EVENT_GIFT: "个礼物", EVENT_DANMAKU: "条弹幕"}   # 可汇总的通道
+    TICK = 0.05         # 放行间隔（秒）
+    MAX_DELAY = 2.0     # 礼物、弹幕最多排队这么久，再晚显示已经没有意义
+
+    def __init__(self, irc_server):
+        self.irc = irc_server
+        self.lanes = {kind: deque() for kind in self.PRIORITY}     # kind -> deque[(入队时间, 事件)]
+        self.buckets = {kind: TokenBucket() for kind in self.PRIORITY}
+        self.total = TokenBucket()
+        self.passed = dict.fromkeys(self.PRIORITY, 0)
+        self.suppressed = dict.fromkeys(self.PRIORITY, 0)
+        self._unreported = dict.fromkeys(self.LANE_NAMES, 0)
+        self.summaries = 0
+        self._last_summary = time.monotonic()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(CONFIG.get("OUTPUT_SHAPER", False))
+
+    def _apply_rates(self):
+        for kind, key in self.RATE_KEYS.items():
+            self.buckets[kind].set_rate(CONFIG.get(key, 0))
+        self.total.set_rate(CONFIG.get("SHAPER_TOTAL_RATE", 8))
+
+    def offer(self, events: list):
+        """事件按类型放入优先级通道，由整形任务按速率放行（不等待）"""
+        now = time.monotonic()
+        lanes = self.lanes
+        for event in events:
+            lanes[event.kind].append((now, event))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+
+    def _pending(self) -> int:
+        return sum(len(q) for q in self.lanes.values())
+
+    def _expire(self, now: float):
+        deadline = now - self.MAX_DELAY
+        for kind in self.LANE_NAMES:
+            q = self.lanes[kind]
+            while q and q[0][0] < deadline:
+                q.popleft()
+                self.suppressed[kind] += 1
+                self._unreported[kind] += 1
+
+    def _release(self, now: float) -> list:
+        self._apply_rates()
+        total = self.total
+        total.refill(now)
+        released = []
+        for kind in self.PRIORITY:
+            q = self.lanes[kind]
+            bucket = self.buckets[kind]
+            bucket.refill(now)
+            while q and bucket.ready() and total.ready():
+                bucket.take()
+                total.take()
+                released.append(q.popleft()[1])
+        for event in released:
+            self.passed[event.kind] += 1
+        return released
+
+    def _summary_line(self) -> str:
+        parts = [f"+{n} {self.LANE_NAMES[kind]}" for kind, n in self._unreported.items() if n]
+        return self.irc._privmsg("bilibili", f"{'、'.join(parts)}（刷屏中未显示）")
+
+    async def _run(self):
+        """整形任务：每 TICK 秒按令牌放行一轮，有未显示的消息时定期发汇总行"""
+        while True:
+            now = time.monotonic()
+            if not self.enabled:
+                # 关闭整形时把排队中的事件按优先级一次放出
+                released = [e for kind in self.PRIORITY for _, e in self.lanes[kind]]
+                for q in self.lanes.values():
+                    q.clear()
+            else:
+                self._expire(now)
+                released = self._release(now)
+            try:
+                if released:
+                    await self.irc.send_events(released)
+                interval = CONFIG.get("SHAPER_SUMMARY_INTERVAL", 5)
+                if any(self._unreported.values()) and now - self._last_summary >= interval:
+                    await self.irc.send_lines([self._summary_line()])
+                    self._unreported = dict.fromkeys(self.LANE_NAMES, 0)
+                    self._last_summary = now
+                    self.summaries += 1
+            except Exception as e:
+                logger.error(f"输出整形放行失败: {e}")
+
+            if self._pending():
+                await asyncio.sleep(self.TICK)
+            elif any(self._unreported.values()):
+                # 没有排队的事件，但还有待汇总的数量：等到下一次汇总时间（有新事件提前唤醒）
+                self._wakeup.clear()
+                wait = self._last_summary + CONFIG.get("SHAPER_SUMMARY_INTERVAL", 5) - time.monotonic()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), max(wait, self.TICK))
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+    def reset_stats(self):
+        self.passed = dict.fromkeys(self.PRIORITY, 0)
+        self.suppressed = dict.fromkeys(self.PRIORITY, 0)
+        self.summaries = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "total_rate": CONFIG.get("SHAPER_TOTAL_RATE", 8),
+            "summaries": self.summaries,
+            "lanes": [{
+                "lane": EVENT_TYPE_NAMES[kind],
+                "rate": CONFIG.get(self.RATE_KEYS[kind], 0),
+                "pending": len(self.lanes[kind]),
+                "passed": self.passed[kind],
+                "suppressed": self.suppressed[kind],
+            } for kind in self.PRIORITY],
+        }
+
+
+# ==================== 刷屏合并 ====================
+_SPAM_SPACE_RE = re.compile(r'\s+')
+_SPAM_REPEAT_RE = re.compile(r'(.)\1{2,}')
+
+
+class SpamAggregator:
+    """
+    刷屏合并：SPAM_AGGREGATE_MS 毫秒窗口内相同的弹幕只转发第一条，
+    窗口结束时累计达到 MIN_SUMMARY 次再以 bilibili 的名义发一行汇总（如 "666 ×42"），
+    只重复一两次的不补发；Web 弹幕列表只保留首条并显示累计次数
+    相同的判断先做归一化：全角转半角（NFKC）、忽略大小写和空白、
+    连续3个以上相同字符按3个算（"6666" 和 "666" 视为相同）；不同直播间的弹幕分开统计
+    """
+
+    MIN_SUMMARY = 3     # 累计次数（含首条）达到这个数才补发汇总行
+
+    def __init__(self, irc_server):
+        self.irc = irc_server
+        self._windows: Dict[tuple, list] = {}   # (直播间, 归一化文本) -> [首条事件, 次数]
+        self._deadlines = deque()               # (窗口结束时间, 键)，窗口等长，入队顺序即结束顺序
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.first = 0          # 窗口内首条（直接转发）
+        self.merged = 0         # 被合并的重复弹幕
+        self.summaries = 0      # 发出的 "×N" 汇总行
+
+    @property
+    def window(self) -> float:
+        return max(0, CONFIG.get("SPAM_AGGREGATE_MS", 0)) / 1000
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        text = _SPAM_SPACE_RE.sub('', unicodedata.normalize('NFKC', text).casefold())
+        return _SPAM_REPEAT_RE.sub(r'\1\1\1', text)
+
+    def merge(self, key: tuple) -> bool:
+        """窗口内已有相同弹幕时计数并返回 True（调用方不再转发）"""
+        w = self._windows.get(key)
+        if w is None:
+            return False
+        w[1] += 1
+        w[0].num = w[1]
+        self.merged += 1
+        return True
+
+    def track(self, key: tuple, event: LiveEvent):
+        """转发的首条弹幕开一个合并窗口"""
+        self._windows[key] = [event, 1]
+        self._deadlines.append((time.monotonic() + self.window, key))
+        self.first += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+
+    def expire(self, now: float) -> list:
+        """关闭到期的窗口，返回需要发送的汇总事件"""
+        summaries = []
+        deadlines = self._deadlines
+        while deadlines and deadlines[0][0] <= now:
+            _, key = deadlines.popleft()
+            first, count = self._windows.pop(key)
+            if count >= self.MIN_SUMMARY:
+                summaries.append(LiveEvent(EVENT_DANMAKU, "bilibili", text=f"{first.text} ×{count}",
+                                           room=first.room))
+        self.summaries += len(summaries)
+        return summaries
+
+    def pending(self) -> int:
+        return len(self._windows)
+
+    async def _run(self):
+        """汇总任务：等到最早的窗口结束，把汇总行放入事件队列"""
+        while True:
+            if not self._deadlines:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            delay = self._deadlines[0][0] - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            summaries = self.expire(time.monotonic())
+            if summaries:
+                try:
+                    await self.irc.enqueue(summaries)
+                except Exception as e:
+                    logger.error(f"发送刷屏汇总失败: {e}")
+
+    def reset_stats(self):
+        self.first = self.merged = self.summaries = 0
+
+    def snapshot(self) -> dict:
+        raw = self.first + self.merged
+        forwarded = self.first + self.summaries
+        return {
+            "window_ms": int(self.window * 1000),
+            "raw": raw,
+            "forwarded": forwarded,
+            "merged": self.merged,
+            "summaries": self.summaries,
+            "open_windows": len(self._windows),
+            "ratio": round(raw / forwarded, 2) if forwarded else 0,
+        }
+
+
 # ==================== IRC 服务端 ====================
 class IRCClient:
+    """
+    一个IRC连接（PS5 或调试用IRC客户端）
+    转发的消息先进入本连接自己的发送队列，由独立的写入任务写出：
+    某个客户端写得慢只会让它自己的队列变长，不会拖慢其他客户端；
+    队列超过 IRC_CLIENT_QUEUE_SIZE 行时丢弃其中最旧的弹幕（礼物、大航海、SC 不丢）
+    写入任务按 IRC_FLUSH_WINDOW_MS / IRC_FLUSH_BYTES 合并：刷屏时多行合成一次 write，
+    空闲时第一行最多多等一个窗口
+    """
+    WRITE_BATCH = 500   # 写入任务一次最多写出的行数
+
     def __init__(self, reader, writer, server):
         self.reader = reader
         self.writer = writer
@@ -836,6 +2158,21 @@ class IRCClient:
         self.last_active = time.time()
         self.auto_joined = False
         self.is_alive = True
+        self.outbox = deque()                 # (可丢弃, 编码后的行)
+        self._outbox_bytes = 0
+        self._pending_since = 0.0             # 当前积压中最早一行的入队时间
+        self._outbox_ready = asyncio.Event()
+        self._outbox_space = asyncio.Event()
+        self._outbox_space.set()
+        self._flush_now = asyncio.Event()     # 积压达到 IRC_FLUSH_BYTES，提前结束合并窗口
+        self._write_task = None
+        self.sent = 0
+        self.dropped = 0
+        self.high_water = 0
+        self.flushes = 0
+        self.flush_delay_total = 0.0
+        self.flush_delay_max = 0.0
+        self.connected_at = time.time()
         ACTIVE_CONNECTIONS.add(str(self.peername))
         logger.info(f"PS5 连接建立: {self.peername}")
 
@@ -852,14 +2189,130 @@ class IRCClient:
     def _mark_dead(self):
         self.is_alive = False
         ACTIVE_CONNECTIONS.discard(str(self.peername))
+        self.server.members.discard(self)
+        # 唤醒写入任务和等待队列空位的分发任务，让它们看到连接已断开
+        self._outbox_ready.set()
+        self._outbox_space.set()
+        self._flush_now.set()
+
+    @staticmethod
+    def _outbox_limit() -> int:
+        return max(1, int(CONFIG.get("IRC_CLIENT_QUEUE_SIZE", 1000)))
+
+    def push(self, items: list, bounded: bool = True):
+        """
+        把 (可丢弃, 编码后的行) 放入发送队列，不等待写出
+        bounded=False 时不做溢出丢弃（block 策略下由调用方先 wait_writable）
+        """
+        if not self.is_alive:
+            return
+        outbox = self.outbox
+        if not outbox:
+            self._pending_since = time.monotonic()
+        limit = self._outbox_limit()
+        size = self._outbox_bytes
+        for droppable, line in items:
+            if bounded and len(outbox) >= limit:
+                for i, (old_droppable, old_line) in enumerate(outbox):
+                    if old_droppable:
+                        del outbox[i]
+                        size -= len(old_line)
+                        self.dropped += 1
+                        break
+                else:
+                    if droppable:
+                        # 队列里全是不可丢弃的消息，只能丢掉这条新弹幕
+                        self.dropped += 1
+                        continue
+            outbox.append((droppable, line))
+            size += len(line)
+        self._outbox_bytes = size
+        if len(outbox) > self.high_water:
+            self.high_water = len(outbox)
+        if outbox:
+            self._outbox_ready.set()
+            if size >= CONFIG.get("IRC_FLUSH_BYTES", 8192):
+                self._flush_now.set()
+
+    async def wait_writable(self):
+        """等待发送队列低于上限（只在 block 策略下使用）"""
+        limit = self._outbox_limit()
+        while self.is_alive and len(self.outbox) >= limit:
+            self._outbox_space.clear()
+            await self._outbox_space.wait()
+
+    async def _write_loop(self):
+        """写入任务：等待合并窗口结束（或积压达到字节阈值）后，把积压的行合并为一次写入"""
+        outbox = self.outbox
+        while self.is_alive:
+            if not outbox:
+                self._outbox_ready.clear()
+                await self._outbox_ready.wait()
+                continue
+            window = CONFIG.get("IRC_FLUSH_WINDOW_MS", 10) / 1000
+            if window > 0 and self._outbox_bytes < CONFIG.get("IRC_FLUSH_BYTES", 8192):
+                delay = self._pending_since + window - time.monotonic()
+                if delay > 0:
+                    self._flush_now.clear()
+                    try:
+                        await asyncio.wait_for(self._flush_now.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    if not outbox:
+                        continue
+            now = time.monotonic()
+            n = min(len(outbox), self.WRITE_BATCH)
+            lines = [outbox.popleft()[1] for _ in range(n)]
+            payload = b"".join(lines)
+            self._outbox_bytes -= len(payload)
+            delay = now - self._pending_since
+            self._pending_since = now
+            self._outbox_space.set()
+            self.flushes += 1
+            self.flush_delay_total += delay
+            if delay > self.flush_delay_max:
+                self.flush_delay_max = delay
+            await self._write_payload(payload)
+            self.sent += n
+
+    def snapshot(self) -> dict:
+        return {
+            "peer": f"{self.peername[0]}:{self.peername[1]}" if isinstance(self.peername, tuple)
+                    else str(self.peername),
+            "nick": self.nick,
+            "joined": self.auto_joined,
+            "depth": len(self.outbox),
+            "maxsize": self._outbox_limit(),
+            "high_water": self.high_water,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "lines_per_flush": round(self.sent / self.flushes, 1) if self.flushes else 0,
+            "avg_flush_delay_ms": round(self.flush_delay_total / self.flushes * 1000, 2) if self.flushes else 0,
+            "max_flush_delay_ms": round(self.flush_delay_max * 1000, 2),
+            "connected_for": int(time.time() - self.connected_at),
+        }
+
+    def reset_stats(self):
+        self.sent = self.dropped = self.flushes = 0
+        self.flush_delay_total = self.flush_delay_max = 0.0
+        self.high_water = len(self.outbox)
 
     async def send_safe(self, data: str):
+        await self.send_lines([data])
+
+    async def send_lines(self, lines: list):
+        """批量发送多行：合并为一次 write + 一次 drain，保持原有顺序"""
+        if not lines:
+            return
+        payload = "".join(line if line.endswith("\r\n") else line + "\r\n" for line in lines)
+        await self._write_payload(payload.encode('utf-8'))
+
+    async def _write_payload(self, payload: bytes):
         if not self.check_alive():
             return
-        if not data.endswith("\r\n"):
-            data += "\r\n"
         try:
-            self.writer.write(data.encode('utf-8'))
+            self.writer.write(payload)
             await self.writer.drain()
             self.last_active = time.time()
         except Exception as e:
@@ -870,11 +2323,11 @@ class IRCClient:
         if self.auto_joined or not self.check_alive():
             return
         target = f"#{CONFIG['TWITCH_CHANNEL']}"
-        self.server.clients[target] = self
         await self.send_safe(f":{self.nick}!{self.nick}@tmi.twitch.tv JOIN {target}")
         await self.send_safe(f":tmi.twitch.tv 353 {self.nick} = {target} :{self.nick}")
         await self.send_safe(f":tmi.twitch.tv 366 {self.nick} {target} :End of /NAMES list")
         self.auto_joined = True
+        self.server.members.add(self)
         logger.info(f"PS5({self.peername}) 已加入频道 {target}")
 
     async def handle_line(self, line: str):
@@ -955,6 +2408,7 @@ class IRCClient:
             self._mark_dead()
 
     async def run(self):
+        self._write_task = asyncio.create_task(self._write_loop())
         try:
             while self.check_alive():
                 try:
@@ -971,6 +2425,7 @@ class IRCClient:
             logger.error(f"PS5({self.peername}) 连接异常: {e}")
         finally:
             self._mark_dead()
+            self._write_task.cancel()
             try:
                 self.writer.close()
                 await self.writer.wait_closed()
@@ -981,10 +2436,20 @@ class IRCClient:
 
 class IRCServer:
     def __init__(self):
-        self.clients: Dict[str, IRCClient] = {}
+        self.members: Set[IRCClient] = set()      # 已加入频道的客户端，转发消息发给其中每一个
+        self.reconnect_policy = ReconnectPolicy("IRC 服务")
+        self.room_prefixes: Dict[int, str] = {}   # 直播间 -> 消息前缀（多直播间时区分来源）
+        self.queue = EventQueue()
+        self.shaper = OutputShaper(self)
+        self.aggregator = SpamAggregator(self)
+        self._dispatcher = None
+        self._loop = None                 # start() 所在的事件循环，供 Web 线程提交配置变更
 
     async def start(self):
         global IRC_RUNNING
+        self._loop = asyncio.get_running_loop()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch_loop())
         while True:
             try:
                 server = await asyncio.start_server(
@@ -995,65 +2460,138 @@ class IRCServer:
                     reuse_port=True
                 )
                 IRC_RUNNING = True
+                self.reconnect_policy.on_connected()
                 _add_web_log("info", f"IRC 服务已启动: {CONFIG['IRC_HOST']}:{CONFIG['IRC_PORT']}")
                 logger.info(f"IRC 服务已启动: {CONFIG['IRC_HOST']}:{CONFIG['IRC_PORT']}")
                 async with server:
                     await server.serve_forever()
-            except OSError as e:
-                if "address already in use" in str(e).lower():
-                    logger.warning(f"IRC 端口 {CONFIG['IRC_PORT']} 已被占用，等待 5 秒后重试...")
-                    _add_web_log("warning", f"IRC 端口占用，5 秒后重试")
-                    await asyncio.sleep(5)
-                    continue
-                else:
-                    IRC_RUNNING = False
-                    logger.error(f"IRC 服务异常: {e}，{CONFIG['RECONNECT_DELAY']}秒后重试")
-                    _add_web_log("error", f"IRC 服务异常: {e}，{CONFIG['RECONNECT_DELAY']}秒后重试")
-                    await asyncio.sleep(CONFIG["RECONNECT_DELAY"])
             except Exception as e:
                 IRC_RUNNING = False
-                logger.error(f"IRC 服务异常: {e}，{CONFIG['RECONNECT_DELAY']}秒后重试")
-                _add_web_log("error", f"IRC 服务异常: {e}，{CONFIG['RECONNECT_DELAY']}秒后重试")
-                await asyncio.sleep(CONFIG["RECONNECT_DELAY"])
+                self.reconnect_policy.on_failure(e)
+                delay = self.reconnect_policy.next_delay()
+                if isinstance(e, OSError) and "address already in use" in str(e).lower():
+                    logger.warning(f"IRC 端口 {CONFIG['IRC_PORT']} 已被占用，{delay:.1f} 秒后重试...")
+                    _add_web_log("warning", f"IRC 端口占用，{delay:.1f} 秒后重试")
+                else:
+                    logger.error(f"IRC 服务异常: {e}，{delay:.1f}秒后重试")
+                    _add_web_log("error", f"IRC 服务异常: {e}，{delay:.1f}秒后重试")
+                await asyncio.sleep(delay)
 
     async def _handle_client(self, reader, writer):
         client = IRCClient(reader, writer, self)
         await client.run()
 
-    def _get_active_client(self) -> IRCClient | None:
+    def on_config_saved(self):
+        """Web 线程保存配置后调用：在事件循环中重新配置事件队列（asyncio.Event 不是线程安全的）"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self.queue.configure)
+        else:
+            self.queue.configure()
+
+    def _active_clients(self) -> list:
+        return [c for c in list(self.members) if c.check_alive()]
+
+    @staticmethod
+    def _privmsg(user, text: str) -> str:
         target = f"#{CONFIG['TWITCH_CHANNEL']}"
-        c = self.clients.get(target)
-        if c and c.check_alive():
-            return c
-        for c in list(self.clients.values()):
-            if c.check_alive():
-                return c
-        return None
+        safe_user = ''.join(c for c in str(user) if c.isalnum() or c in '_-') or "user"
+        return f":{safe_user}!{safe_user}@tmi.twitch.tv PRIVMSG {target} :{text}"
+
+    @staticmethod
+    def _encode_line(line: str) -> bytes:
+        return (line + "\r\n").encode('utf-8')
+
+    async def fan_out(self, items: list):
+        """
+        把一批 (可丢弃, 编码后的行) 放进每个已加入频道的客户端的发送队列
+        block 策略下等待每个客户端的队列有空位（不丢消息，慢客户端会拖慢分发），其余策略不等待
+        """
+        if not items:
+            return
+        clients = self._active_clients()
+        if not clients:
+            logger.debug("无IRC客户端，跳过弹幕转发")
+            return
+        block = self.queue.policy == "block"
+        for client in clients:
+            if block:
+                await client.wait_writable()
+            client.push(items, bounded=not block)
+
+    async def send_lines(self, lines: list):
+        """把一批IRC消息发给所有已加入频道的客户端（不可丢弃）"""
+        encode = self._encode_line
+        await self.fan_out([(False, encode(line)) for line in lines])
+
+    async def send_events(self, events: list):
+        """把一批事件格式化为IRC消息后发给所有客户端，每条只格式化、编码一次"""
+        if not events:
+            return
+        prefixes = self.room_prefixes
+        encode = self._encode_line
+        if prefixes:
+            await self.fan_out([
+                (e.kind == EVENT_DANMAKU,
+                 encode(self._privmsg(e.user, f"[{prefixes[e.room]}] {e.irc_text()}" if e.room in prefixes
+                                      else e.irc_text())))
+                for e in events])
+        else:
+            await self.fan_out([(e.kind == EVENT_DANMAKU, encode(self._privmsg(e.user, e.irc_text())))
+                                for e in events])
+
+    def client_stats(self) -> list:
+        """每个IRC连接的发送队列状态（按连接时间排序）"""
+        return [c.snapshot() for c in sorted(list(self.members), key=lambda c: c.connected_at)]
 
-    async def broadcast_danmaku(self, user: str, text: str):
+    def reset_client_stats(self):
+        for c in list(self.members):
+            c.reset_stats()
+
+    async def enqueue(self, events: list):
+        """事件放入队列，由分发任务写给PS5（接收循环不等待IRC写入）"""
+        if events:
+            await self.queue.put(events)
+
+    async def _dispatch_loop(self):
+        """分发任务：从事件队列批量取出，放进每个客户端的发送队列（开启输出整形时先交给整形任务）"""
+        while True:
+            events = await self.queue.get_batch()
+            try:
+                if self.shaper.enabled:
+                    self.shaper.offer(events)
+                    continue
+                await self.send_events(events)
+            except Exception as e:
+                logger.error(f"转发事件失败: {e}")
+            await asyncio.sleep(0)  # 让各客户端的写入任务先取走这一批，避免发送队列被连续的批次灌满
+
+    async def _emit(self, event: LiveEvent, batch: list | None):
+        """batch 不为 None 时只收集到批次中，由调用方统一入队"""
+        if batch is not None:
+            batch.append(event)
+        else:
+            await self.enqueue([event])
+
+    async def broadcast_danmaku(self, user: str, text: str, batch: list | None = None, room: int = 0):
         global DANMAKU_COUNT
-        # 先添加到Web显示记录（不依赖IRC连接）
-        now = datetime.now()
-        recent_danmaku_log.appendleft({
-            "type": "danmaku",
-            "user": user,
-            "text": text,
-            "time": now.strftime("%H:%M:%S"),
-            "ts": int(now.timestamp() * 1000)
-        })
         DANMAKU_COUNT += 1
+        aggregator = self.aggregator
+        key = None
+        if aggregator.window > 0:
+            key = (room, aggregator.normalize(text))
+            if aggregator.merge(key):
+                return      # 刷屏中的重复弹幕：只计数，窗口结束时汇总发送
 
-        # 如果有IRC客户端，发送到IRC
-        client = self._get_active_client()
-        if client:
-            target = f"#{CONFIG['TWITCH_CHANNEL']}"
-            safe_user = ''.join(c for c in user if c.isalnum() or c in '_-') or "user"
-            msg = f":{safe_user}!{safe_user}@tmi.twitch.tv PRIVMSG {target} :{text}"
-            await client.send_safe(msg)
-        else:
-            logger.debug("无IRC客户端，跳过弹幕转发")
+        # 先添加到Web显示记录（不依赖IRC连接）
+        event = LiveEvent(EVENT_DANMAKU, user, text=text, room=room)
+        recent_danmaku_log.appendleft(event)
+        if key is not None:
+            aggregator.track(key, event)
 
-    async def broadcast_gift(self, user: str, gift_name: str, num: int, coin_type: str, price: int = 0):
+        await self._emit(event, batch)
+
+    async def broadcast_gift(self, user: str, gift_name: str, num: int, coin_type: str, price: int = 0,
+                             batch: list | None = None, room: int = 0):
         global GIFT_COUNT
         if not CONFIG["ENABLE_GIFT"]:
             return
@@ -1061,165 +2599,466 @@ class IRCServer:
         # 先添加到Web显示记录（不依赖IRC连接）
         display_coin = "电池" if coin_type == "gold" else "银瓜子"
         logger.info(f"礼物 [{user}]: {gift_name}x{num} ({display_coin} {price})")
-        now = datetime.now()
-        recent_gift_log.appendleft({
-            "type": "gift",
-            "user": user, "name": gift_name, "num": num,
-            "coin": display_coin, "price": price,
-            "time": now.strftime("%H:%M:%S"),
-            "ts": int(now.timestamp() * 1000)
-        })
+        event = LiveEvent(EVENT_GIFT, user, name=gift_name, num=num, price=price, coin=display_coin,
+                          room=room)
+        recent_gift_log.appendleft(event)
         GIFT_COUNT += 1
 
-        # 如果有IRC客户端，发送到IRC
-        client = self._get_active_client()
-        if client:
-            target = f"#{CONFIG['TWITCH_CHANNEL']}"
-            safe_user = ''.join(c for c in user if c.isalnum() or c in '_-') or "user"
-            gift_text = f"GIFT {user}: {gift_name}x{num}"
-            msg = f":{safe_user}!{safe_user}@tmi.twitch.tv PRIVMSG {target} :{gift_text}"
-            await client.send_safe(msg)
+        await self._emit(event, batch)
 
-    async def broadcast_guard(self, user: str, guard_level: int, num: int):
+    async def broadcast_guard(self, user: str, guard_level: int, num: int, batch: list | None = None,
+                              room: int = 0):
         global GUARD_COUNT
         if not CONFIG["ENABLE_GIFT"]:
             return
 
         # 先添加到Web显示记录（不依赖IRC连接）
-        guard_names = {1: "总督", 2: "提督", 3: "舰长"}
-        guard_name = guard_names.get(guard_level, "舰长")
+        guard_name = GUARD_NAMES.get(guard_level, "舰长")
         logger.info(f"大航海 [{user}]: {guard_name}x{num}")
-        now = datetime.now()
-        recent_gift_log.appendleft({
-            "type": "guard",
-            "user": user, "name": guard_name, "num": num,
-            "guard_level": guard_level,
-            "coin": "电池", "price": 0,
-            "time": now.strftime("%H:%M:%S"),
-            "ts": int(now.timestamp() * 1000)
-        })
+        event = LiveEvent(EVENT_GUARD, user, name=guard_name, num=num, coin="电池",
+                          guard_level=guard_level, room=room)
+        recent_gift_log.appendleft(event)
         GUARD_COUNT += 1
 
-        # 如果有IRC客户端，发送到IRC
-        client = self._get_active_client()
-        if client:
-            target = f"#{CONFIG['TWITCH_CHANNEL']}"
-            safe_user = ''.join(c for c in user if c.isalnum() or c in '_-') or "user"
-            gift_text = f"GUARD {user} 开通了 {guard_name}x{num}"
-            msg = f":{safe_user}!{safe_user}@tmi.twitch.tv PRIVMSG {target} :{gift_text}"
-            await client.send_safe(msg)
+        await self._emit(event, batch)
 
-    async def broadcast_super_chat(self, user: str, message: str, price: int):
+    async def broadcast_super_chat(self, user: str, message: str, price: int, batch: list | None = None,
+                                   room: int = 0):
         global SC_COUNT
 
         # 先添加到Web显示记录（不依赖IRC连接）
         logger.info(f"SC [{user}] ¥{price}: {message}")
-        now = datetime.now()
-        recent_gift_log.appendleft({
-            "type": "sc",
-            "user": user, "name": "醒目留言", "num": 1,
-            "text": message,
-            "coin": "电池", "price": price,
-            "time": now.strftime("%H:%M:%S"),
-            "ts": int(now.timestamp() * 1000)
-        })
+        event = LiveEvent(EVENT_SC, user, name="醒目留言", text=message, price=price, coin="电池",
+                          room=room)
+        recent_gift_log.appendleft(event)
         SC_COUNT += 1
 
-        # 如果有IRC客户端，发送到IRC
-        client = self._get_active_client()
-        if client:
-            target = f"#{CONFIG['TWITCH_CHANNEL']}"
-            safe_user = ''.join(c for c in user if c.isalnum() or c in '_-') or "user"
-            gift_text = f"SC Y{price} {user}: {message}"
-            msg = f":{safe_user}!{safe_user}@tmi.twitch.tv PRIVMSG {target} :{gift_text}"
-            await client.send_safe(msg)
+        await self._emit(event, batch)
 
 
 # ==================== B站 WebSocket 弹幕/礼物接收 ====================
+DEFAULT_WS_URL = "wss://broadcastlv.chat.bilibili.com/sub"
+
+
+class HostProbe:
+    """
+    弹幕服务器探测：并发探测 host_list 中所有节点的 TCP+TLS 建连耗时并排序
+    多个直播间共用一份探测结果（节点只探测一次），选择节点和失败计数由各直播间自己的 HostSelector 负责
+    """
+    PROBE_TIMEOUT = 3.0
+    PROBE_INTERVAL = 600   # 同一组节点两次探测的最短间隔（秒）
+
+    def __init__(self):
+        self.hosts = {}        # ws_url -> 节点地址和探测结果
+        self.order = []        # 按探测耗时排序的 ws_url
+        self.generation = 0    # 每次探测后加1，HostSelector 据此回到最快的节点
+        self._probed_at = 0.0
+        self._probed_set = frozenset()
+        # 与 ws_connect(ssl=False) 一致：只测握手耗时，不校验证书
+        self._ssl = ssl.create_default_context()
+        self._ssl.check_hostname = False
+        self._ssl.verify_mode = ssl.CERT_NONE
+
+    def update(self, host_list: list) -> list:
+        """合并 getDanmuInfo 返回的 host_list，已知节点保留探测结果；返回本次的 ws_url 列表"""
+        urls = []
+        for h in host_list:
+            host, port = h.get("host"), h.get("wss_port", 443)
+            if not host:
+                continue
+            url = f"wss://{host}:{port}/sub"
+            urls.append(url)
+            if url not in self.hosts:
+                self.hosts[url] = {"host": host, "port": port, "latency_ms": None, "probe_errors": 0,
+                                   "last_error": ""}
+        if urls:
+            # 未探测过的节点保持 host_list 原顺序
+            self.order = [u for u in self.order if u in urls] + [u for u in urls if u not in self.order]
+        return urls
+
+    def need_probe(self) -> bool:
+        return bool(self.order) and (frozenset(self.order) != self._probed_set
+                                     or time.monotonic() - self._probed_at > self.PROBE_INTERVAL)
+
+    async def _probe_one(self, url: str):
+        stats = self.hosts[url]
+        start = time.perf_counter()
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(stats["host"], stats["port"], ssl=self._ssl,
+                                        server_hostname=stats["host"]),
+                self.PROBE_TIMEOUT)
+            stats["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            writer.close()
+        except Exception as e:
+            stats["latency_ms"] = None
+            stats["probe_errors"] += 1
+            stats["last_error"] = str(e) or type(e).__name__
+
+    async def probe(self):
+        """并发探测所有节点并按耗时排序（探测失败的排在最后）"""
+        if not self.order:
+            return
+        await asyncio.gather(*(self._probe_one(u) for u in self.order))
+        self.order.sort(key=lambda u: (self.hosts[u]["latency_ms"] is None,
+                                       self.hosts[u]["latency_ms"] or 0))
+        self._probed_at = time.monotonic()
+        self._probed_set = frozenset(self.order)
+        self.generation += 1
+        ranking = ", ".join(
+            f"{self.hosts[u]['host']}={self.hosts[u]['latency_ms']}ms" for u in self.order)
+        logger.info(f"弹幕服务器探测结果: {ranking}")
+
+
+class HostSelector:
+    """
+    弹幕服务器选择（每个直播间一个，共用 HostProbe 的探测结果）：连接探测最快的节点，
+    当前节点连续失败 MAX_FAILURES 次后轮换到下一个；一个直播间的失败不影响其他直播间的选择
+    认证成功不算恢复：连接保持不到 STABLE_SECONDS 就断开、或被看门狗判定假死，同样记一次失败
+    """
+    MAX_FAILURES = 2
+    STABLE_SECONDS = 60
+
+    def __init__(self, probe: HostProbe | None = None):
+        self.shared = probe if probe is not None else HostProbe()
+        self.stats = {}        # ws_url -> 本直播间的连接统计
+        self.current = None
+        self._generation = self.shared.generation
+
+    @property
+    def order(self) -> list:
+        return self.shared.order
+
+    def update(self, host_list: list):
+        urls = self.shared.update(host_list)
+        if urls and self.current not in urls:
+            self.current = None
+
+    def need_probe(self) -> bool:
+        return self.shared.need_probe()
+
+    async def probe(self):
+        await self.shared.probe()
+
+    def _stats(self, url: str) -> dict:
+        stats = self.stats.get(url)
+        if stats is None:
+            stats = self.stats[url] = {"connects": 0, "failures": 0, "consecutive_failures": 0}
+        return stats
+
+    def select(self):
+        """返回当前应连接的节点；重新探测后回到最快的节点，当前节点连续失败过多时轮换到下一个"""
+        order = self.shared.order
+        if not order:
+            return None
+        if self._generation != self.shared.generation:
+            self._generation = self.shared.generation
+            self.current = None
+        if self.current in order and self._stats(self.current)["consecutive_failures"] < self.MAX_FAILURES:
+            return self.current
+        start = order.index(self.current) + 1 if self.current in order else 0
+        candidates = order[start:] + order[:start]
+        chosen = next((u for u in candidates
+                       if self._stats(u)["consecutive_failures"] < self.MAX_FAILURES), None)
+        if chosen is None:
+            # 全部节点都失败过，清零后重新轮转
+            for u in order:
+                self._stats(u)["consecutive_failures"] = 0
+            chosen = candidates[0]
+        if self.current is not None and chosen != self.current:
+            hosts = self.shared.hosts
+            logger.warning(f"弹幕服务器 {hosts[self.current]['host']} 连续失败，切换到 "
+                           f"{hosts[chosen]['host']}")
+            _add_web_log("warning", f"弹幕服务器连续失败，切换到 {hosts[chosen]['host']}")
+        self.current = chosen
+        return chosen
+
+    def record_success(self, url: str):
+        """认证成功；连续失败次数要等连接稳定后由 record_disconnect 清零"""
+        if url in self.shared.hosts:
+            self._stats(url)["connects"] += 1
+
+    def record_failure(self, url: str, error):
+        if url in self.shared.hosts:
+            stats = self._stats(url)
+            stats["failures"] += 1
+            stats["consecutive_failures"] += 1
+            stats["last_error"] = str(error) or type(error).__name__
+
+    def record_disconnect(self, url: str, uptime: float, stalled: bool = False):
+        """已认证的连接断开：被看门狗判定假死或保持不到 STABLE_SECONDS 算失败，否则清零连续失败"""
+        if stalled:
+            self.record_failure(url, "连接假死")
+        elif uptime < self.STABLE_SECONDS:
+            self.record_failure(url, f"认证后 {uptime:.0f} 秒断开")
+        elif url in self.shared.hosts:
+            self._stats(url)["consecutive_failures"] = 0
+
+    def snapshot(self) -> list:
+        hosts = self.shared.hosts
+        blank = {"connects": 0, "failures": 0, "consecutive_failures": 0}
+        return [{**hosts[u], **blank, **self.stats.get(u, {}), "url": u, "current": u == self.current}
+                for u in list(self.shared.order)]
+
+
+class BiliAuthError(ConnectionError):
+    """WebSocket认证失败：收到 op=8 之前连接被关闭、超时，或认证回复 code 不为0"""
+
+
+class BiliWSConnection:
+    """一条已完成认证的B站WebSocket连接（含心跳任务；session 仅在未使用共享连接池时自有）"""
+
+    def __init__(self, room_id: int, real_room_id: int, token: str, ws_url: str):
+        self.room_id = room_id
+        self.real_room_id = real_room_id
+        self.token = token
+        self.ws_url = ws_url
+        self.session = None
+        self.ws = None
+        self.hb_task = None
+        self.pending = []   # 认证阶段收到的帧，开始接收后优先处理
+        self.opened_at = time.monotonic()
+        self.stalled = False                # 被看门狗判定假死而主动关闭
+        self.hb_sent_at = 0.0               # 未收到回复的心跳发送时间（perf_counter），0 表示没有等待中的心跳
+        self.last_recv = time.monotonic()   # 最近一次收到帧的时间，看门狗据此判断连接是否假死
+
+    async def close(self):
+        if self.hb_task:
+            self.hb_task.cancel()
+        try:
+            if self.ws is not None:
+                await self.ws.close()
+        finally:
+            if self.session is not None:
+                await self.session.close()
+
+
 class BiliLiveClient:
     HEARTBEAT_INTERVAL = 30
+    WATCHDOG_INTERVAL = 5   # 看门狗检查间隔（秒）
+    AUTH_TIMEOUT = 10   # 等待认证回复（op=8）的秒数
+    BOOTSTRAP_TTL = 3600  # 快速重连时复用 token/服务器地址的最长时间（秒），过期或认证失败则重新获取
+    # 命令 -> 处理方法名；不在表中的命令在预过滤阶段直接跳过JSON解析
+    COMMAND_HANDLERS = {
+        "DANMU_MSG": "_on_danmu_msg",
+        "SEND_GIFT": "_on_send_gift",
+        "GUARD_BUY": "_on_guard_buy",
+        "SUPER_CHAT_MESSAGE": "_on_super_chat",
+        "COMBO_SEND": "_on_combo_send",
+    }
+    HANDLED_COMMANDS = frozenset(COMMAND_HANDLERS)
 
-    def __init__(self, room_id: int, irc_server: IRCServer):
+    def __init__(self, room_id: int, irc_server: IRCServer, primary: bool = True,
+                 probe: HostProbe | None = None):
+        """
+        primary: 主直播间（跟随 BILIBILI_ROOM_ID 切换、更新全局连接状态、负责原始帧录制）；
+        附加直播间由 RoomManager 创建，primary=False
+        probe: 多个直播间共用同一份节点探测结果，节点只探测一次；节点选择和失败计数各直播间独立
+        """
         self.room_id = room_id
+        self.primary = primary
+        self.connected = False
         self.real_room_id = room_id
         self.irc = irc_server
         self.token = ""
-        self.ws_url = "wss://broadcastlv.chat.bilibili.com/sub"
+        self.ws_url = DEFAULT_WS_URL
         self._ws = None
         self._running = False
-        self._seen_danmaku: Set[str] = set()
-        self._seen_gift: Set[str] = set()
+        self._loop = None                 # connect() 所在的事件循环，供 Web 线程提交协程
+        self._switch_lock = asyncio.Lock()
+        self._pending_conn = None         # 先连后断模式下已就绪、等待接管的新连接
+        self._switch_started = 0.0
+        self._switch_swap_at = 0.0        # 旧连接停止接收的时间，收到新连接首帧时计算切换间隙
+        self._switch_mode = ""
+        self._closing_tasks = set()
+        self.last_switch = {}
+        self._bootstrap = None            # (room_id, real_room_id, token, ws_url, 获取时间)
+        self._connect_started = 0.0       # 本次连接开始时间，收到第一条消息时计算耗时
+        self._connect_mode = ""
+        self._has_connected = False
+        self.reconnect_stats = {"fast": 0, "full": 0, "fast_auth_failed": 0,
+                                "last_mode": "", "last_ttfm_ms": None, "avg_ttfm_ms": None}
+        self._ttfm_total = 0.0
+        self._ttfm_count = 0
+        self._seen_danmaku = DedupWindow(CONFIG["MAX_SEEN_DANMAKU"], CONFIG["DEDUP_WINDOW_SECONDS"])
+        self._seen_gift = DedupWindow(CONFIG["MAX_SEEN_GIFT"], CONFIG["DEDUP_WINDOW_SECONDS"])
         self._switch_event = asyncio.Event()  # 用于通知切换房间
+        self._decoder = WSFrameDecoder()
+        self.hosts = HostSelector(probe)
+        self.reconnect_policy = ReconnectPolicy("B站连接" if primary else f"直播间 {room_id}")
+        self.cmd_stats = CommandStats()
+        self.handler_stats = HandlerStats()
+        self._handlers = {cmd: getattr(self, name) for cmd, name in self.COMMAND_HANDLERS.items()}
+        self._recorder = None
+        # 双连接冗余：link 0 = 主连接，link 1 = 备用连接
+        self._backup_conn = None
+        self._redundant = False           # 两条连接都在接收时为 True，此时统计谁先送达
+        self._frame_link = 0              # 当前正在处理的帧来自哪条连接
+        self.backup_policy = ReconnectPolicy("备用连接")
+        self.link_stats = [self._new_link_stats("主连接"), self._new_link_stats("备用连接")]
+        self._conn = None                 # 主连接当前使用的 BiliWSConnection
+        self.popularity = 0
+        self.watchdog_stats = {"heartbeats": 0, "replies": 0, "missed": 0, "stalls": 0}
+        self._rtt_history = deque(maxlen=120)   # 最近的心跳往返时间（秒）
+
+    def apply_dedup_config(self):
+        """配置修改后同步去重窗口的容量和时间"""
+        window = CONFIG.get("DEDUP_WINDOW_SECONDS", 60)
+        self._seen_danmaku.resize(CONFIG["MAX_SEEN_DANMAKU"], window)
+        self._seen_gift.resize(CONFIG["MAX_SEEN_GIFT"], window)
+
+    def dedup_stats(self) -> dict:
+        return {"danmaku": self._seen_danmaku.snapshot(), "gift": self._seen_gift.snapshot()}
+
+    def register_handler(self, cmd: str, handler):
+        """
+        注册/替换命令处理函数
+        handler 为协程函数，签名 handler(data: dict, batch: list | None)；传 None 表示移除
+        """
+        if handler is None:
+            self._handlers.pop(cmd, None)
+        else:
+            self._handlers[cmd] = handler
 
-    def _danmaku_uid(self, info: list) -> str:
+    # 去重键均为 (时间戳, uid, 内容) 等字段元组的64位哈希整数，不再拼接保存整段弹幕文本，
+    # 每条记录占用固定大小；不同类型的键带不同的首元素，避免互相碰撞
+    def _danmaku_uid(self, info: list) -> int:
         try:
             ts = info[0][4] if isinstance(info[0], list) and len(info[0]) > 4 else int(time.time()*1000)
             uid = info[2][0] if len(info) > 2 and isinstance(info[2], list) else 0
             text = info[1] if len(info) > 1 else ''
-            return f"{ts}_{uid}_{text}"
+            return hash((0, ts, uid, text))
         except:
-            return str(time.time())
+            return hash(time.time())
+
+    def _gift_uid(self, data: dict) -> int:
+        return hash((1, data.get('uid'), data.get('giftId'), data.get('timestamp')))
+
+    def _combo_uid(self, data: dict) -> int:
+        return hash((2, data.get('uid'), data.get('gift_id'), data.get('batch_combo_id', '')))
+
+    # 大航海/SC 没有可靠的时间戳或消息 id 时返回 None 不去重，宁可双连接重复转发也不把两次购买合成一次
+    def _guard_uid(self, data: dict) -> int | None:
+        start_time = data.get('start_time')
+        if not start_time:
+            return None
+        return hash((3, data.get('uid'), data.get('guard_level'), start_time, data.get('num'), data.get('price')))
+
+    def _sc_uid(self, data: dict) -> int | None:
+        sc_id, start_time = data.get('id'), data.get('start_time')
+        if not sc_id and not start_time:
+            return None
+        return hash((4, sc_id, data.get('uid'), start_time, data.get('price')))
+
+    def _is_dup(self, window: DedupWindow, key) -> bool:
+        """去重；双连接都在接收时顺带统计每条连接先送达/后送达的次数和落后时间"""
+        if key is None:
+            return False
+        if not self._redundant:
+            return window.seen(key)
+        first_at = window.last_seen(key)
+        stats = self.link_stats[self._frame_link]
+        if window.seen(key):
+            lag = time.monotonic() - first_at
+            stats["behind"] += 1
+            stats["lag_total"] += lag
+            if lag > stats["lag_max"]:
+                stats["lag_max"] = lag
+            return True
+        stats["first"] += 1
+        return False
 
-    def _gift_uid(self, data: dict) -> str:
-        return f"{data.get('uid')}_{data.get('giftId')}_{data.get('timestamp')}"
+    @staticmethod
+    def _new_link_stats(name: str) -> dict:
+        return {"name": name, "first": 0, "behind": 0, "lag_total": 0.0, "lag_max": 0.0, "connects": 0}
+
+    def reset_link_stats(self):
+        for i, stats in enumerate(self.link_stats):
+            self.link_stats[i] = self._new_link_stats(stats["name"])
+
+    def redundancy_stats(self) -> dict:
+        links = []
+        total_first = sum(st["first"] for st in self.link_stats)
+        for st in self.link_stats:
+            links.append({
+                "name": st["name"],
+                "first": st["first"],
+                "behind": st["behind"],
+                "first_rate": round(st["first"] / total_first, 4) if total_first else 0.0,
+                "avg_lag_ms": round(st["lag_total"] / st["behind"] * 1000, 1) if st["behind"] else None,
+                "max_lag_ms": round(st["lag_max"] * 1000, 1),
+                "connects": st["connects"],
+            })
+        return {
+            "enabled": bool(CONFIG.get("REDUNDANT_CONNECTION", False)),
+            "active": self._redundant,
+            "main_url": self.ws_url,
+            "backup_url": self._backup_conn.ws_url if self._backup_conn else "",
+            "links": links,
+        }
 
-    async def _fetch_danmaku_info(self):
+    async def _fetch_danmaku_info(self, room_id: int) -> tuple:
         """
         获取弹幕服务器信息，带降级策略
         参考blivedm的实现
+        返回 (真实房间号, token, ws_url)，不修改当前连接状态，切换房间时可以在旧连接运行期间预先获取
         """
+        real_room_id = room_id
         try:
             # 先获取真实房间号
-            self.real_room_id = await get_real_room_id(self.room_id)
+            real_room_id = await get_real_room_id(room_id)
             
             # 尝试获取弹幕服务器信息和token（带WBI签名）
             sessdata = CONFIG.get("BILIBILI_SESSDATA", "")
-            info = await get_danmaku_server_info(self.real_room_id, sessdata)
+            info = await get_danmaku_server_info(real_room_id, sessdata)
             
             if info:
                 # 成功获取服务器信息
-                self.token = info.get("token", "")
+                token = info.get("token", "")
                 hosts = info.get("host_list", [])
-                if hosts:
-                    host = hosts[0]
-                    self.ws_url = f"wss://{host['host']}:{host['wss_port']}/sub"
-                    logger.info(f"WebSocket 服务器: {self.ws_url}")
-                    logger.info(f"房间ID: {self.real_room_id}")
-                    if self.token:
+                self.hosts.update(hosts)
+                if self.hosts.need_probe():
+                    await self.hosts.probe()
+                ws_url = self.hosts.select()
+                if ws_url:
+                    logger.info(f"WebSocket 服务器: {ws_url}")
+                    logger.info(f"房间ID: {real_room_id}")
+                    if token:
                         logger.info("已获取鉴权Token ✓")
-                    return
+                    return real_room_id, token, ws_url
             
             # 降级：使用默认弹幕服务器
             logger.warning("获取弹幕服务器信息失败，使用默认服务器（降级模式）")
-            self.ws_url = "wss://broadcastlv.chat.bilibili.com/sub"
-            self.token = ""
-            logger.info(f"WebSocket 服务器: {self.ws_url} (降级)")
-            logger.info(f"房间ID: {self.real_room_id}")
+            logger.info(f"WebSocket 服务器: {DEFAULT_WS_URL} (降级)")
+            logger.info(f"房间ID: {real_room_id}")
             
         except Exception as e:
             logger.error(f"获取弹幕服务器信息失败: {e}")
             # 降级处理
-            self.ws_url = "wss://broadcastlv.chat.bilibili.com/sub"
-            self.token = ""
             logger.info("使用默认服务器继续连接")
+        return real_room_id, "", DEFAULT_WS_URL
 
-    def _build_auth_packet(self) -> bytes:
+    def _build_auth_packet(self, real_room_id: int | None = None, token: str | None = None) -> bytes:
         """
         构建认证包
         参考blivedm的实现，添加buvid参数，使用protover=3
         """
+        if real_room_id is None:
+            real_room_id = self.real_room_id
+        if token is None:
+            token = self.token
         uid = CONFIG.get("BILIBILI_UID", 0)
         auth_params = {
             "uid": uid,
-            "roomid": self.real_room_id,
+            "roomid": real_room_id,
             "protover": 3,  # 使用协议版本3
             "platform": "web",
             "type": 2,
         }
         
         # 如果有token，添加到参数中
-        if self.token:
-            auth_params["key"] = self.token
+        if token:
+            auth_params["key"] = token
         
         # 添加buvid（如果有的话）
         # buvid通常通过访问B站主页获取，这里先留空
@@ -1230,179 +3069,308 @@ class BiliLiveClient:
             # 实际项目中应该先访问B站主页获取buvid3 cookie
             auth_params["buvid"] = ""
         
-        auth_body = json.dumps(auth_params, ensure_ascii=False)
-        return pack_ws_message(WS_OP_USER_AUTH, auth_body.encode('utf-8'))
+        return pack_ws_message(WS_OP_USER_AUTH, json_dumps_bytes(auth_params))
 
     def _build_heartbeat_packet(self) -> bytes:
         return pack_ws_message(WS_OP_HEARTBEAT, b'[object Object]', WS_VER_HEARTBEAT)
 
-    async def _send_heartbeat(self, ws):
-        while self._running:
+    async def _send_heartbeat(self, conn: BiliWSConnection):
+        """
+        每 HEARTBEAT_INTERVAL 秒发送心跳，同时充当看门狗：
+        超过 WS_STALL_TIMEOUT 秒既没有心跳回复也没有任何消息时主动关闭连接（半开TCP连接 aiohttp 可能很久才发现），
+        接收循环随即退出并按重连策略重连
+        """
+        ws = conn.ws
+        stats = self.watchdog_stats
+        next_hb = 0.0
+        while not ws.closed:
             try:
-                await ws.send_bytes(self._build_heartbeat_packet())
-                await asyncio.sleep(self.HEARTBEAT_INTERVAL)
+                now = time.monotonic()
+                if now >= next_hb:
+                    if conn.hb_sent_at:
+                        stats["missed"] += 1
+                    await ws.send_bytes(self._build_heartbeat_packet())
+                    conn.hb_sent_at = time.perf_counter()
+                    stats["heartbeats"] += 1
+                    next_hb = now + self.HEARTBEAT_INTERVAL
+                stall_timeout = CONFIG.get("WS_STALL_TIMEOUT", 70)
+                silent = now - conn.last_recv
+                if stall_timeout > 0 and silent > stall_timeout:
+                    stats["stalls"] += 1
+                    logger.warning(f"B站连接 {silent:.0f} 秒没有收到心跳回复或消息，判定连接假死，主动重连")
+                    _add_web_log("warning", f"B站连接 {silent:.0f} 秒无响应，主动重连")
+                    conn.stalled = True
+                    await ws.close()
+                    break
+                await asyncio.sleep(min(self.WATCHDOG_INTERVAL, max(0.0, next_hb - now)))
             except Exception as e:
                 logger.debug(f"心跳发送失败: {e}")
                 break
 
-    async def _handle_message(self, cmd: str, data: dict):
+    def _record_disconnect(self, conn: BiliWSConnection):
+        """连接意外断开（不含切换/停止），计入所用节点的失败统计"""
+        self.hosts.record_disconnect(conn.ws_url, time.monotonic() - conn.opened_at, conn.stalled)
+
+    def _on_heartbeat_reply(self, conn: BiliWSConnection | None):
+        if conn is None or not conn.hb_sent_at:
+            return
+        rtt = time.perf_counter() - conn.hb_sent_at
+        conn.hb_sent_at = 0.0
+        self.watchdog_stats["replies"] += 1
+        self._rtt_history.append(rtt)
+
+    def reset_watchdog_stats(self):
+        self.watchdog_stats = dict.fromkeys(self.watchdog_stats, 0)
+        self._rtt_history.clear()
+
+    def watchdog_snapshot(self) -> dict:
+        rtts = sorted(self._rtt_history)
+        n = len(rtts)
+        conn = self._conn
+        return {
+            **self.watchdog_stats,
+            "stall_timeout": CONFIG.get("WS_STALL_TIMEOUT", 70),
+            "silent_s": round(time.monotonic() - conn.last_recv, 1) if conn else None,
+            "popularity": self.popularity,
+            "rtt_samples": n,
+            "last_rtt_ms": round(self._rtt_history[-1] * 1000, 1) if n else None,
+            "avg_rtt_ms": round(sum(rtts) / n * 1000, 1) if n else None,
+            "p95_rtt_ms": round(rtts[min(n - 1, int(n * 0.95))] * 1000, 1) if n else None,
+            "max_rtt_ms": round(rtts[-1] * 1000, 1) if n else None,
+        }
+
+    def _set_running(self, running: bool):
+        """更新本连接状态；只有主直播间同步全局 WS_RUNNING"""
         global WS_RUNNING
-        WS_RUNNING = True
+        self.connected = running
+        if self.primary:
+            WS_RUNNING = running
 
-        if cmd == "DANMU_MSG":
-            info = data.get("info", [])
-            if len(info) < 2:
-                logger.debug(f"DANMU_MSG数据不完整: {len(info)}")
-                return
-            uid_key = self._danmaku_uid(info)
-            if uid_key in self._seen_danmaku:
-                logger.debug(f"弹幕已去重: {uid_key}")
-                return
-            self._seen_danmaku.add(uid_key)
-            if len(self._seen_danmaku) > CONFIG["MAX_SEEN_DANMAKU"]:
-                self._seen_danmaku = set(list(self._seen_danmaku)[-int(CONFIG["MAX_SEEN_DANMAKU"] * 0.8):])
-            try:
-                text = info[1]
-                user = info[2][1] if isinstance(info[2], list) and len(info[2]) > 1 else "未知"
-                logger.info(f"收到弹幕: [{user}] {text}")
-                await self.irc.broadcast_danmaku(user, text)
-            except Exception as e:
-                logger.error(f"解析弹幕失败: {e}，数据: {data}")
+    async def _handle_message(self, cmd: str, data: dict, batch: list | None = None):
+        if not self.connected:
+            self._set_running(True)
 
-        elif cmd == "SEND_GIFT":
-            d = data.get("data", {})
-            uid_key = self._gift_uid(d)
-            if uid_key in self._seen_gift:
-                logger.debug(f"礼物已去重: {uid_key}")
-                return
-            self._seen_gift.add(uid_key)
-            if len(self._seen_gift) > CONFIG["MAX_SEEN_GIFT"]:
-                self._seen_gift = set(list(self._seen_gift)[-int(CONFIG["MAX_SEEN_GIFT"] * 0.8):])
-            # 尝试获取用户昵称：优先用uname，如果没有尝试uid
-            user = d.get("uname")
-            if not user or str(user).startswith("bili_"):
-                # 如果uname为空或看起来像UID，尝试从其他字段获取
-                user = d.get("uid", "未知")
-            gift_name = d.get("giftName", d.get("gift_name", "礼物"))
-            num = d.get("num", 1)
-            coin_type = d.get("coin_type", "silver")
-            price = d.get("total_coin", 0)
-            logger.info(f"收到礼物: [{user}] {gift_name}x{num}")
-            await self.irc.broadcast_gift(user, gift_name, num, coin_type, price)
-
-        elif cmd == "GUARD_BUY":
-            d = data.get("data", {})
-            user = d.get("username", "未知")
-            guard_level = d.get("guard_level", 3)
-            num = d.get("num", 1)
-            await self.irc.broadcast_guard(user, guard_level, num)
-
-        elif cmd == "SUPER_CHAT_MESSAGE":
-            d = data.get("data", {})
-            user = d.get("user_info", {}).get("uname", "未知")
-            message = d.get("message", "")
-            price = d.get("price", 0)
-            await self.irc.broadcast_super_chat(user, message, price)
-
-        elif cmd == "COMBO_SEND":
-            d = data.get("data", {})
-            user = d.get("uname", "未知")
-            gift_name = d.get("gift_name", "礼物")
-            combo_num = d.get("combo_num", 1)
-            coin_type = d.get("coin_type", "silver")
-            uid_key = f"combo_{d.get('uid')}_{d.get('gift_id')}_{d.get('batch_combo_id', '')}"
-            if uid_key in self._seen_gift:
-                return
-            self._seen_gift.add(uid_key)
-            await self.irc.broadcast_gift(user, gift_name, combo_num, coin_type, 0)
+        handler = self._handlers.get(cmd)
+        if handler is None:
+            return
+        t0 = time.perf_counter()
+        try:
+            await handler(data, batch)
+        finally:
+            self.handler_stats.record(cmd, time.perf_counter() - t0)
+
+    async def _on_danmu_msg(self, data: dict, batch: list | None):
+        info = data.get("info", [])
+        if len(info) < 2:
+            logger.debug(f"DANMU_MSG数据不完整: {len(info)}")
+            return
+        if self._is_dup(self._seen_danmaku, self._danmaku_uid(info)):
+            logger.debug(f"弹幕已去重: {info[1]}")
+            return
+        try:
+            text = info[1]
+            user = info[2][1] if isinstance(info[2], list) and len(info[2]) > 1 else "未知"
+            logger.info(f"收到弹幕: [{user}] {text}")
+            await self.irc.broadcast_danmaku(user, text, batch, self.room_id)
+        except Exception as e:
+            logger.error(f"解析弹幕失败: {e}，数据: {data}")
+
+    async def _on_send_gift(self, data: dict, batch: list | None):
+        d = data.get("data", {})
+        if self._is_dup(self._seen_gift, self._gift_uid(d)):
+            logger.debug(f"礼物已去重: {d.get('uid')} {d.get('giftName')} {d.get('timestamp')}")
+            return
+        # 尝试获取用户昵称：优先用uname，如果没有尝试uid
+        user = d.get("uname")
+        if not user or str(user).startswith("bili_"):
+            # 如果uname为空或看起来像UID，尝试从其他字段获取
+            user = d.get("uid", "未知")
+        gift_name = d.get("giftName", d.get("gift_name", "礼物"))
+        num = d.get("num", 1)
+        coin_type = d.get("coin_type", "silver")
+        price = d.get("total_coin", 0)
+        logger.info(f"收到礼物: [{user}] {gift_name}x{num}")
+        await self.irc.broadcast_gift(user, gift_name, num, coin_type, price, batch, self.room_id)
+
+    async def _on_guard_buy(self, data: dict, batch: list | None):
+        d = data.get("data", {})
+        if self._is_dup(self._seen_gift, self._guard_uid(d)):
+            return
+        user = d.get("username", "未知")
+        guard_level = d.get("guard_level", 3)
+        num = d.get("num", 1)
+        await self.irc.broadcast_guard(user, guard_level, num, batch, self.room_id)
+
+    async def _on_super_chat(self, data: dict, batch: list | None):
+        d = data.get("data", {})
+        if self._is_dup(self._seen_gift, self._sc_uid(d)):
+            return
+        user = d.get("user_info", {}).get("uname", "未知")
+        message = d.get("message", "")
+        price = d.get("price", 0)
+        await self.irc.broadcast_super_chat(user, message, price, batch, self.room_id)
+
+    async def _on_combo_send(self, data: dict, batch: list | None):
+        d = data.get("data", {})
+        user = d.get("uname", "未知")
+        gift_name = d.get("gift_name", "礼物")
+        combo_num = d.get("combo_num", 1)
+        coin_type = d.get("coin_type", "silver")
+        if self._is_dup(self._seen_gift, self._combo_uid(d)):
+            return
+        await self.irc.broadcast_gift(user, gift_name, combo_num, coin_type, 0, batch, self.room_id)
+
+    def _start_capture(self):
+        """按配置开启原始帧录制（整个 connect 生命周期内只打开一次）"""
+        path = CONFIG.get("WS_CAPTURE_FILE", "")
+        if not path or not self.primary or self._recorder is not None:
+            return
+        recorder = WSFrameRecorder(path, bool(CONFIG.get("WS_CAPTURE_COMPRESS", False)))
+        try:
+            recorder.open()
+        except Exception as e:
+            logger.error(f"打开录制文件失败: {e}")
+            return
+        self._recorder = recorder
+        _add_web_log("info", f"WebSocket 原始帧录制中: {recorder.path}")
 
     async def connect(self):
-        global WS_RUNNING, NEED_RECONNECT, NEW_ROOM_ID
+        self._loop = asyncio.get_running_loop()
+        backup_task = asyncio.create_task(self._backup_loop())
+        try:
+            self._start_capture()
+            await self._connect_loop()
+        finally:
+            backup_task.cancel()
+            await asyncio.gather(backup_task, return_exceptions=True)
+            if self._recorder is not None:
+                self._recorder.close()
+                self._recorder = None
+
+    def _backup_url(self) -> str:
+        """备用连接优先选探测最快、且与主连接不同的节点"""
+        for url in self.hosts.order:
+            if url != self.ws_url:
+                return url
+        return DEFAULT_WS_URL if self.ws_url != DEFAULT_WS_URL else self.ws_url
+
+    def _drop_backup(self):
+        """房间切换后关闭备用连接，_backup_loop 会用新房间重新建立"""
+        conn = self._backup_conn
+        if conn is not None:
+            task = asyncio.create_task(conn.close())
+            self._closing_tasks.add(task)
+            task.add_done_callback(self._closing_tasks.discard)
+
+    async def _backup_loop(self):
+        """
+        双连接冗余（REDUNDANT_CONNECTION）：在另一个节点上保持同一直播间的第二条已认证连接，
+        两条连接收到的帧都走 _process_ws_data，由去重窗口合并；主连接断开重连期间备用连接继续转发
+        只在主连接正常接收时新建备用连接（此时房间号和 token 都是最新的），建好后独立运行
+        """
+        policy = self.backup_policy
+        while True:
+            if not CONFIG.get("REDUNDANT_CONNECTION", False) or not self._running:
+                await asyncio.sleep(1)
+                continue
+            room_id = self.room_id
+            url = self._backup_url()
+            try:
+                conn = await self._open_connection(room_id, self.real_room_id, self.token, url)
+            except Exception as e:
+                policy.on_failure(e)
+                delay = max(1.0, policy.next_delay())
+                logger.warning(f"备用连接建立失败: {e}，{delay:.1f} 秒后重试")
+                await asyncio.sleep(delay)
+                continue
+            self._backup_conn = conn
+            self._redundant = True
+            self.link_stats[1]["connects"] += 1
+            policy.on_connected()
+            logger.info(f"备用连接已建立: {url}")
+            _add_web_log("info", f"双连接冗余已启用，备用节点: {url}")
+            error = None
+            try:
+                frames, conn.pending = conn.pending, []
+                for frame in frames:
+                    await self._process_ws_data(frame, 1)
+                while CONFIG.get("REDUNDANT_CONNECTION", False) and room_id == self.room_id:
+                    msg = await conn.ws.receive()
+                    if msg.type != aiohttp.WSMsgType.BINARY:
+                        break
+                    if room_id != self.room_id:
+                        break
+                    conn.last_recv = time.monotonic()
+                    await self._process_ws_data(msg.data, 1)
+            except Exception as e:
+                error = e
+            finally:
+                self._redundant = False
+                self._backup_conn = None
+                await conn.close()
+            if room_id != self.room_id or not CONFIG.get("REDUNDANT_CONNECTION", False):
+                continue
+            self._record_disconnect(conn)
+            policy.on_failure(error)
+            delay = policy.next_delay()
+            logger.warning(f"备用连接断开，{delay:.1f} 秒后重连")
+            await asyncio.sleep(delay)
+
+    async def _connect_loop(self):
+        global NEED_RECONNECT, NEW_ROOM_ID
+        carry_start = 0.0   # 快速重连认证失败后转完整流程时，首条消息耗时从第一次尝试算起
         while True:
             # 检查是否需要切换房间
-            if NEED_RECONNECT and NEW_ROOM_ID is not None:
+            if self.primary and NEED_RECONNECT and NEW_ROOM_ID is not None:
                 await self.switch_room(NEW_ROOM_ID)
                 NEED_RECONNECT = False
                 NEW_ROOM_ID = None
 
-            WS_RUNNING = False
+            self._set_running(False)
+            switched = False
             try:
-                await self._fetch_danmaku_info()
-                _add_web_log("info", f"正在连接 B站直播间 {self.real_room_id}...")
-                logger.info(f"连接 B站直播间 {self.real_room_id}...")
-
-                conn_timeout = aiohttp.ClientTimeout(total=20)
-                headers = {
-                    "User-Agent": CONFIG["USER_AGENT"],
-                    "Origin": "https://live.bilibili.com",
-                    "Referer": f"https://live.bilibili.com/{self.room_id}",
-                    "Accept-Encoding": "gzip, deflate, br",
-                    "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
-                    "Sec-WebSocket-Extensions": "permessage-deflate; client_max_window_bits",
-                }
-                
-                # 构建完整的Cookie
-                cookies = {}
-                sessdata = CONFIG.get("BILIBILI_SESSDATA", "")
-                if sessdata:
-                    cookies["SESSDATA"] = sessdata
-                    bili_jct = CONFIG.get("BILIBILI_BILI_JCT", "")
-                    if bili_jct:
-                        cookies["bili_jct"] = bili_jct
-                    cookies["DedeUserID"] = str(CONFIG.get("BILIBILI_UID", 0))
-                    cookies["DedeUserID__ckMd5"] = "00000000000000000000000000000000"
-                    cookies["innersign"] = "0"
-
-                async with aiohttp.ClientSession(headers=headers, cookies=cookies) as session:
-                    async with session.ws_connect(
-                        self.ws_url,
-                        ssl=False,
-                        heartbeat=None,
-                        timeout=conn_timeout
-                    ) as ws:
-                        self._ws = ws
-                        self._running = True
-                        WS_RUNNING = True
-
-                        await ws.send_bytes(self._build_auth_packet())
-                        logger.info("已发送认证包，等待服务器响应...")
-                        _add_web_log("info", "已发送认证包，等待服务器响应...")
-
-                        hb_task = asyncio.create_task(self._send_heartbeat(ws))
-                        try:
-                            while True:
-                                # 同时等待消息和切换事件
-                                msg_task = asyncio.create_task(ws.receive())
-                                switch_task = asyncio.create_task(self._switch_event.wait())
-
-                                done, pending = await asyncio.wait(
-                                    [msg_task, switch_task],
-                                    return_when=asyncio.FIRST_COMPLETED
-                                )
-
-                                # 取消未完成的任务
-                                for task in pending:
-                                    task.cancel()
-
-                                # 检查切换事件是否触发
-                                if self._switch_event.is_set():
-                                    logger.info("检测到房间切换请求，断开当前连接")
-                                    _add_web_log("info", "正在切换直播间，断开当前连接...")
-                                    self._switch_event.clear()
-                                    break
-
-                                # 处理WebSocket消息
-                                msg = msg_task.result()
-                                if msg.type == aiohttp.WSMsgType.BINARY:
-                                    await self._process_ws_data(msg.data)
-                                elif msg.type == aiohttp.WSMsgType.ERROR:
-                                    logger.error(f"WebSocket 错误: {ws.exception()}")
-                                    break
-                                elif msg.type == aiohttp.WSMsgType.CLOSED:
-                                    break
-                        finally:
-                            hb_task.cancel()
-                            self._running = False
+                # 切换房间时预先建好的连接如果还没被接管（旧连接已断开），直接使用
+                conn = self._take_pending_conn()
+                if conn is None:
+                    self._connect_started = carry_start or time.perf_counter()
+                    carry_start = 0.0
+                    bootstrap = self._valid_bootstrap()
+                    if bootstrap is not None:
+                        # 快速重连：复用上次获取的 token 和服务器地址，跳过房间号查询和 getDanmuInfo
+                        self._connect_mode = "fast"
+                        real_room_id, token, ws_url = bootstrap
+                        logger.info(f"快速重连 B站直播间 {real_room_id}（复用 token）...")
+                        _add_web_log("info", f"快速重连 B站直播间 {real_room_id}...")
+                    else:
+                        self._connect_mode = "full" if self._has_connected else "initial"
+                        with risk_control_scope() as risk_hits:
+                            real_room_id, token, ws_url = await self._fetch_danmaku_info(self.room_id)
+                        self.reconnect_policy.on_risk_control(risk_hits[0] > 0)
+                        _add_web_log("info", f"正在连接 B站直播间 {real_room_id}...")
+                        logger.info(f"连接 B站直播间 {real_room_id}...")
+                    # 节点连续失败后 select() 会轮换，快速重连也使用轮换后的节点
+                    ws_url = self.hosts.select() or ws_url
+                    self.real_room_id, self.token, self.ws_url = real_room_id, token, ws_url
+                    try:
+                        conn = await self._open_connection(self.room_id, real_room_id, token, ws_url)
+                    except BiliAuthError as e:
+                        if bootstrap is None:
+                            raise
+                        # 缓存的 token 已失效，立即走完整流程
+                        self._bootstrap = None
+                        carry_start = self._connect_started
+                        self.reconnect_stats["fast_auth_failed"] += 1
+                        logger.warning(f"复用 token 认证失败，重新获取弹幕服务器信息: {e}")
+                        _add_web_log("warning", "复用 token 认证失败，重新获取弹幕服务器信息")
+                        continue
+                    if token:
+                        self._bootstrap = (self.room_id, real_room_id, token, ws_url, time.monotonic())
+                    if self._connect_mode != "initial":
+                        self.reconnect_stats[self._connect_mode] += 1
+                    self._has_connected = True
+                self.reconnect_policy.on_connected()
+                switched = await self._serve(conn)
+                error = None
 
             except asyncio.CancelledError:
                 break
@@ -1411,60 +3379,448 @@ class BiliLiveClient:
                 logger.error(f"WebSocket 连接失败: {e}")
                 logger.error(f"错误详情: {traceback.format_exc()}")
                 _add_web_log("error", f"WebSocket 连接失败: {e}")
+                error = e
+
+            self._set_running(False)
+            if switched or self._pending_conn is not None:
+                # 房间切换引起的断开，立即连接新房间；风控熔断中与普通重连一样等冷却结束
+                if self._pending_conn is None and self.reconnect_policy.state == "open":
+                    delay = self.reconnect_policy.next_delay()
+                    logger.warning(f"风控熔断中，{delay:.0f} 秒后再连接新直播间")
+                    _add_web_log("warning", f"风控熔断中，{delay:.0f} 秒后再连接新直播间")
+                    await asyncio.sleep(delay)
+                continue
+            self.reconnect_policy.on_failure(error)
+            delay = self.reconnect_policy.next_delay()
+            if self.reconnect_policy.state == "open":
+                logger.warning(f"风控熔断中，{delay:.0f} 秒后再尝试连接")
+                _add_web_log("warning", f"风控熔断中，{delay:.0f} 秒后再尝试连接")
+            elif delay > 0:
+                logger.info(f"{delay:.1f} 秒后重连（第 {self.reconnect_policy.attempts} 次重试）...")
+                _add_web_log("warning", f"{delay:.1f} 秒后重新连接...")
+            else:
+                logger.info("立即重连...")
+                _add_web_log("warning", "连接断开，立即重新连接...")
+            await asyncio.sleep(delay)
+
+    def _valid_bootstrap(self):
+        """返回可复用的 (real_room_id, token, ws_url)；房间已变化或超过 BOOTSTRAP_TTL 时返回 None"""
+        b = self._bootstrap
+        if b is None or b[0] != self.room_id or time.monotonic() - b[4] > self.BOOTSTRAP_TTL:
+            return None
+        return b[1], b[2], b[3]
+
+    def _on_first_message(self):
+        """连接建立后收到第一条消息：记录从开始连接到首条消息的耗时"""
+        ttfm_ms = (time.perf_counter() - self._connect_started) * 1000
+        self._connect_started = 0.0
+        stats = self.reconnect_stats
+        stats["last_mode"] = self._connect_mode
+        stats["last_ttfm_ms"] = round(ttfm_ms, 1)
+        if self._connect_mode != "initial":
+            self._ttfm_total += ttfm_ms
+            self._ttfm_count += 1
+            stats["avg_ttfm_ms"] = round(self._ttfm_total / self._ttfm_count, 1)
+        mode_name = {"fast": "快速重连", "full": "完整重连", "initial": "首次连接"}.get(self._connect_mode, "连接")
+        logger.info(f"{mode_name}完成，首条消息耗时 {ttfm_ms:.0f} ms")
+        _add_web_log("info", f"{mode_name}完成，首条消息耗时 {ttfm_ms:.0f} ms")
+
+    async def _open_connection(self, room_id: int, real_room_id: int, token: str,
+                               ws_url: str) -> BiliWSConnection:
+        """建立WebSocket连接、发送认证包并等待认证成功（op=8），期间不影响当前正在使用的连接"""
+        conn = BiliWSConnection(room_id, real_room_id, token, ws_url)
+        conn_timeout = aiohttp.ClientTimeout(total=20)
+        headers = {
+            "User-Agent": CONFIG["USER_AGENT"],
+            "Origin": "https://live.bilibili.com",
+            "Referer": f"https://live.bilibili.com/{room_id}",
+            "Accept-Encoding": "gzip, deflate, br",
+            "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
+            "Sec-WebSocket-Extensions": "permessage-deflate; client_max_window_bits",
+        }
+        
+        # 构建完整的Cookie
+        cookies = {}
+        sessdata = CONFIG.get("BILIBILI_SESSDATA", "")
+        if sessdata:
+            cookies["SESSDATA"] = sessdata
+            bili_jct = CONFIG.get("BILIBILI_BILI_JCT", "")
+            if bili_jct:
+                cookies["bili_jct"] = bili_jct
+            cookies["DedeUserID"] = str(CONFIG.get("BILIBILI_UID", 0))
+            cookies["DedeUserID__ckMd5"] = "00000000000000000000000000000000"
+            cookies["innersign"] = "0"
+        if cookies:
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in cookies.items())
+
+        # 优先走共享的 WebSocket 专用连接池（不限连接数，不和短请求抢名额），不可用时使用自有 session
+        session = bili_http.shared_ws()
+        if session is None:
+            conn.session = session = aiohttp.ClientSession()
+        try:
+            conn.ws = await session.ws_connect(
+                ws_url,
+                headers=headers,
+                ssl=False,
+                heartbeat=None,
+                timeout=conn_timeout
+            )
+            await conn.ws.send_bytes(self._build_auth_packet(real_room_id, token))
+            logger.info("已发送认证包，等待服务器响应...")
+            _add_web_log("info", "已发送认证包，等待服务器响应...")
+            conn.hb_task = asyncio.create_task(self._send_heartbeat(conn))
+
+            deadline = time.monotonic() + self.AUTH_TIMEOUT
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise BiliAuthError("等待认证回复超时")
+                try:
+                    msg = await asyncio.wait_for(conn.ws.receive(), remaining)
+                except asyncio.TimeoutError:
+                    raise BiliAuthError("等待认证回复超时")
+                if msg.type != aiohttp.WSMsgType.BINARY:
+                    raise BiliAuthError(f"认证阶段连接被关闭: {msg.type.name}")
+                conn.pending.append(msg.data)
+                conn.last_recv = time.monotonic()
+                if len(msg.data) >= _WS_HEADER.size and \
+                        _WS_HEADER.unpack_from(msg.data)[3] == WS_OP_CONNECT_SUCCESS:
+                    header_len = _WS_HEADER.unpack_from(msg.data)[1]
+                    try:
+                        code = json_loads(msg.data[header_len:]).get("code", 0)
+                    except (ValueError, AttributeError):
+                        code = 0
+                    if code != 0:
+                        raise BiliAuthError(f"认证失败: code={code}")
+                    self.hosts.record_success(ws_url)
+                    return conn
+        except BaseException as e:
+            await conn.close()
+            if isinstance(e, Exception) and not isinstance(e, BiliAuthError):
+                self.hosts.record_failure(ws_url, e)
+            raise
+
+    def _take_pending_conn(self):
+        """接管预先建好的新连接，同步房间信息并清空去重记录"""
+        conn = self._pending_conn
+        if conn is None:
+            return None
+        self._pending_conn = None
+        self._switch_event.clear()
+        self.room_id = conn.room_id
+        self.real_room_id = conn.real_room_id
+        self.token = conn.token
+        self.ws_url = conn.ws_url
+        self._connect_started = 0.0
+        if conn.token:
+            self._bootstrap = (conn.room_id, conn.real_room_id, conn.token, conn.ws_url, time.monotonic())
+        self._seen_danmaku.clear()
+        self._seen_gift.clear()
+        self._drop_backup()
+        return conn
+
+    def _on_switch_first_frame(self):
+        """新直播间收到第一条消息（op=5，认证回复和心跳回复不算）：记录切换间隙"""
+        gap_ms = (time.perf_counter() - self._switch_swap_at) * 1000
+        self._switch_swap_at = 0.0
+        self.last_switch["gap_ms"] = round(gap_ms, 1)
+        if self._switch_mode == "make_before_break":
+            msg = (f"直播间切换完成: {self.room_id}，准备 {self.last_switch['prepare_ms']:.0f} ms"
+                   f"（期间旧直播间继续转发），切换间隙 {gap_ms:.0f} ms")
+        else:
+            msg = f"直播间切换完成: {self.room_id}，断开后重连，切换间隙 {gap_ms:.0f} ms"
+        logger.info(msg)
+        _add_web_log("success", msg)
 
-            WS_RUNNING = False
-            logger.info(f"{CONFIG['RECONNECT_DELAY']} 秒后重连...")
-            _add_web_log("warning", f"{CONFIG['RECONNECT_DELAY']} 秒后重新连接...")
-            await asyncio.sleep(CONFIG["RECONNECT_DELAY"])
-
-    async def switch_room(self, new_room_id: int):
-        """切换到新的直播间"""
-        logger.info(f"准备切换直播间: {self.room_id} -> {new_room_id}")
-        _add_web_log("info", f"正在切换直播间: {self.room_id} -> {new_room_id}")
-
-        # 先获取真实的房间ID
-        real_room_id = await get_real_room_id(new_room_id)
+    async def _read_loop(self, conn: BiliWSConnection):
+        """
+        长驻接收循环：逐帧读取、解码，事件放入IRC事件队列后立即读下一帧
+        连接关闭或出错时返回；房间切换时由 _serve 取消
+        """
+        frames, conn.pending = conn.pending, []
+        for frame in frames:
+            await self._on_ws_frame(frame)
+        ws = conn.ws
+        while True:
+            msg = await ws.receive()
+            if msg.type == aiohttp.WSMsgType.BINARY:
+                conn.last_recv = time.monotonic()
+                await self._on_ws_frame(msg.data)
+            elif msg.type == aiohttp.WSMsgType.ERROR:
+                logger.error(f"WebSocket 错误: {ws.exception()}")
+                return
+            elif msg.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSING,
+                              aiohttp.WSMsgType.CLOSED):
+                return
 
-        self.room_id = new_room_id
-        self.real_room_id = real_room_id
+    async def _serve(self, conn: BiliWSConnection) -> bool:
+        """
+        在连接上运行接收循环；切换房间时就地换成已认证的新连接，再关闭旧连接
+        每条连接只创建一个接收任务，等待的是 接收任务结束 / 切换事件 二者之一
+        返回 True 表示因先断后连的房间切换而退出，调用方应立即重连
+        """
+        self._ws = conn.ws
+        self._conn = conn
+        self._running = True
+        self._set_running(True)
+        self.link_stats[0]["connects"] += 1
+        switch_task = asyncio.create_task(self._switch_event.wait())
+        read_task = None
+        try:
+            while True:
+                read_task = asyncio.create_task(self._read_loop(conn))
+                await asyncio.wait([read_task, switch_task], return_when=asyncio.FIRST_COMPLETED)
+                if not switch_task.done():
+                    self._record_disconnect(conn)
+                    read_task.result()   # 连接已关闭；接收循环中的异常交给 _connect_loop 处理
+                    break
 
-        # 更新全局配置中的房间ID
-        global CONFIG
-        CONFIG["BILIBILI_ROOM_ID"] = new_room_id
+                # 切换事件触发：停止接收旧连接
+                read_task.cancel()
+                await asyncio.gather(read_task, return_exceptions=True)
+                new_conn = self._take_pending_conn()
+                if new_conn is None:
+                    logger.info("检测到房间切换请求，断开当前连接")
+                    _add_web_log("info", "正在切换直播间，断开当前连接...")
+                    self._switch_event.clear()
+                    self._switch_swap_at = time.perf_counter()
+                    return True
+                old_conn, conn = conn, new_conn
+                self._switch_swap_at = time.perf_counter()
+                self._ws = conn.ws
+                self._conn = conn
+                # 旧连接的关闭握手放到后台，不阻塞新连接的接收
+                task = asyncio.create_task(old_conn.close())
+                self._closing_tasks.add(task)
+                task.add_done_callback(self._closing_tasks.discard)
+                switch_task = asyncio.create_task(self._switch_event.wait())
+        finally:
+            switch_task.cancel()
+            if read_task is not None and not read_task.done():
+                read_task.cancel()
+                await asyncio.gather(read_task, return_exceptions=True)
+            self._running = False
+            self._ws = None
+            self._conn = None
+            await conn.close()
+        return False
 
-        logger.info(f"真实房间ID: {real_room_id}")
-        _add_web_log("info", f"真实房间ID: {real_room_id}")
+    async def _on_ws_frame(self, data: bytes):
+        if (self._switch_swap_at or self._connect_started) and len(data) >= _WS_HEADER.size \
+                and _WS_HEADER.unpack_from(data)[3] == WS_OP_MESSAGE:
+            # 预连接缓冲的帧里第一帧是认证回复(op=8)，切换间隙要从新直播间的第一条消息算起
+            if self._switch_swap_at:
+                self._on_switch_first_frame()
+            if self._connect_started:
+                self._on_first_message()
+        if self._recorder is not None:
+            self._recorder.write(data)
+        await self._process_ws_data(data)
 
-        # 清空已见弹幕/礼物记录，避免去重问题
-        self._seen_danmaku.clear()
-        self._seen_gift.clear()
-        # 触发切换事件，通知WebSocket循环中断
-        self._switch_event.set()
-        logger.info(f"直播间已切换为: {new_room_id} (真实ID: {real_room_id})，等待WebSocket断开...")
+    async def switch_room(self, new_room_id: int):
+        """
+        切换到新的直播间
+        SWITCH_MAKE_BEFORE_BREAK 开启且当前已连接时，先在第二条连接上完成新房间的认证，
+        再接管并关闭旧连接；预连接失败或未开启时退回先断后连
+        """
+        async with self._switch_lock:
+            logger.info(f"准备切换直播间: {self.room_id} -> {new_room_id}")
+            _add_web_log("info", f"正在切换直播间: {self.room_id} -> {new_room_id}")
+            started = time.perf_counter()
+
+            # 更新全局配置中的房间ID
+            global CONFIG
+            CONFIG["BILIBILI_ROOM_ID"] = new_room_id
+
+            policy = self.reconnect_policy
+            if self._running and CONFIG.get("SWITCH_MAKE_BEFORE_BREAK", True) and policy.state == "open":
+                # 风控熔断中不预连接，改为先断后连，由 _connect_loop 等冷却结束后再请求B站接口
+                logger.warning("风控熔断中，跳过预连接，断开后等待冷却结束再连接新直播间")
+                _add_web_log("warning", "风控熔断中，断开后等待冷却结束再连接新直播间")
+            elif self._running and CONFIG.get("SWITCH_MAKE_BEFORE_BREAK", True):
+                conn = None
+                # 与 _connect_loop 相同：预连接期间触发的风控计入本连接的熔断统计
+                with risk_control_scope() as risk_hits:
+                    try:
+                        real_room_id, token, ws_url = await self._fetch_danmaku_info(new_room_id)
+                        logger.info(f"真实房间ID: {real_room_id}")
+                        _add_web_log("info", f"真实房间ID: {real_room_id}，旧直播间保持转发，正在预连接...")
+                        conn = await self._open_connection(new_room_id, real_room_id, token, ws_url)
+                    except Exception as e:
+                        logger.warning(f"预连接新直播间失败，改为断开后重连: {e}")
+                        _add_web_log("warning", f"预连接新直播间失败，改为断开后重连: {e}")
+                policy.on_risk_control(risk_hits[0] > 0)
+                if conn is not None:
+                    if self._pending_conn is not None:
+                        await self._pending_conn.close()
+                    self._pending_conn = conn
+                    self._switch_mode = "make_before_break"
+                    self.last_switch = {
+                        "room_id": new_room_id,
+                        "mode": self._switch_mode,
+                        "prepare_ms": round((time.perf_counter() - started) * 1000, 1),
+                        "gap_ms": None,
+                    }
+                    # 通知接收循环接管新连接
+                    self._switch_event.set()
+                    logger.info(f"新直播间已就绪: {new_room_id} (真实ID: {real_room_id})，正在接管...")
+                    return
 
-    async def _process_ws_data(self, data: bytes):
+            # 先断后连：先获取真实的房间ID（熔断中不请求，重连时再获取）
+            real_room_id = new_room_id
+            if policy.state != "open":
+                with risk_control_scope() as risk_hits:
+                    real_room_id = await get_real_room_id(new_room_id)
+                if risk_hits[0]:
+                    policy.on_risk_control(True)
+            if self._pending_conn is not None:
+                await self._pending_conn.close()
+                self._pending_conn = None
+
+            self.room_id = new_room_id
+            self.real_room_id = real_room_id
+
+            logger.info(f"真实房间ID: {real_room_id}")
+            _add_web_log("info", f"真实房间ID: {real_room_id}")
+
+            # 清空已见弹幕/礼物记录，避免去重问题
+            self._seen_danmaku.clear()
+            self._seen_gift.clear()
+            self._drop_backup()
+            self._switch_mode = "break_before_make"
+            self.last_switch = {"room_id": new_room_id, "mode": self._switch_mode,
+                                "prepare_ms": 0.0, "gap_ms": None}
+            # 触发切换事件，通知WebSocket循环中断
+            self._switch_event.set()
+            logger.info(f"直播间已切换为: {new_room_id} (真实ID: {real_room_id})，等待WebSocket断开...")
+
+    async def _process_ws_data(self, data: bytes, link: int = 0):
+        # 同一帧解出的所有事件收集成一批，最后一次性放入IRC事件队列
+        # 处理函数在收集批次时不会让出事件循环，_frame_link 在本帧处理期间不会被另一条连接改写
+        self._frame_link = link
+        batch = []
+        debug = logger.isEnabledFor(logging.DEBUG)
         try:
-            packets = unpack_ws_messages(data)
-            for op, ver, body in packets:
+            for op, ver, body in self._decoder.iter_packets(data):
                 if op == WS_OP_CONNECT_SUCCESS:
+                    if link:
+                        continue
                     logger.info("✓ B站 WebSocket 连接成功，开始接收消息")
                     _add_web_log("success", "✓ B站连接成功，开始接收弹幕和礼物")
                 elif op == WS_OP_HEARTBEAT_REPLY:
+                    self._on_heartbeat_reply(self._backup_conn if link else self._conn)
                     if len(body) >= 4:
-                        popularity = struct.unpack('>I', body[:4])[0]
-                        logger.debug(f"直播间人气: {popularity}")
+                        self.popularity = struct.unpack_from('>I', body)[0]
+                        if debug:
+                            logger.debug(f"直播间人气: {self.popularity}")
                 elif op == WS_OP_MESSAGE:
-                    jsons = decode_ws_body(ver, body)
-                    for j in jsons:
-                        cmd = j.get("cmd", "")
-                        if cmd:
-                            # 调试日志：显示收到的命令
-                            if cmd not in ["HEARTBEAT_REPLY", "ONLINE_RANK_COUNT", "WATCHED_CHANGE"]:
-                                logger.debug(f"收到命令: {cmd}")
-                            await self._handle_message(cmd, j)
+                    if not body:
+                        continue
+                    # 快速路径：没有处理函数的命令不做完整JSON解析
+                    peeked = peek_ws_cmd(body)
+                    if peeked is not None and peeked not in self._handlers:
+                        self.cmd_stats.record_skipped(peeked, len(body))
+                        continue
+                    try:
+                        j = json_loads(body)
+                    except Exception as e:
+                        logger.debug(f"解码消息失败: {e}")
+                        continue
+                    cmd = j.get("cmd", "")
+                    if cmd:
+                        self.cmd_stats.record_parsed(cmd)
+                        # 调试日志：显示收到的命令
+                        if debug and cmd not in ("HEARTBEAT_REPLY", "ONLINE_RANK_COUNT", "WATCHED_CHANGE"):
+                            logger.debug(f"收到命令: {cmd}")
+                        await self._handle_message(cmd, j, batch)
         except Exception as e:
             logger.error(f"处理 WebSocket 数据失败: {e}")
             _add_web_log("error", f"处理数据失败: {e}")
+        if batch:
+            await self.irc.enqueue(batch)
+
+
+class RoomManager:
+    """
+    多直播间（联播）：在同一个事件循环上并发运行多个 BiliLiveClient，
+    共用 bili_http 连接池、wbi_signer 和节点探测结果，各自维护节点选择和去重窗口，事件带上直播间号后合并到同一 IRC 输出
+    主直播间 = BILIBILI_ROOM_ID（支持切换），附加直播间 = EXTRA_ROOM_IDS
+    """
+    STARTUP_STAGGER = 0.2   # 附加直播间依次错开启动（秒），避免同时请求 getDanmuInfo 触发风控
+
+    def __init__(self, irc_server: IRCServer):
+        self.irc = irc_server
+        self.probe = HostProbe()
+        self.primary = BiliLiveClient(CONFIG["BILIBILI_ROOM_ID"], irc_server, probe=self.probe)
+        self.extras: Dict[int, BiliLiveClient] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._loop = None
+
+    def clients(self) -> list:
+        return [self.primary, *self.extras.values()]
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self.apply_config()
+        try:
+            await self.primary.connect()
+        finally:
+            await self.close()
+
+    def apply_config(self):
+        """按 EXTRA_ROOM_IDS / ROOM_PREFIXES 增删附加直播间（在事件循环线程中调用）"""
+        self.irc.room_prefixes = parse_room_prefixes(CONFIG.get("ROOM_PREFIXES", {}))
+        primary_id = CONFIG.get("BILIBILI_ROOM_ID", self.primary.room_id)
+        wanted = [rid for rid in parse_room_ids(CONFIG.get("EXTRA_ROOM_IDS", []))
+                  if rid != primary_id]
+        for rid in [rid for rid in self.extras if rid not in wanted]:
+            self.extras.pop(rid)
+            self._tasks.pop(rid).cancel()
+            logger.info(f"停止监听附加直播间: {rid}")
+            _add_web_log("info", f"停止监听附加直播间: {rid}")
+        new_ids = [rid for rid in wanted if rid not in self.extras]
+        for i, rid in enumerate(new_ids):
+            client = BiliLiveClient(rid, self.irc, primary=False, probe=self.probe)
+            self.extras[rid] = client
+            self._tasks[rid] = asyncio.create_task(self._run_extra(client, i * self.STARTUP_STAGGER))
+        if new_ids:
+            logger.info(f"开始监听附加直播间: {', '.join(map(str, new_ids))}")
+            _add_web_log("info", f"开始监听附加直播间: {', '.join(map(str, new_ids))}")
+
+    async def _run_extra(self, client: BiliLiveClient, delay: float):
+        if delay:
+            await asyncio.sleep(delay)
+        await client.connect()
+
+    def _apply_saved_config(self):
+        for client in self.clients():
+            client.apply_dedup_config()
+        self.apply_config()
+
+    def on_config_saved(self):
+        """
+        Web 线程保存配置后调用：在事件循环中同步去重窗口并增删直播间
+        （去重窗口的 OrderedDict 由接收循环读写，不能在 Web 线程中修改）
+        """
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._apply_saved_config)
+        else:
+            for client in self.clients():
+                client.apply_dedup_config()
+
+    async def close(self):
+        tasks = list(self._tasks.values())
+        self.extras.clear()
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def snapshot(self) -> list:
+        prefixes = self.irc.room_prefixes
+        return [{"room_id": c.room_id, "real_room_id": c.real_room_id, "primary": c.primary,
+                 "connected": c.connected, "prefix": prefixes.get(c.room_id, "")}
+                for c in self.clients()]
 
 
 # ==================== Web 控制台 HTML ====================
@@ -1716,6 +4072,14 @@ body{background:linear-gradient(135deg,#0d1117 0%,#161b22 50%,#0d1117 100%);min-
         <div id="room-history" style="margin-top:5px;font-size:.8rem;color:#8b949e;max-height:100px;overflow-y:auto"></div>
         <button class="btn btn-secondary btn-sm" onclick="clearRoomHistory()" style="margin-top:5px;width:100%"><i class="fas fa-trash-alt"></i> 清空历史记录</button>
       </div>
+      <div class="form-group">
+        <label><i class="fas fa-stream"></i> 同时监听的其他直播间（联播，多个用逗号分隔，留空则只监听上面的直播间）</label>
+        <input type="text" id="EXTRA_ROOM_IDS" value="{{ EXTRA_ROOM_IDS }}" placeholder="例如: 1234, 5678">
+      </div>
+      <div class="form-group">
+        <label><i class="fas fa-tv"></i> 直播间消息前缀（可选，格式 直播间:前缀，多个用逗号分隔）</label>
+        <input type="text" id="ROOM_PREFIXES" value="{{ ROOM_PREFIXES }}" placeholder="例如: 732:主, 1234:副">
+      </div>
       <div class="form-group">
         <label><i class="fas fa-gamepad"></i> PS5 Twitch频道名（用于识别PS5设备）</label>
         <input type="text" id="TWITCH_CHANNEL" value="{{ TWITCH_CHANNEL }}" placeholder="例如: icenoproblem">
@@ -1732,14 +4096,30 @@ body{background:linear-gradient(135deg,#0d1117 0%,#161b22 50%,#0d1117 100%);min-
         <label><i class="fas fa-gift"></i> 最多保留礼物数量（超过后会自动清理）</label>
         <input type="number" id="MAX_SEEN_GIFT" value="{{ MAX_SEEN_GIFT }}" placeholder="默认: 500">
       </div>
+      <div class="form-group">
+        <label><i class="fas fa-history"></i> 去重时间窗口（秒，窗口内重复的弹幕/礼物只转发一次）</label>
+        <input type="number" id="DEDUP_WINDOW_SECONDS" value="{{ DEDUP_WINDOW_SECONDS }}" placeholder="默认: 60">
+      </div>
       <div class="form-group">
         <label><i class="fas fa-terminal"></i> 最多保留日志数量（超过后会自动清理）</label>
         <input type="number" id="MAX_LOG_ITEMS" value="{{ MAX_LOG_ITEMS }}" placeholder="默认: 50">
       </div>
       <div class="form-group">
-        <label><i class="fas fa-redo"></i> 重连延迟时间（秒，B站连接断开后的等待时间）</label>
+        <label><i class="fas fa-redo"></i> 重连基础延迟（秒，断开后立即重试一次，之后按指数退避随机等待）</label>
         <input type="number" id="RECONNECT_DELAY" value="{{ RECONNECT_DELAY }}" placeholder="默认: 5">
       </div>
+      <div class="form-group">
+        <label><i class="fas fa-exclamation-circle"></i> 连接假死判定时间（秒，超过这么久没有心跳回复或消息则主动重连，0=不检测）</label>
+        <input type="number" id="WS_STALL_TIMEOUT" value="{{ WS_STALL_TIMEOUT }}" placeholder="默认: 70">
+      </div>
+      <div class="form-group">
+        <label><i class="fas fa-clock"></i> 重连最大延迟（秒）</label>
+        <input type="number" id="RECONNECT_MAX_DELAY" value="{{ RECONNECT_MAX_DELAY }}" placeholder="默认: 60">
+      </div>
+      <div class="form-group">
+        <label><i class="fas fa-exclamation-triangle"></i> 风控熔断时间（秒，连续触发 -352 后暂停重连）</label>
+        <input type="number" id="RISK_CONTROL_COOLDOWN" value="{{ RISK_CONTROL_COOLDOWN }}" placeholder="默认: 300">
+      </div>
       <div class="toggle-row">
         <div class="toggle">
           <input type="checkbox" id="ENABLE_GIFT" {{ 'checked' if ENABLE_GIFT else '' }}>
@@ -1747,6 +4127,44 @@ body{background:linear-gradient(135deg,#0d1117 0%,#161b22 50%,#0d1117 100%);min-
         </div>
         <label for="ENABLE_GIFT"><i class="fas fa-gift"></i> 接收礼物、舰长、醒目留言（开启后会显示并转发到PS5）</label>
       </div>
+      <div class="toggle-row">
+        <div class="toggle">
+          <input type="checkbox" id="REDUNDANT_CONNECTION" {{ 'checked' if REDUNDANT_CONNECTION else '' }}>
+          <div class="toggle-slider"></div>
+        </div>
+        <label for="REDUNDANT_CONNECTION"><i class="fas fa-stream"></i> 双连接冗余（在另一个弹幕服务器上再保持一条连接，单条断线不丢弹幕）</label>
+      </div>
+      <div class="toggle-row">
+        <div class="toggle">
+          <input type="checkbox" id="USE_UVLOOP" {{ 'checked' if USE_UVLOOP else '' }}>
+          <div class="toggle-slider"></div>
+        </div>
+        <label for="USE_UVLOOP"><i class="fas fa-tachometer-alt"></i> 使用 uvloop 事件循环（需安装 uvloop，不支持Windows，重启后生效）</label>
+      </div>
+      <div class="form-group">
+        <label><i class="fas fa-comment-dots"></i> 刷屏合并窗口（毫秒，窗口内相同弹幕只转发一次，重复3次以上补发 "666 ×42"，0=不合并）</label>
+        <input type="number" id="SPAM_AGGREGATE_MS" value="{{ SPAM_AGGREGATE_MS }}" placeholder="默认: 0">
+      </div>
+      <div class="toggle-row">
+        <div class="toggle">
+          <input type="checkbox" id="OUTPUT_SHAPER" {{ 'checked' if OUTPUT_SHAPER else '' }}>
+          <div class="toggle-slider"></div>
+        </div>
+        <label for="OUTPUT_SHAPER"><i class="fas fa-comment-dollar"></i> 输出整形（限制每秒发给PS5的行数，优先显示 SC &gt; 大航海 &gt; 礼物 &gt; 弹幕，来不及显示的汇总为 "+N 条弹幕"）</label>
+      </div>
+      <div class="form-group">
+        <label><i class="fas fa-tachometer-alt"></i> 整形总速率（每秒行数）</label>
+        <input type="number" id="SHAPER_TOTAL_RATE" value="{{ SHAPER_TOTAL_RATE }}" placeholder="默认: 8">
+      </div>
+      <div class="form-group">
+        <label><i class="fas fa-comment-dollar"></i> 各类型每秒行数：SC / 大航海 / 礼物 / 弹幕（0=只受总速率限制）</label>
+        <div style="display:flex;gap:6px">
+          <input type="number" id="SHAPER_RATE_SC" value="{{ SHAPER_RATE_SC }}" placeholder="SC">
+          <input type="number" id="SHAPER_RATE_GUARD" value="{{ SHAPER_RATE_GUARD }}" placeholder="大航海">
+          <input type="number" id="SHAPER_RATE_GIFT" value="{{ SHAPER_RATE_GIFT }}" placeholder="礼物">
+          <input type="number" id="SHAPER_RATE_DANMAKU" value="{{ SHAPER_RATE_DANMAKU }}" placeholder="弹幕">
+        </div>
+      </div>
       <div class="irc-info">
         <b>🎮 PS5 弹幕连接：</b><br>
         需劫持ps5 dns给本机服务器地址 ：<br>
@@ -1806,6 +4224,15 @@ body{background:linear-gradient(135deg,#0d1117 0%,#161b22 50%,#0d1117 100%);min-
         当前监听：<span id="current-room-id">{{ BILIBILI_ROOM_ID }}</span>
         <span id="real-room-id-info" style="margin-left:10px;color:#8b949e"></span>
       </div>
+      <div id="host-info" style="font-size:.74rem;color:#8b949e;margin-top:8px;font-family:'Consolas','Monaco',monospace;line-height:1.6"></div>
+      <div id="reconnect-info" style="font-size:.74rem;color:#8b949e;margin-top:6px;line-height:1.6"></div>
+      <div id="watchdog-info" style="font-size:.74rem;color:#8b949e;margin-top:6px;line-height:1.6"></div>
+      <div id="queue-info" style="font-size:.74rem;color:#8b949e;margin-top:6px;line-height:1.6"></div>
+      <div id="irc-clients-info" style="font-size:.74rem;color:#8b949e;margin-top:6px;line-height:1.6"></div>
+      <div id="shaper-info" style="font-size:.74rem;color:#8b949e;margin-top:6px;line-height:1.6"></div>
+      <div id="aggregator-info" style="font-size:.74rem;color:#8b949e;margin-top:6px;line-height:1.6"></div>
+      <div id="rooms-info" style="font-size:.74rem;color:#8b949e;margin-top:6px;line-height:1.6"></div>
+      <div id="links-info" style="font-size:.74rem;color:#8b949e;margin-top:6px;line-height:1.6"></div>
     </div>
 
     <!-- RTMP推流状态卡 -->
@@ -1950,6 +4377,7 @@ body{background:linear-gradient(135deg,#0d1117 0%,#161b22 50%,#0d1117 100%);min-
 const $ = id => document.getElementById(id);
 
 let allDanmaku = [];
+let multiRoom = false;
 let allGift = [];
 let currentGiftTab = 'all';
 let autoScroll = true;
@@ -1986,8 +4414,8 @@ function renderDmItem(it) {
   return `<li class="dm-item">
     <div class="dm-avatar">${esc(letter)}</div>
     <div class="dm-body">
-      <div class="dm-user">${esc(it.user)}</div>
-      <div class="dm-text">${esc(it.text)}</div>
+      <div class="dm-user">${esc(it.user)}${multiRoom && it.room ? `<span style="margin-left:6px;font-size:.7rem;color:#8b949e">@${it.room}</span>` : ''}</div>
+      <div class="dm-text">${esc(it.text)}${it.num > 1 ? `<span style="margin-left:6px;color:#d29922">×${it.num}</span>` : ''}</div>
       <div class="dm-time"><i class="far fa-clock" style="margin-right:4px"></i>${it.time||''}</div>
     </div>
   </li>`;
@@ -2138,6 +4566,16 @@ function refreshStatus() {
       }
     }
 
+    renderHosts(d.hosts);
+    renderReconnect(d.reconnect_policy);
+    renderWatchdog(d.watchdog);
+    renderQueue(d.event_queue);
+    renderIrcClients(d.irc_clients);
+    renderShaper(d.shaper);
+    renderAggregator(d.aggregator);
+    renderRooms(d.rooms);
+    renderLinks(d.redundancy);
+
     if (d.recent_danmaku !== undefined) {
       allDanmaku = d.recent_danmaku || [];
       console.log('refreshStatus: 更新弹幕列表', allDanmaku.length, '条');
@@ -2155,6 +4593,118 @@ function refreshStatus() {
   });
 }
 
+function renderHosts(hosts) {
+  const box = $('host-info');
+  if (!box) return;
+  if (!hosts || !hosts.length) { box.innerHTML = ''; return; }
+  box.innerHTML = '<div><i class="fas fa-stream" style="color:#58a6ff;margin-right:6px"></i>弹幕服务器（按探测延迟排序）</div>' +
+    hosts.map(h => {
+      const lat = h.latency_ms == null ? '超时' : h.latency_ms + ' ms';
+      const color = h.current ? '#3fb950' : (h.consecutive_failures > 0 ? '#f85149' : '#8b949e');
+      const tip = h.last_error ? ` title="${esc(h.last_error)}"` : '';
+      return `<div style="color:${color}"${tip}>${h.current ? '▶' : '·'} ${esc(h.host)}:${h.port} | ${lat} | 连接 ${h.connects} | 失败 ${h.failures}</div>`;
+    }).join('');
+}
+
+function renderRooms(rooms) {
+  const box = $('rooms-info');
+  if (!box) return;
+  multiRoom = (rooms || []).length > 1;
+  if (!multiRoom) { box.innerHTML = ''; return; }
+  box.innerHTML = '<div><i class="fas fa-tv" style="margin-right:6px"></i>联播直播间</div>' + rooms.map(r => {
+    const color = r.connected ? '#3fb950' : '#f85149';
+    const prefix = r.prefix ? ` [${esc(r.prefix)}]` : '';
+    return `<div><span style="color:${color}">●</span> ${r.room_id}${r.primary ? '（主）' : ''}${prefix}${r.connected ? '' : ' 未连接'}</div>`;
+  }).join('');
+}
+
+function renderLinks(r) {
+  const box = $('links-info');
+  if (!box) return;
+  if (!r || !r.enabled) { box.innerHTML = ''; return; }
+  const state = r.active ? '<span style="color:#3fb950">双连接接收中</span>' : '<span style="color:#d29922">备用连接未建立</span>';
+  box.innerHTML = `<div><i class="fas fa-stream" style="margin-right:6px"></i>双连接冗余：${state}</div>` +
+    r.links.map(l => {
+      const lag = l.avg_lag_ms == null ? '-' : `${l.avg_lag_ms} ms（最大 ${l.max_lag_ms} ms）`;
+      return `<div>${esc(l.name)}：先到 ${l.first} 次（${(l.first_rate * 100).toFixed(1)}%） · 后到 ${l.behind} 次 · 落后 ${lag}</div>`;
+    }).join('');
+}
+
+function renderWatchdog(w) {
+  const box = $('watchdog-info');
+  if (!box) return;
+  if (!w || !w.rtt_samples) { box.innerHTML = ''; return; }
+  const color = w.last_rtt_ms > 1000 ? '#f85149' : (w.last_rtt_ms > 300 ? '#d29922' : '#3fb950');
+  const stalls = w.stalls ? ` · <span style="color:#f85149">假死重连 ${w.stalls} 次</span>` : '';
+  const missed = w.missed ? ` · 心跳未回复 ${w.missed} 次` : '';
+  box.innerHTML = `<div><i class="fas fa-tachometer-alt" style="margin-right:6px"></i>心跳 RTT <span style="color:${color}">${w.last_rtt_ms} ms</span>（平均 ${w.avg_rtt_ms} / P95 ${w.p95_rtt_ms} ms）${missed}${stalls}</div>`;
+}
+
+function renderQueue(q) {
+  const box = $('queue-info');
+  if (!box) return;
+  if (!q) { box.innerHTML = ''; return; }
+  const color = q.depth >= q.maxsize ? '#f85149' : (q.depth > q.maxsize / 2 ? '#d29922' : '#3fb950');
+  const dropped = q.dropped ? ` · <span style="color:#f85149">已丢弃弹幕 ${q.dropped} 条</span>` : '';
+  box.innerHTML = `<div><i class="fas fa-list" style="margin-right:6px"></i>转发队列 <span style="color:${color}">${q.depth}/${q.maxsize}</span>（峰值 ${q.high_water}）${dropped}</div>`;
+}
+
+function renderIrcClients(clients) {
+  const box = $('irc-clients-info');
+  if (!box) return;
+  if (!clients || !clients.length) { box.innerHTML = ''; return; }
+  box.innerHTML = '<div><i class="fas fa-gamepad" style="margin-right:6px"></i>IRC 客户端发送队列</div>' + clients.map(c => {
+    const color = c.depth >= c.maxsize ? '#f85149' : (c.depth > c.maxsize / 2 ? '#d29922' : '#3fb950');
+    const dropped = c.dropped ? ` · <span style="color:#f85149">丢弃 ${c.dropped}</span>` : '';
+    const flush = c.flushes ? ` · 每次写入 ${c.lines_per_flush} 行 · 合并延迟 ${c.avg_flush_delay_ms} ms（最大 ${c.max_flush_delay_ms}）` : '';
+    return `<div>${esc(c.nick || '-')} (${esc(c.peer)})：<span style="color:${color}">${c.depth}/${c.maxsize}</span>（峰值 ${c.high_water}） · 已发送 ${c.sent}${dropped}${flush}</div>`;
+  }).join('');
+}
+
+function renderShaper(sh) {
+  const box = $('shaper-info');
+  if (!box) return;
+  if (!sh || !sh.enabled) { box.innerHTML = ''; return; }
+  const names = {sc: 'SC', guard: '大航海', gift: '礼物', danmaku: '弹幕'};
+  box.innerHTML = `<div><i class="fas fa-comment-dollar" style="margin-right:6px"></i>输出整形：每秒 ${sh.total_rate} 行 · 汇总 ${sh.summaries} 次</div>` +
+    sh.lanes.map(l => {
+      const rate = l.rate > 0 ? `${l.rate}/秒` : '不限';
+      const sup = l.suppressed ? ` · <span style="color:#d29922">未显示 ${l.suppressed}</span>` : '';
+      return `<div>${names[l.lane] || l.lane}（${rate}）：已发送 ${l.passed} · 排队 ${l.pending}${sup}</div>`;
+    }).join('');
+}
+
+function renderAggregator(a) {
+  const box = $('aggregator-info');
+  if (!box) return;
+  if (!a || !a.window_ms || !a.merged) { box.innerHTML = ''; return; }
+  box.innerHTML = `<div><i class="fas fa-comment-dots" style="margin-right:6px"></i>刷屏合并：收到 ${a.raw} 条 → 转发 ${a.forwarded} 行（${a.ratio}:1） · 合并 ${a.merged} 条 · 汇总 ${a.summaries} 行</div>`;
+}
+
+function renderReconnect(policies) {
+  const box = $('reconnect-info');
+  if (!box) return;
+  box.innerHTML = (policies || []).map(p => {
+    let text, color;
+    if (p.state === 'open') {
+      text = `风控熔断中（连续 ${p.risk_streak} 次 -352），${Math.ceil(p.retry_in || p.open_remaining)} 秒后试探`;
+      color = '#f85149';
+    } else if (p.retry_in > 0) {
+      text = `第 ${p.attempts} 次重试，${p.retry_in} 秒后重连`;
+      color = '#d29922';
+    } else if (p.state === 'half_open') {
+      text = '熔断冷却结束，正在试探';
+      color = '#d29922';
+    } else {
+      text = p.attempts > 0 ? `已重试 ${p.attempts} 次` : '正常';
+      color = p.attempts > 0 ? '#d29922' : '#3fb950';
+    }
+    const extra = p.trips ? ` · 熔断 ${p.trips} 次` : '';
+    const tip = p.last_error ? ` title="${esc(p.last_error)}"` : '';
+    return `<div${tip}><i class="fas fa-redo" style="margin-right:6px"></i>${esc(p.name)}：<span style="color:${color}">${text}</span>${extra}</div>`;
+  }).join('');
+}
+
 function updateRtmpStatus() {
   fetch('/api/rtmp/status').then(r=>r.json()).then(d=>{
     console.log('updateRtmpStatus: 接收到数据', d);
@@ -2315,6 +4865,9 @@ function saveConfig() {
     if (el.id && el.id !== 'qr-img') cfg[el.id] = el.value;
   });
   cfg.ENABLE_GIFT = $('ENABLE_GIFT').checked;
+  cfg.REDUNDANT_CONNECTION = $('REDUNDANT_CONNECTION').checked;
+  cfg.USE_UVLOOP = $('USE_UVLOOP').checked;
+  cfg.OUTPUT_SHAPER = $('OUTPUT_SHAPER').checked;
 
   console.log('saveConfig: 准备保存配置', cfg);
   console.log('saveConfig: BILIBILI_ROOM_ID =', cfg.BILIBILI_ROOM_ID);
@@ -2519,9 +5072,23 @@ def get_local_ip() -> str:
         return "127.0.0.1"
 
 
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON 响应走可选的高性能JSON后端（标准库后端时保持Flask默认行为）"""
+    ensure_ascii = False
+
+    def dumps(self, obj, **kwargs) -> str:
+        if JSON_BACKEND == "json":
+            return super().dumps(obj, **kwargs)
+        return json_dumps(obj)
+
+    def loads(self, s, **kwargs):
+        return json_loads(s)
+
+
 def start_web(irc_server):
     app = Flask("ps5-danmaku-web")
     app.config['JSON_AS_ASCII'] = False
+    app.json = FastJSONProvider(app)
 
     # ── HTML 预渲染缓存，避免每次请求都重新渲染几千行模板 ────────────
     _html_cache: dict = {"html": None, "config_sig": None}
@@ -2534,19 +5101,43 @@ def start_web(irc_server):
             CONFIG.get("BILIBILI_UID", 0),
             CONFIG.get("BILIBILI_ROOM_ID", 0),
             CONFIG.get("ENABLE_GIFT", True),
+            CONFIG.get("REDUNDANT_CONNECTION", False),
+            CONFIG.get("USE_UVLOOP", False),
+            CONFIG.get("OUTPUT_SHAPER", False),
+            tuple(CONFIG.get(k, 0) for k in OutputShaper.RATE_KEYS.values()),
+            CONFIG.get("SHAPER_TOTAL_RATE", 8),
+            CONFIG.get("SPAM_AGGREGATE_MS", 0),
+            str(CONFIG.get("EXTRA_ROOM_IDS", [])),
+            str(CONFIG.get("ROOM_PREFIXES", {})),
         )
         if _html_cache["html"] is None or _html_cache["config_sig"] != sig:
             _html_cache["html"] = render_template_string(WEB_HTML,
                 BILIBILI_ROOM_ID=CONFIG["BILIBILI_ROOM_ID"],
+                EXTRA_ROOM_IDS=", ".join(map(str, parse_room_ids(CONFIG.get("EXTRA_ROOM_IDS", [])))),
+                ROOM_PREFIXES=", ".join(f"{r}:{p}" for r, p in
+                                        parse_room_prefixes(CONFIG.get("ROOM_PREFIXES", {})).items()),
                 TWITCH_CHANNEL=CONFIG["TWITCH_CHANNEL"],
                 HEARTBEAT_TIMEOUT=CONFIG["HEARTBEAT_TIMEOUT"],
                 RECONNECT_DELAY=CONFIG["RECONNECT_DELAY"],
+                RECONNECT_MAX_DELAY=CONFIG.get("RECONNECT_MAX_DELAY", 60),
+                WS_STALL_TIMEOUT=CONFIG.get("WS_STALL_TIMEOUT", 70),
+                RISK_CONTROL_COOLDOWN=CONFIG.get("RISK_CONTROL_COOLDOWN", 300),
                 MAX_SEEN_DANMAKU=CONFIG["MAX_SEEN_DANMAKU"],
                 MAX_SEEN_GIFT=CONFIG["MAX_SEEN_GIFT"],
+                DEDUP_WINDOW_SECONDS=CONFIG.get("DEDUP_WINDOW_SECONDS", 60),
                 MAX_LOG_ITEMS=CONFIG.get("MAX_LOG_ITEMS", 50),
                 BILIBILI_UNAME=CONFIG.get("BILIBILI_UNAME", ""),
                 BILIBILI_UID=CONFIG.get("BILIBILI_UID", 0),
                 ENABLE_GIFT=CONFIG["ENABLE_GIFT"],
+                REDUNDANT_CONNECTION=CONFIG.get("REDUNDANT_CONNECTION", False),
+                USE_UVLOOP=CONFIG.get("USE_UVLOOP", False),
+                SPAM_AGGREGATE_MS=CONFIG.get("SPAM_AGGREGATE_MS", 0),
+                OUTPUT_SHAPER=CONFIG.get("OUTPUT_SHAPER", False),
+                SHAPER_TOTAL_RATE=CONFIG.get("SHAPER_TOTAL_RATE", 8),
+                SHAPER_RATE_SC=CONFIG.get("SHAPER_RATE_SC", 0),
+                SHAPER_RATE_GUARD=CONFIG.get("SHAPER_RATE_GUARD", 0),
+                SHAPER_RATE_GIFT=CONFIG.get("SHAPER_RATE_GIFT", 3),
+                SHAPER_RATE_DANMAKU=CONFIG.get("SHAPER_RATE_DANMAKU", 6),
                 irc_running=IRC_RUNNING,
                 ws_running=WS_RUNNING,
                 active_clients=len(ACTIVE_CONNECTIONS),
@@ -2613,10 +5204,20 @@ def start_web(irc_server):
             "sc_count": SC_COUNT,
             "room_id": CONFIG["BILIBILI_ROOM_ID"],  # 用户输入的房间ID
             "real_room_id": real_room_id,  # 真实的房间ID
-            "recent_danmaku": list(recent_danmaku_log),
-            "recent_gift": list(recent_gift_log),
+            "recent_danmaku": [e.to_dict() for e in list(recent_danmaku_log)],
+            "recent_gift": [e.to_dict() for e in list(recent_gift_log)],
             "logged_in": bool(CONFIG.get("BILIBILI_UNAME")),
-            "uname": CONFIG.get("BILIBILI_UNAME", "")
+            "uname": CONFIG.get("BILIBILI_UNAME", ""),
+            "hosts": _GLOBAL_BILI_CLIENT.hosts.snapshot() if _GLOBAL_BILI_CLIENT else [],
+            "reconnect_policy": [x.reconnect_policy.snapshot()
+                                 for x in (_GLOBAL_BILI_CLIENT, _GLOBAL_IRC_SERVER) if x],
+            "rooms": _GLOBAL_ROOM_MANAGER.snapshot() if _GLOBAL_ROOM_MANAGER else [],
+            "redundancy": _GLOBAL_BILI_CLIENT.redundancy_stats() if _GLOBAL_BILI_CLIENT else None,
+            "watchdog": _GLOBAL_BILI_CLIENT.watchdog_snapshot() if _GLOBAL_BILI_CLIENT else None,
+            "event_queue": _GLOBAL_IRC_SERVER.queue.snapshot() if _GLOBAL_IRC_SERVER else None,
+            "irc_clients": _GLOBAL_IRC_SERVER.client_stats() if _GLOBAL_IRC_SERVER else [],
+            "shaper": _GLOBAL_IRC_SERVER.shaper.snapshot() if _GLOBAL_IRC_SERVER else None,
+            "aggregator": _GLOBAL_IRC_SERVER.aggregator.snapshot() if _GLOBAL_IRC_SERVER else None
         })
 
     @app.route('/save_config', methods=['POST'])
@@ -2645,11 +5246,13 @@ def start_web(irc_server):
             # 如果房间ID改变了，热切换到新直播间
             if new_room_id and new_room_id != old_room_id:
                 try:
-                    # 尝试异步获取直播间信息
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    room_info = loop.run_until_complete(get_room_info(new_room_id))
-                    loop.close()
+                    # 在主事件循环中获取直播间信息，复用共享的HTTP连接池
+                    main_loop = _GLOBAL_BILI_CLIENT._loop if _GLOBAL_BILI_CLIENT else None
+                    if main_loop is not None:
+                        room_info = asyncio.run_coroutine_threadsafe(
+                            get_room_info(new_room_id), main_loop).result(timeout=15)
+                    else:
+                        room_info = asyncio.run(get_room_info(new_room_id))
 
                     room_title = room_info.get("room_title", f"直播间{new_room_id}")
                     add_room_to_history(new_room_id, room_title)
@@ -2660,29 +5263,25 @@ def start_web(irc_server):
                     add_room_to_history(new_room_id)
 
                 # 热切换到新直播间（不重启程序）
-                if _GLOBAL_BILI_CLIENT:
+                if _GLOBAL_BILI_CLIENT and _GLOBAL_BILI_CLIENT._loop:
                     try:
-                        # 创建新的事件循环来执行异步切换
-                        def switch_room_async():
-                            loop = asyncio.new_event_loop()
-                            asyncio.set_event_loop(loop)
+                        # 切换必须在B站连接所在的主事件循环中执行，新旧连接才能在同一个接收循环里交接
+                        future = asyncio.run_coroutine_threadsafe(
+                            _GLOBAL_BILI_CLIENT.switch_room(new_room_id), _GLOBAL_BILI_CLIENT._loop)
+
+                        def _on_switch_done(f):
                             try:
-                                loop.run_until_complete(_GLOBAL_BILI_CLIENT.switch_room(new_room_id))
-                                _add_web_log("success", f"已切换到直播间: {new_room_id}")
+                                f.result()
                                 logger.info(f"已热切换到直播间: {new_room_id}")
                             except Exception as e:
                                 logger.error(f"切换直播间失败: {e}")
                                 _add_web_log("error", f"切换直播间失败: {e}")
-                            finally:
-                                loop.close()
 
-                        # 在后台线程中执行切换
-                        switch_thread = threading.Thread(target=switch_room_async, daemon=True)
-                        switch_thread.start()
+                        future.add_done_callback(_on_switch_done)
 
                         return jsonify({"code": 0, "msg": f"配置已保存，正在切换到直播间 {new_room_id}..."})
                     except Exception as e:
-                        logger.error(f"启动切换线程失败: {e}")
+                        logger.error(f"提交切换任务失败: {e}")
                         return jsonify({"code": 0, "msg": "配置已保存，但切换直播间失败，请手动刷新页面"})
 
             return jsonify({"code": 0, "msg": "配置已保存"})
@@ -2698,8 +5297,8 @@ def start_web(irc_server):
         buf = _io.StringIO()
         w = csv.writer(buf)
         w.writerow(["时间", "用户", "内容"])
-        for item in reversed(list(recent_danmaku_log)):
-            w.writerow([item.get("time", ""), item.get("user", ""), item.get("text", "")])
+        for e in reversed(list(recent_danmaku_log)):
+            w.writerow([e.time_str(), e.user, f"{e.text} ×{e.num}" if e.num > 1 else e.text])
         csv_data = "\ufeff" + buf.getvalue()  # BOM for Excel
         return Response(
             csv_data,
@@ -2716,11 +5315,10 @@ def start_web(irc_server):
         w = csv.writer(buf)
         w.writerow(["时间", "类型", "用户", "礼物/内容", "数量", "价值"])
         type_map = {"gift": "礼物", "guard": "大航海", "sc": "SC醒目留言"}
-        for item in reversed(list(recent_gift_log)):
-            t = type_map.get(item.get("type", "gift"), "礼物")
-            content = item.get("text", item.get("name", ""))
-            w.writerow([item.get("time", ""), t, item.get("user", ""), content,
-                        item.get("num", 1), item.get("price", 0)])
+        for e in reversed(list(recent_gift_log)):
+            t = type_map.get(e.type_name, "礼物")
+            content = e.text if e.kind == EVENT_SC else e.name
+            w.writerow([e.time_str(), t, e.user, content, e.num, e.price])
         csv_data = "\ufeff" + buf.getvalue()
         return Response(
             csv_data,
@@ -2802,6 +5400,48 @@ def start_web(irc_server):
             "logs": list(web_log_queue)
         })
 
+    @app.route('/api/stats')
+    def api_stats():
+        """获取性能统计（命令预过滤、处理函数耗时等）"""
+        if not _GLOBAL_BILI_CLIENT:
+            return jsonify({"code": 1, "msg": "B站连接未初始化"})
+        return jsonify({
+            "code": 0,
+            "commands": _GLOBAL_BILI_CLIENT.cmd_stats.snapshot(),
+            "handlers": _GLOBAL_BILI_CLIENT.handler_stats.snapshot(),
+            "dedup": _GLOBAL_BILI_CLIENT.dedup_stats(),
+            "switch": _GLOBAL_BILI_CLIENT.last_switch,
+            "http": bili_http.snapshot(),
+            "room_cache": room_cache.snapshot(),
+            "reconnect": _GLOBAL_BILI_CLIENT.reconnect_stats,
+            "hosts": _GLOBAL_BILI_CLIENT.hosts.snapshot(),
+            "redundancy": _GLOBAL_BILI_CLIENT.redundancy_stats(),
+            "watchdog": _GLOBAL_BILI_CLIENT.watchdog_snapshot(),
+            "event_queue": _GLOBAL_IRC_SERVER.queue.snapshot() if _GLOBAL_IRC_SERVER else None,
+            "irc_clients": _GLOBAL_IRC_SERVER.client_stats() if _GLOBAL_IRC_SERVER else [],
+            "shaper": _GLOBAL_IRC_SERVER.shaper.snapshot() if _GLOBAL_IRC_SERVER else None,
+            "aggregator": _GLOBAL_IRC_SERVER.aggregator.snapshot() if _GLOBAL_IRC_SERVER else None,
+            "event_loop": EVENT_LOOP_NAME
+        })
+
+    @app.route('/api/stats/reset', methods=['POST'])
+    def api_stats_reset():
+        """清零性能统计"""
+        if not _GLOBAL_BILI_CLIENT:
+            return jsonify({"code": 1, "msg": "B站连接未初始化"})
+        _GLOBAL_BILI_CLIENT.cmd_stats.reset()
+        _GLOBAL_BILI_CLIENT.handler_stats.reset()
+        _GLOBAL_BILI_CLIENT._seen_danmaku.reset_stats()
+        _GLOBAL_BILI_CLIENT._seen_gift.reset_stats()
+        _GLOBAL_BILI_CLIENT.reset_link_stats()
+        _GLOBAL_BILI_CLIENT.reset_watchdog_stats()
+        if _GLOBAL_IRC_SERVER:
+            _GLOBAL_IRC_SERVER.queue.reset_stats()
+            _GLOBAL_IRC_SERVER.reset_client_stats()
+            _GLOBAL_IRC_SERVER.shaper.reset_stats()
+            _GLOBAL_IRC_SERVER.aggregator.reset_stats()
+        return jsonify({"code": 0, "msg": "统计已清零"})
+
     @app.route('/api/rooms/history')
     def api_rooms_history():
         """获取直播间历史记录"""
@@ -2819,8 +5459,7 @@ def start_web(irc_server):
         global CONFIG
         try:
             CONFIG["ROOM_HISTORY"] = []
-            with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-                json.dump(CONFIG, f, ensure_ascii=False, indent=4)
+            _write_config_file()
             _add_web_log("success", "已清空所有直播间历史记录")
             return jsonify({"code": 0, "msg": "已清空"})
         except Exception as e:
@@ -2850,25 +5489,54 @@ def start_web(irc_server):
 
 # ==================== 主入口 ====================
 _GLOBAL_IRC_SERVER = None
-_GLOBAL_BILI_CLIENT = None
+_GLOBAL_BILI_CLIENT = None      # 主直播间的连接
+_GLOBAL_ROOM_MANAGER = None
+EVENT_LOOP_NAME = "asyncio"
+
+
+def install_event_loop() -> str:
+    """
+    按配置设置事件循环策略（必须在 asyncio.run 之前调用），返回事件循环名称
+    Windows 固定使用 SelectorEventLoop；USE_UVLOOP 开启且已安装 uvloop 时使用 uvloop，否则回退标准 asyncio
+    """
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+        if CONFIG.get("USE_UVLOOP", False):
+            logger.warning("uvloop 不支持 Windows，使用 asyncio 事件循环")
+        return "asyncio (WindowsSelector)"
+    if CONFIG.get("USE_UVLOOP", False):
+        try:
+            import uvloop
+        except ImportError:
+            logger.warning("已开启 USE_UVLOOP 但未安装 uvloop（pip install uvloop），使用 asyncio 事件循环")
+        else:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            return f"uvloop {uvloop.__version__}"
+    return "asyncio"
 
 
 async def main():
-    global _GLOBAL_IRC_SERVER, _GLOBAL_BILI_CLIENT
+    global _GLOBAL_IRC_SERVER, _GLOBAL_BILI_CLIENT, _GLOBAL_ROOM_MANAGER
 
     irc_server = IRCServer()
     _GLOBAL_IRC_SERVER = irc_server
 
-    bili_client = BiliLiveClient(CONFIG["BILIBILI_ROOM_ID"], irc_server)
-    _GLOBAL_BILI_CLIENT = bili_client
+    room_manager = RoomManager(irc_server)
+    _GLOBAL_ROOM_MANAGER = room_manager
+    _GLOBAL_BILI_CLIENT = room_manager.primary
 
     logger.info("=" * 60)
     logger.info("  阿冰没问题（Icenoproblem）PS5 哔哩哔哩 直播系统 V3.0  (Windows 原生版)")
     logger.info("=" * 60)
     logger.info(f"  监听房间: {CONFIG['BILIBILI_ROOM_ID']}")
+    extra_rooms = parse_room_ids(CONFIG.get("EXTRA_ROOM_IDS", []))
+    if extra_rooms:
+        logger.info(f"  附加直播间: {', '.join(map(str, extra_rooms))}")
     logger.info(f"  IRC 服务: {CONFIG['IRC_HOST']}:{CONFIG['IRC_PORT']}")
     logger.info(f"  Web 控制台: http://127.0.0.1:{CONFIG['WEB_PORT']}")
     logger.info(f"  PS5 频道: #{CONFIG['TWITCH_CHANNEL']}")
+    logger.info(f"  JSON 后端: {JSON_BACKEND}")
+    logger.info(f"  事件循环: {EVENT_LOOP_NAME}")
     logger.info("  RTMP 推流: 状态监控已启用（需配置DNS劫持）")
     if CONFIG.get("BILIBILI_UNAME"):
         logger.info(f"  已登录账号: {CONFIG['BILIBILI_UNAME']} (uid={CONFIG['BILIBILI_UID']})")
@@ -2876,17 +5544,23 @@ async def main():
         logger.info("  账号状态: 游客（建议在Web控制台扫码登录）")
     logger.info("=" * 60)
 
-    await asyncio.gather(
-        irc_server.start(),
-        bili_client.connect()
-    )
+    await bili_http.start()
+    room_cache.load()
+    history_ids = [h.get("room_id") for h in CONFIG.get("ROOM_HISTORY", []) if isinstance(h, dict)]
+    prefetch_task = asyncio.create_task(room_cache.prefetch(history_ids))
+    try:
+        await asyncio.gather(
+            irc_server.start(),
+            room_manager.run()
+        )
+    finally:
+        prefetch_task.cancel()
+        await bili_http.close()
 
 
 if __name__ == "__main__":
     load_config()
-
-    if sys.platform == 'win32':
-        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    EVENT_LOOP_NAME = install_event_loop()
 
     def web_starter():
         import time as _t
@@ -63,6 +63,11 @@ if [ ! -f "bili_cookies.json" ]; then
     info "bili_cookies.json 已创建（首次部署，进入 Web 界面后扫码登录）"
 fi
 
+if [ ! -f "room_cache.json" ]; then
+    echo '{}' > room_cache.json
+    info "room_cache.json 已创建（直播间信息缓存）"
+fi
+
 if [ ! -f ".env" ]; then
     warn ".env 不存在，创建默认配置..."
     # 自动检测本机 IP（NAS 环境优先用实际网卡 IP）
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站 WebSocket 录制回放工具
+把 WS_CAPTURE_FILE 录下的原始帧重新送入 BiliLiveClient._process_ws_data，
+用于离线复现弹幕/礼物高峰、测量吞吐量、校验优化前后输出是否一致
+
+使用方法：
+  python replay_capture.py capture.bin                  # 按录制时的真实节奏回放
+  python replay_capture.py capture.bin --speed 10       # 10倍速
+  python replay_capture.py capture.bin --speed 0        # 不等待，尽可能快
+  python replay_capture.py capture.bin --irc            # 同时启动IRC服务，PS5可连入观看
+  python replay_capture.py capture.bin --speed 0 --record out.txt
+      # 启动IRC服务并用内置客户端接收，把收到的PRIVMSG写入文件并输出SHA256，
+      # 两次回放的SHA256相同即说明输出一致
+"""
+
+import sys
+
+# 修复 Windows 控制台编码问题
+if sys.platform == 'win32':
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+import argparse
+import asyncio
+import hashlib
+import logging
+import time
+
+import danmaku_forward as df
+
+
+class IRCRecorder:
+    """内置IRC客户端：连接本地IRC服务，记录收到的所有PRIVMSG"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.lines = []
+        self.last_recv = 0.0
+        self._reader = None
+        self._writer = None
+        self._task = None
+
+    async def start(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self._writer.write(b"NICK replay\r\nUSER replay 0 * :replay\r\n")
+        await self._writer.drain()
+        self._task = asyncio.create_task(self._read_loop())
+
+    async def _read_loop(self):
+        while True:
+            data = await self._reader.readline()
+            if not data:
+                break
+            self.last_recv = time.monotonic()
+            line = data.decode('utf-8', errors='ignore').rstrip("\r\n")
+            if " PRIVMSG " in line:
+                self.lines.append(line)
+
+    async def wait_idle(self, idle: float = 0.5, timeout: float = 30.0):
+        """等待IRC输出静止 idle 秒（回放结束后把缓冲中的消息收完，从调用时开始计时）"""
+        start = time.monotonic()
+        deadline = start + timeout
+        while time.monotonic() < deadline:
+            if time.monotonic() - max(self.last_recv, start) >= idle:
+                return
+            await asyncio.sleep(0.05)
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+        if self._writer:
+            self._writer.close()
+
+    def digest(self) -> str:
+        h = hashlib.sha256()
+        for line in self.lines:
+            h.update(line.encode('utf-8'))
+            h.update(b"\n")
+        return h.hexdigest()
+
+
+async def wait_irc_ready(server: df.IRCServer, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while not df.IRC_RUNNING:
+        if time.monotonic() > deadline:
+            raise RuntimeError("IRC 服务启动超时")
+        await asyncio.sleep(0.05)
+
+
+async def replay(args):
+    irc_server = df.IRCServer()
+    irc_server.queue.configure(policy=args.overflow)
+    # 刷屏合并按真实时间开窗口，倍速回放时结果不可复现，只在指定 --aggregate 时开启
+    df.CONFIG["SPAM_AGGREGATE_MS"] = args.aggregate
+    client = df.BiliLiveClient(args.room, irc_server)
+    irc_task = None
+    dispatch_task = None
+    recorder = None
+
+    if args.irc or args.record:
+        df.CONFIG["IRC_HOST"] = args.host
+        df.CONFIG["IRC_PORT"] = args.port
+        irc_task = asyncio.create_task(irc_server.start())
+        await wait_irc_ready(irc_server)
+        print(f"IRC 服务已启动: {args.host}:{args.port}")
+        if args.record:
+            connect_host = "127.0.0.1" if args.host in ("0.0.0.0", "") else args.host
+            recorder = IRCRecorder(connect_host, args.port)
+            await recorder.start()
+            await asyncio.sleep(0.2)  # 等待 NICK/JOIN 完成
+        if args.wait > 0:
+            print(f"等待 {args.wait} 秒供PS5/其他IRC客户端连入...")
+            await asyncio.sleep(args.wait)
+    else:
+        # 不启动IRC服务时也要有分发任务消费事件队列，否则 block 策略下队列满后回放会一直等待
+        dispatch_task = asyncio.create_task(irc_server._dispatch_loop())
+
+    frames = 0
+    total_bytes = 0
+    busy = 0.0
+    start = time.perf_counter()
+    for ts, frame in df.iter_ws_capture(args.capture):
+        if args.speed > 0:
+            delay = ts / args.speed - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        t0 = time.perf_counter()
+        await client._process_ws_data(frame)
+        busy += time.perf_counter() - t0
+        frames += 1
+        total_bytes += len(frame)
+    elapsed = time.perf_counter() - start
+
+    # 等分发任务把队列中剩余的事件写完
+    while len(irc_server.queue) or irc_server.aggregator.pending():
+        await asyncio.sleep(0.01)
+    if recorder:
+        await recorder.wait_idle()
+
+    stats = client.cmd_stats.snapshot()
+    messages = stats["total_parsed"] + stats["total_skipped"]
+    print("=" * 60)
+    print(f"录制文件: {args.capture}")
+    print(f"回放速度: {'最快' if args.speed <= 0 else f'{args.speed}x'}")
+    print(f"帧数: {frames}  |  字节: {total_bytes}  |  消息: {messages}"
+          f" (解析 {stats['total_parsed']} / 跳过 {stats['total_skipped']})")
+    print(f"总耗时: {elapsed:.3f}s  |  处理耗时: {busy:.3f}s")
+    if busy > 0:
+        print(f"处理吞吐: {frames / busy:.0f} 帧/s  |  {messages / busy:.0f} 消息/s"
+              f"  |  {busy / max(messages, 1) * 1e6:.1f} µs/消息")
+    print(f"弹幕: {df.DANMAKU_COUNT}  礼物: {df.GIFT_COUNT}  大航海: {df.GUARD_COUNT}  SC: {df.SC_COUNT}")
+    q = irc_server.queue.snapshot()
+    print(f"事件队列: 策略 {q['policy']}  |  容量 {q['maxsize']}  |  峰值 {q['high_water']}  |  丢弃 {q['dropped']}")
+    if args.aggregate:
+        a = irc_server.aggregator.snapshot()
+        print(f"刷屏合并: 窗口 {a['window_ms']}ms  |  弹幕 {a['raw']} -> 转发 {a['forwarded']}"
+              f"  |  合并 {a['merged']}  |  汇总 {a['summaries']}")
+
+    if recorder:
+        with open(args.record, 'w', encoding='utf-8') as f:
+            for line in recorder.lines:
+                f.write(line + "\n")
+        print(f"IRC 输出: {len(recorder.lines)} 行 -> {args.record}")
+        print(f"IRC 输出 SHA256: {recorder.digest()}")
+        await recorder.close()
+        await asyncio.sleep(0.2)  # 让服务端感知断开，连接处理任务正常退出
+
+    if irc_task:
+        irc_task.cancel()
+    if dispatch_task:
+        dispatch_task.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="B站 WebSocket 录制回放")
+    parser.add_argument("capture", help="录制文件路径")
+    parser.add_argument("--speed", type=float, default=1.0, help="回放倍速，1=真实节奏，0=尽可能快")
+    parser.add_argument("--room", type=int, default=0, help="回放时使用的房间ID（仅用于显示）")
+    parser.add_argument("--irc", action="store_true", help="同时启动IRC服务")
+    parser.add_argument("--host", default="0.0.0.0", help="IRC 监听地址")
+    parser.add_argument("--port", type=int, default=df.CONFIG["IRC_PORT"], help="IRC 监听端口")
+    parser.add_argument("--wait", type=float, default=0, help="回放前等待IRC客户端连入的秒数")
+    parser.add_argument("--record", help="把IRC输出写入文件并计算SHA256（会自动启动IRC服务）")
+    parser.add_argument("--overflow", choices=df.EventQueue.POLICIES, default="block",
+                        help="事件队列满时的策略，默认 block（不丢弃，保证输出与录制一致）")
+    parser.add_argument("--aggregate", type=int, nargs="?", const=1500, default=0, metavar="MS",
+                        help="开启刷屏合并，窗口默认 1500 毫秒（按真实时间开窗口，倍速回放时输出不可复现，默认关闭）")
+    parser.add_argument("-v", "--verbose", action="store_true", help="输出每条弹幕/礼物日志")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        df.logger.setLevel(logging.WARNING)
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    try:
+        asyncio.run(replay(args))
+    except KeyboardInterrupt:
+        print("回放已停止")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+弹幕服务器节点选择测试 - 多直播间共用探测结果、各自轮换节点，认证后很快断开/假死的连接计入失败
+"""
+
+import sys
+
+# 解决 Windows 控制台中文编码问题
+if sys.platform == 'win32':
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+import danmaku_forward as df
+
+HOST_LIST = [{"host": "a.chat.bilibili.com", "wss_port": 443},
+             {"host": "b.chat.bilibili.com", "wss_port": 443},
+             {"host": "c.chat.bilibili.com", "wss_port": 443}]
+URL_A, URL_B, URL_C = (f"wss://{h['host']}:443/sub" for h in HOST_LIST)
+
+
+def _selectors(n: int) -> list:
+    probe = df.HostProbe()
+    selectors = [df.HostSelector(probe) for _ in range(n)]
+    for s in selectors:
+        s.update(HOST_LIST)
+    return selectors
+
+
+def test_room_failures_do_not_rotate_other_rooms():
+    """一个直播间连续连接失败只轮换它自己的节点"""
+    room1, room2 = _selectors(2)
+    assert room1.select() == URL_A and room2.select() == URL_A
+    for _ in range(df.HostSelector.MAX_FAILURES):
+        room1.record_failure(URL_A, ConnectionError("reset"))
+    assert room1.select() == URL_B
+    assert room2.select() == URL_A
+    assert room2.snapshot()[0]["consecutive_failures"] == 0
+
+
+def test_probe_results_are_shared():
+    """探测结果只有一份：任一直播间触发探测后，其他直播间都回到最快的节点"""
+    room1, room2 = _selectors(2)
+    room1.select()
+    for _ in range(df.HostSelector.MAX_FAILURES):
+        room2.record_failure(URL_A, ConnectionError("reset"))
+    assert room2.select() == URL_B
+    room1.shared.order[:] = [URL_C, URL_A, URL_B]
+    room1.shared.generation += 1
+    assert room1.need_probe() == room2.need_probe()
+    assert room1.select() == URL_C
+    assert room2.select() == URL_C
+
+
+def test_short_lived_links_count_as_failures():
+    """认证成功后很快断开的节点照样轮换走，认证成功本身不清零连续失败"""
+    room, = _selectors(1)
+    assert room.select() == URL_A
+    for _ in range(df.HostSelector.MAX_FAILURES):
+        room.record_success(URL_A)
+        room.record_disconnect(URL_A, uptime=3.0)
+    assert room.select() == URL_B
+    stats = room.snapshot()[0]
+    assert stats["connects"] == 2 and stats["failures"] == 2
+
+
+def test_stalled_links_count_as_failures():
+    """被看门狗判定假死的连接算失败，即使已经保持了很久"""
+    room, = _selectors(1)
+    room.select()
+    for _ in range(df.HostSelector.MAX_FAILURES):
+        room.record_success(URL_A)
+        room.record_disconnect(URL_A, uptime=3600.0, stalled=True)
+    assert room.select() == URL_B
+
+
+def test_stable_link_resets_failures():
+    """连接稳定保持后正常断开，清零连续失败"""
+    room, = _selectors(1)
+    room.select()
+    room.record_disconnect(URL_A, uptime=3.0)
+    room.record_disconnect(URL_A, uptime=df.HostSelector.STABLE_SECONDS + 1)
+    room.record_disconnect(URL_A, uptime=3.0)
+    assert room.select() == URL_A
+
+
+def test_client_records_watchdog_disconnect():
+    """BiliLiveClient 按连接的存活时间和假死标记记到自己直播间的节点统计里"""
+    probe = df.HostProbe()
+    client1 = df.BiliLiveClient(1, df.IRCServer(), probe=probe)
+    client2 = df.BiliLiveClient(2, df.IRCServer(), primary=False, probe=probe)
+    for c in (client1, client2):
+        c.hosts.update(HOST_LIST)
+        c.hosts.select()
+    for _ in range(df.HostSelector.MAX_FAILURES):
+        conn = df.BiliWSConnection(1, 1, "", URL_A)
+        conn.opened_at -= 3600
+        conn.stalled = True
+        client1._record_disconnect(conn)
+    assert client1.hosts.select() == URL_B
+    assert client2.hosts.select() == URL_A
+
+
+if __name__ == '__main__':
+    failed = 0
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            try:
+                func()
+                print(f"✓ {name}")
+            except AssertionError as e:
+                failed += 1
+                print(f"✗ {name}: {e}")
+    sys.exit(1 if failed else 0)